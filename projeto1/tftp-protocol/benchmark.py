@@ -0,0 +1,63 @@
+from tftp.TFTPClient import TFTPClient
+from tftp.TFTPServer import TFTPServer
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+# Combinações de opções (blksize, windowsize) medidas; None mantém o padrão do protocolo.
+OPCOES = [(None, None), (None, 8), (1428, 16), (8192, 16), (65464, 8)]
+
+# Executa o servidor TFTP num processo separado, para que cliente e servidor não
+# disputem o mesmo interpretador. A porta efêmera escolhida é enviada pelo pipe.
+def _servidor(root, conexao):
+    servidor = TFTPServer(root, ip='127.0.0.1', port=0, timeout=1)
+    conexao.send(servidor.port)
+    with contextlib.redirect_stdout(io.StringIO()):
+        servidor.serve()
+
+# Transfere todos os arquivos com transfer_many e retorna (segundos, número de falhas).
+# As mensagens das FSMs do cliente são descartadas para não pesar na medição.
+def _mede(porta, transferencias, blksize, windowsize):
+    client = TFTPClient('127.0.0.1', porta, timeout=1, blksize=blksize, windowsize=windowsize)
+    t1 = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultados = client.transfer_many(transferencias)
+    duracao = time.perf_counter() - t1
+    return duracao, sum(1 for _, sucesso in resultados if not sucesso)
+
+def main():
+    'Mede a vazão do cliente TFTP contra o servidor TFTP deste projeto, em recepção e envio.'
+    n_arquivos = int(sys.argv[1]) if len(sys.argv) >= 2 else 16
+    tamanho = int(sys.argv[2]) if len(sys.argv) >= 3 else 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as root, tempfile.TemporaryDirectory() as local:
+        # Arquivos servidos (recv) e arquivos locais a enviar (send)
+        for i in range(n_arquivos):
+            with open(os.path.join(root, f"rx{i}.bin"), 'wb') as f:
+                f.write(os.urandom(tamanho))
+            with open(os.path.join(local, f"tx{i}.bin"), 'wb') as f:
+                f.write(os.urandom(tamanho))
+
+        pai, filho = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=_servidor, args=(root, filho), daemon=True)
+        proc.start()
+        porta = pai.recv()
+        os.chdir(local)
+
+        total = n_arquivos * tamanho / 1e6
+        print(f"{n_arquivos} arquivos de {tamanho} bytes, concorrentes, servidor em 127.0.0.1:{porta}")
+        print(f"{'blksize':>8} {'window':>7} {'modo':>5} {'tempo (s)':>10} {'MB/s':>8} {'falhas':>7}")
+        for blksize, windowsize in OPCOES:
+            for modo, prefixo in (("recv", "rx"), ("send", "tx")):
+                transferencias = [(modo, f"{prefixo}{i}.bin") for i in range(n_arquivos)]
+                duracao, falhas = _mede(porta, transferencias, blksize, windowsize)
+                print(f"{blksize or 512:>8} {windowsize or 1:>7} {modo:>5} {duracao:>10.3f} {total / duracao:>8.2f} {falhas:>7}")
+        proc.terminate()
+        proc.join()
+
+if __name__ == "__main__":
+    main()
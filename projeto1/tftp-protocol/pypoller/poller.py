@@ -1,8 +1,54 @@
 #!/usr/bin/python3
 
 import selectors
+import heapq
+import itertools
 import time
 
+NS = 1_000_000_000 # nanossegundos em um segundo
+
+class Relogio:
+  '''Classe Relogio: relógio monotônico usado pelo Poller e seus
+  callbacks. Os instantes são inteiros em nanossegundos obtidos de
+  time.monotonic_ns, imunes a ajustes do relógio de parede (ex: NTP)
+  e sem acúmulo de erro de arredondamento.'''
+
+  def agora(self):
+    'Retorna o instante atual, em nanossegundos'
+    return time.monotonic_ns()
+
+  def espera(self, sched, timeout):
+    '''Espera por eventos no seletor sched.
+    timeout: tempo máximo de espera em nanossegundos, ou None para esperar indefinidamente'''
+    if timeout == None: return sched.select(None)
+    return sched.select(timeout / NS)
+
+class RelogioSimulado(Relogio):
+  '''Classe RelogioSimulado: relógio cujo tempo só avança quando
+  solicitado. Permite testar as máquinas de estados (TFTP, ARQ) sob
+  tempo simulado, sem esperas reais: quando nenhum descritor está pronto,
+  o Poller avança o relógio diretamente até o próximo timeout.'''
+
+  def __init__(self, inicio=0):
+    'inicio: instante inicial, em nanossegundos'
+    self._agora = inicio
+
+  def agora(self):
+    return self._agora
+
+  def avanca(self, dt):
+    'Avança o relógio em dt segundos'
+    self._agora += round(dt * NS)
+
+  def espera(self, sched, timeout):
+    if timeout == None: return sched.select(None)
+    eventos = sched.select(0)
+    if not eventos: self._agora += max(0, timeout)
+    return eventos
+
+# relógio usado por callbacks ainda não registrados em um Poller
+RELOGIO = Relogio()
+
 class Callback:
   '''Classe Callback:
         
@@ -23,11 +69,15 @@ class Callback:
       decimal para expressar fração de segundo'''
       if timeout < 0: raise ValueError('timeout negativo')
       self.fd = fileobj
-      self._timeout = timeout
       self.base_timeout = timeout
+      self._relogio = RELOGIO
+      # instante absoluto (ns do relógio monotônico) em que o timeout vence
+      self._deadline = self._relogio.agora() + round(timeout * NS)
+      # incrementado a cada mudança do timer: invalida entradas antigas no heap do Poller
+      self._versao = 0
       self._enabled = True
       self._enabled_to = True
-      self._reloaded = False
+      self._poller = None
 
   def handle(self):
       '''Trata o evento associado a este callback. Tipicamente 
@@ -41,39 +91,49 @@ class Callback:
       pass
 
   def update(self, dt):
-      'Atualiza o tempo restante de timeout'
-      if not self._reloaded: self._timeout = max(0, self._timeout - dt)
-      else: self._reloaded = False
+      '''Mantido por compatibilidade: o timeout é um instante absoluto,
+      então o tempo restante não precisa mais ser atualizado'''
+      pass
+
+  def _agenda(self):
+      'Invalida o agendamento anterior e reagenda o timer no Poller'
+      self._versao += 1
+      if self._poller: self._poller._agenda(self)
 
   def reload_timeout(self):
       'Recarrega o valor de timeout'
-      self._timeout = self.base_timeout
-      self._reloaded = True
+      self._deadline = self._relogio.agora() + round(self.base_timeout * NS)
+      self._agenda()
 
   def disable_timeout(self):
       'Desativa o timeout'
       self._enabled_to = False
+      self._agenda()
 
   def enable_timeout(self):
       'Reativa o timeout'
       self._enabled_to = True
+      self._agenda()
 
   def enable(self):
       'Reativa o monitoramento do descritor neste callback'
       self._enabled = True
+      if self._poller: self._poller._atualiza(self)
 
   def disable(self):
       'Desativa o monitoramento do descritor neste callback'
       self._enabled = False
+      if self._poller: self._poller._atualiza(self)
 
   @property
   def timeout(self):
-    return self._timeout
+    'tempo restante até o timeout, em segundos'
+    return max(0, self._deadline - self._relogio.agora()) / NS
 
   @timeout.setter
   def timeout(self, tout):
-    self._timeout = tout
-    self._reloaded = True
+    self._deadline = self._relogio.agora() + round(tout * NS)
+    self._agenda()
 
   @property
   def timeout_enabled(self):
@@ -89,86 +149,201 @@ class Callback:
       'true se monitoramento do descritor estiver ativado neste callback'
       return self._enabled
   
+class Estatisticas:
+  '''Contadores de despacho do Poller, usados para dimensionar implantações.
+  eventos: quantidade de descritores tratados (handle)
+  timers: quantidade de timeouts disparados (handle_timeout)
+  iteracoes: quantidade de passagens pelo laço de eventos
+  latencia: maior atraso observado, em segundos, entre o vencimento
+  de um timer e seu disparo
+  duracao: tempo total, em segundos, gasto tratando eventos e timers'''
+
+  def __init__(self):
+    self.eventos = 0
+    self.timers = 0
+    self.iteracoes = 0
+    self.latencia = 0.0
+    self.duracao = 0.0
+
+  def acumula(self, outra):
+    'Soma os contadores de outra a estes'
+    self.eventos += outra.eventos
+    self.timers += outra.timers
+    self.iteracoes += outra.iteracoes
+    self.latencia = max(self.latencia, outra.latencia)
+    self.duracao += outra.duracao
+
+  def __repr__(self):
+    return (f'Estatisticas(eventos={self.eventos}, timers={self.timers}, '
+            f'iteracoes={self.iteracoes}, latencia={self.latencia:.6f}, duracao={self.duracao:.6f})')
+
 class Poller:
   '''Classe Poller: um agendador de eventos que monitora objetos
   do tipo arquivo e executa callbacks quando tiverem dados para 
   serem lidos. Callbacks devem ser registrados para que 
   seus fileobj sejam monitorados. Callbacks que não possuem
-  fileobj são tratados como timers'''
+  fileobj são tratados como timers.
+  relogio: fonte de tempo do Poller e de seus callbacks. Por default
+  usa o relógio monotônico do sistema; um RelogioSimulado pode ser
+  fornecido para executar testes sem esperas reais.'''
   
-  def __init__(self):
+  def __init__(self, relogio=None):
+    self.relogio = relogio if relogio != None else RELOGIO
     self.cbs_to = []
     self.cbs = set()
+    # heap de timers: (deadline, ordem, versao, callback). Entradas cuja
+    # versao difere da do callback estão obsoletas e são descartadas ao chegar ao topo
+    self._timers = []
+    self._ordem = itertools.count()
+    # seletor persistente (epoll no Linux): descritores são registrados
+    # somente quando um callback é adicionado, ativado ou desativado
+    self._sched = selectors.DefaultSelector()
+    # contadores acumulados de todas as iterações
+    self.stats = Estatisticas()
 
   def adiciona(self, cb):
     'Registra um callback'
-    if cb.isTimer and not cb in self.cbs_to: self.cbs_to.append(cb)
-    else: self.cbs.add(cb)
+    if cb.isTimer:
+      if cb in self.cbs_to: return
+      self.cbs_to.append(cb)
+    else:
+      self.cbs.add(cb)
+    if cb._relogio is not self.relogio:
+      # preserva o tempo restante ao trocar de relógio
+      restante = cb._deadline - cb._relogio.agora()
+      cb._relogio = self.relogio
+      cb._deadline = self.relogio.agora() + restante
+    cb._poller = self
+    if not cb.isTimer: self._atualiza(cb)
+    self._agenda(cb)
 
-  def _compareTimeout(self, cb, cb_to):
-    if not cb.timeout_enabled: return cb_to
-    if not cb_to:
-        cb_to = cb
-    elif cb_to.timeout > cb.timeout:
-      cb_to = cb
-    return cb_to
+  def remove(self, cb):
+    'Cancela o registro de um callback'
+    if cb.isTimer:
+      if cb in self.cbs_to: self.cbs_to.remove(cb)
+    else:
+      self.cbs.discard(cb)
+      try:
+        if self._sched.get_key(cb.fd).data is cb: self._sched.unregister(cb.fd)
+      except (KeyError, ValueError):
+        pass
+    cb._poller = None
+    cb._versao += 1 # invalida sua entrada no heap de timers
+
+  def _atualiza(self, cb):
+    '''Mantém o registro do descritor de cb no seletor de acordo com
+    seu estado (ativado ou desativado)'''
+    try:
+      registrado = self._sched.get_key(cb.fd).data is cb
+    except KeyError:
+      registrado = False
+    if cb.isEnabled and not registrado:
+      self._sched.register(cb.fd, selectors.EVENT_READ, cb)
+    elif not cb.isEnabled and registrado:
+      self._sched.unregister(cb.fd)
+
+  def _agenda(self, cb):
+    'Insere no heap o deadline atual de cb: O(log n)'
+    if not cb.timeout_enabled: return
+    heapq.heappush(self._timers, (cb._deadline, next(self._ordem), cb._versao, cb))
+    # evita que entradas obsoletas acumulem indefinidamente no heap
+    if len(self._timers) > 4*(len(self.cbs) + len(self.cbs_to)) + 64:
+      self._timers = [e for e in self._timers if e[2] == e[3]._versao and e[3].timeout_enabled]
+      heapq.heapify(self._timers)
 
   def _timeout(self):
-    cb_to = None
-    for cb in self.cbs_to: cb_to = self._compareTimeout(cb, cb_to)
-    for cb in self.cbs:
-      cb_to = self._compareTimeout(cb, cb_to)
-    return cb_to
+    'Retorna o callback com o timeout mais próximo, descartando entradas obsoletas do heap'
+    while self._timers:
+      _, _, versao, cb = self._timers[0]
+      if versao == cb._versao and cb.timeout_enabled: return cb
+      heapq.heappop(self._timers)
+    return None
+
+  def _vencidos(self, agora):
+    '''Remove do heap e retorna os timers vencidos até o instante agora,
+    como pares (callback, versao)'''
+    vencidos = []
+    while True:
+      cb = self._timeout()
+      if cb == None or cb._deadline > agora: break
+      _, _, versao, _ = heapq.heappop(self._timers)
+      vencidos.append((cb, versao))
+    return vencidos
 
-  def despache(self):
+  def despache(self, lote=False):
     '''Espera por eventos indefinidamente, tratando-os com seus
     callbacks. Termina se nenhum evento pude ser gerado pelos callbacks.
     Isso pode ocorrer se todos os callbacks estiverem desativados (monitoramento
-    do descritor e timeout)'''
-    while self.despache_simples():
-      pass
+    do descritor e timeout).
+    lote: se True, usa despache_lote em vez de despache_simples'''
+    if lote:
+      while self.despache_lote() != None:
+        pass
+    else:
+      while self.despache_simples():
+        pass
 
   def _get_events(self, timeout):
-    sched = selectors.SelectSelector()
-    active = False
-    for cb in self.cbs:
-      if cb.isEnabled:
-        sched.register(cb.fd, selectors.EVENT_READ, cb)
-        active = True
+    'timeout: tempo máximo de espera, em nanossegundos'
+    active = len(self._sched.get_map()) > 0
     if not active and timeout == None:
       return None
-    eventos = sched.select(timeout)
+    eventos = self.relogio.espera(self._sched, timeout)
     return eventos
 
+  def _tempo_espera(self, cb_to):
+    'Tempo até o timeout de cb_to, em nanossegundos (None se não houver timer ativo)'
+    if cb_to == None: return None
+    return max(0, cb_to._deadline - self.relogio.agora())
+
   def despache_simples(self):
     '''Espera por um único evento, tratando-o com seu callback. Retorna True se 
        tratou um evento, e False se nenhum evento foi gerado porque os callbacks
        estão desativados.'''
-    t1 = time.time()
     cb_to = self._timeout()
-    if cb_to != None:
-        tout = cb_to.timeout
-    else:
-        tout = None
-    eventos = self._get_events(tout)
+    eventos = self._get_events(self._tempo_espera(cb_to))
     if eventos == None: # fim: nada a fazer !!
       return False
-    fired = set()
+    self.stats.iteracoes += 1
     if not eventos: # timeout !
       if cb_to != None:
-          fired.add(cb_to)
           cb_to.handle_timeout()
           cb_to.reload_timeout()
+          self.stats.timers += 1
     else:
       for key,mask in eventos:
         cb = key.data # este é o callback !
-        fired.add(cb)
         cb.handle()
         cb.reload_timeout()
-    dt = time.time() - t1
-    for cb in self.cbs_to:
-      if not cb in fired: cb.update(dt)
-    for cb in self.cbs:
-      if not cb in fired: cb.update(dt)
+      self.stats.eventos += len(eventos)
     return True
 
+  def despache_lote(self):
+    '''Espera por eventos e trata, numa única passagem, todos os descritores
+       prontos e todos os timers vencidos. Retorna um objeto Estatisticas com os
+       contadores desta passagem, ou None se nenhum evento foi gerado porque os
+       callbacks estão desativados.'''
+    cb_to = self._timeout()
+    eventos = self._get_events(self._tempo_espera(cb_to))
+    if eventos == None: # fim: nada a fazer !!
+      return None
+    st = Estatisticas()
+    st.iteracoes = 1
+    t1 = self.relogio.agora()
+    for key,mask in eventos:
+      cb = key.data
+      cb.handle()
+      cb.reload_timeout()
+      st.eventos += 1
+    agora = self.relogio.agora()
+    for cb, versao in self._vencidos(agora):
+      # o timer pode ter sido recarregado ou desativado por um callback anterior
+      if versao != cb._versao or not cb.timeout_enabled: continue
+      st.latencia = max(st.latencia, (agora - cb._deadline) / NS)
+      cb.handle_timeout()
+      cb.reload_timeout()
+      st.timers += 1
+    st.duracao = (self.relogio.agora() - t1) / NS
+    self.stats.acumula(st)
+    return st
+
@@ -0,0 +1,28 @@
+from tftp.TFTPServer import TFTPServer
+import sys
+
+def main():
+    'Responsável por iniciar o servidor TFTP com o diretório e a porta informados.'
+    if len(sys.argv) < 2:
+        print(f"Uso: python3 {sys.argv[0]} <pasta_contendo_os_arquivos> [porta]")
+        sys.exit(1)
+
+    # Lê os parâmetros da linha de comando
+    root = sys.argv[1]
+    porta = int(sys.argv[2]) if len(sys.argv) >= 3 else 69
+
+    # Cria o servidor e atende pedidos até ser interrompido
+    try:
+        servidor = TFTPServer(root, port=porta, verbose=True)
+    except (ValueError, OSError) as e:
+        print("Erro ao iniciar o servidor:", e)
+        sys.exit(1)
+    try:
+        servidor.serve()
+    except KeyboardInterrupt:
+        print(f"\nServidor: {servidor.concluidas} transferências concluídas, {servidor.falhas} abortadas.")
+    finally:
+        servidor.close()
+
+if __name__ == "__main__":
+    main()
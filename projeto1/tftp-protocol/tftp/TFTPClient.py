@@ -1,4 +1,5 @@
 import socket
+from collections import deque
 from tftp.TFTPFsmRx import FEMRecepcao as TFTPFsmRx
 from tftp.TFTPFsmTx import FEMTransmissao as TFTPFsmTx
 from pypoller import poller
@@ -9,10 +10,14 @@ class TFTPClient:
     # O timeout é o tempo máximo de espera para receber uma resposta do servidor.
     # O socket UDP é criado e configurado com o timeout especificado.
     # O socket é usado para enviar e receber pacotes TFTP.
-    def __init__(self, server_ip, server_port, timeout=5):
+    # O blksize, se informado, é o tamanho de bloco negociado com o servidor (RFC 2348).
+    # O windowsize, se informado, é a janela de blocos negociada com o servidor (RFC 7440).
+    def __init__(self, server_ip, server_port, timeout=5, blksize=None, windowsize=None):
         self.server_ip = server_ip
         self.server_port = server_port
         self.timeout = timeout
+        self.blksize = blksize
+        self.windowsize = windowsize
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.settimeout(self.timeout)
 
@@ -26,7 +31,7 @@ class TFTPClient:
     def send_file(self, filename):
         print("Cliente: Enviando arquivo com FSM...")
         sched = poller.Poller()
-        fsmTx = TFTPFsmTx(self, filename, timeout=self.timeout)
+        fsmTx = TFTPFsmTx(self, filename, timeout=self.timeout, blksize=self.blksize, windowsize=self.windowsize)
         sched.adiciona(fsmTx)
         sched.despache()
 
@@ -42,11 +47,72 @@ class TFTPClient:
     def receive_file(self, filename):
         print("Cliente: Recebendo arquivo com FSM...")
         sched = poller.Poller()
-        fsmRx = TFTPFsmRx(self, filename, timeout=self.timeout)
+        fsmRx = TFTPFsmRx(self, filename, timeout=self.timeout, blksize=self.blksize, windowsize=self.windowsize)
         sched.adiciona(fsmRx)
         sched.despache()
 
+    # Transfere vários arquivos concorrentemente usando um único agendador (Poller).
+    # Recebe uma lista de pares (modo, arquivo), onde modo é "send" ou "recv".
+    # Cada transferência usa seu próprio socket, ou seja, um TID por sessão, de forma
+    # que as FSMs não disputam o socket do cliente.
+    # No máximo max_sessoes transferências ficam ativas ao mesmo tempo: as demais
+    # aguardam numa fila e são iniciadas à medida que as anteriores terminam.
+    # Uma sessão cujo servidor não responde é abortada pela própria FSM depois de
+    # algumas retransmissões sem resposta, e aparece no resultado como falha.
+    # Retorna uma lista, na mesma ordem das transferências, com pares (arquivo, sucesso).
+    def transfer_many(self, transferencias, max_sessoes=64):
+        sched = poller.Poller()
+        pendentes = deque(enumerate(transferencias))
+        ativas = {}
+        resultados = [None] * len(transferencias)
+
+        while pendentes or ativas:
+            # Inicia novas sessões até atingir o limite de concorrência.
+            while pendentes and len(ativas) < max_sessoes:
+                i, (modo, filename) = pendentes.popleft()
+                try:
+                    ativas[sessao(sched, self.server_ip, self.server_port, modo, filename, self.timeout, self.blksize, self.windowsize)] = i
+                except Exception as e:
+                    print(f"Cliente: Erro ao iniciar transferência de {filename}: {e}")
+                    resultados[i] = (filename, False)
+
+            if ativas and sched.despache_lote() == None:
+                break
+
+            # Recolhe as sessões concluídas, liberando seus sockets.
+            for fsm in [fsm for fsm in ativas if fsm.terminado]:
+                i = ativas.pop(fsm)
+                resultados[i] = (fsm.filename, fsm.state.name == "FIM")
+                sched.remove(fsm)
+                fsm.client.close()
+
+        for fsm, i in ativas.items():
+            resultados[i] = (fsm.filename, False)
+            fsm.client.close()
+        return resultados
+
     # Fecha o socket UDP usado pelo cliente TFTP.
     # Libera os recursos do sistema associados ao socket.
     def close(self):
-        self.sock.close()
\ No newline at end of file
+        self.sock.close()
+
+# Fábrica de sessões para o pypoller.shards.PollerShards: executada no processo
+# trabalhador, cria um cliente com socket próprio (um TID por sessão) e registra
+# a FSM de transmissão ("send") ou de recepção ("recv") no poller do shard.
+# Exemplo: shards.submete(sessao, ip, 69, "recv", "imagem.bin", chave="imagem.bin")
+# Se a FSM não puder ser criada (ex: modo inválido ou arquivo inexistente), o socket
+# do cliente é fechado antes de a exceção ser repassada.
+def sessao(sched, server_ip, server_port, modo, filename, timeout=5, blksize=None, windowsize=None):
+    client = TFTPClient(server_ip, server_port, timeout, blksize, windowsize)
+    try:
+        if modo == "send":
+            fsm = TFTPFsmTx(client, filename, timeout=timeout, blksize=blksize, windowsize=windowsize)
+        elif modo == "recv":
+            fsm = TFTPFsmRx(client, filename, timeout=timeout, blksize=blksize, windowsize=windowsize)
+        else:
+            raise ValueError("modo deve ser 'send' ou 'recv'.")
+    except BaseException:
+        client.close()
+        raise
+    sched.adiciona(fsm)
+    return fsm
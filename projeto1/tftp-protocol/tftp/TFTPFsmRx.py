@@ -1,7 +1,14 @@
 from enum import Enum, auto
-from tftp.TFTPPacket import RRQPacket, DataPacket, AckPacket, ErrorPacket, TFTPPacket
+from tftp.TFTPPacket import RRQPacket, DataPacket, AckPacket, ErrorPacket, OACKPacket, TFTPPacket
+from tftp.TFTPPacket import BLKSIZE_PADRAO, BLKSIZE_MIN, BLKSIZE_MAX
+from tftp.TFTPPacket import WINDOWSIZE_PADRAO, WINDOWSIZE_MIN, WINDOWSIZE_MAX, negocia_opcoes
+from tftp.TFTPBuffer import AnelRecepcao, FilaEnvio, nao_bloqueante, ajusta_recepcao
 from pypoller import poller
 
+# Tamanho padrão do buffer de escrita (write-behind) do arquivo recebido.
+# Os blocos recebidos são acumulados em memória e gravados no disco em escritas grandes.
+BUFFER_ESCRITA = 64 * 1024
+
 # Declarando os estados da FSM (Finite State Machine)
 # para a recepção de arquivos TFTP
 # Os estados são: INIT (inicialização), RX (recepção de dados),
@@ -20,11 +27,24 @@ class State(Enum):
 # da recepção, lidando com estados como inicialização, recepção de dados,
 # finalização e erro. A classe também implementa o tratamento de timeouts
 # para garantir que a recepção não fique pendente indefinidamente.
+# Se blksize for informado, o RRQ solicita esse tamanho de bloco (RFC 2348);
+# o tamanho efetivo é o confirmado pelo servidor no OACK, ou 512 se ele ignorar a opção.
+# Se windowsize for informado, o RRQ também solicita uma janela (RFC 7440): o ACK é
+# enviado somente ao final de cada janela de blocos ou ao detectar uma lacuna.
+# Se o servidor recusar a opção, a recepção segue em stop-and-wait (janela de 1 bloco).
+# O arquivo é aberto uma única vez, no primeiro bloco, e fechado em FIM ou ERRO;
+# buffer_escrita define quantos bytes são acumulados antes de cada escrita no disco.
+# A cada evento, todos os datagramas disponíveis no socket são lidos para um anel de buffers
+# reutilizáveis, e os ACKs gerados são enviados juntos ao final do tratamento.
 class FEMRecepcao(poller.Callback):
-    def __init__(self, client, filename=None, timeout=5):
+    def __init__(self, client, filename=None, timeout=5, blksize=None, windowsize=None, buffer_escrita=BUFFER_ESCRITA):
         # Verifica o fornecimento do nome do arquivo
         if not filename:
             raise ValueError("O nome do arquivo deve ser fornecido.")
+        if blksize is not None and not BLKSIZE_MIN <= blksize <= BLKSIZE_MAX:
+            raise ValueError(f"blksize deve estar entre {BLKSIZE_MIN} e {BLKSIZE_MAX}.")
+        if windowsize is not None and not WINDOWSIZE_MIN <= windowsize <= WINDOWSIZE_MAX:
+            raise ValueError(f"windowsize deve estar entre {WINDOWSIZE_MIN} e {WINDOWSIZE_MAX}.")
 
         # Verifica se o cliente é uma instância de TFTPClient e seta as demais variáveis
         # para a máquina de estados trabalhar corretamente ao ser construída.
@@ -35,6 +55,20 @@ class FEMRecepcao(poller.Callback):
         self.block_number = 1
         self.terminado = False
         self.remote_tid = None
+        self.arquivo = None
+        self.buffer_escrita = buffer_escrita
+        self.blksize_pedido = blksize
+        self.blksize = BLKSIZE_PADRAO
+        self.windowsize_pedido = windowsize
+        self.windowsize = WINDOWSIZE_PADRAO
+        self.na_janela = 0  # blocos recebidos desde o último ACK enviado
+        self.lacuna_avisada = False  # se já foi enviado ACK para a lacuna atual
+        self.acks_timeout = 0  # ACKs reenviados por timeout desde o último bloco recebido
+        # O buffer de recepção deve comportar o maior bloco que o servidor pode enviar:
+        # o tamanho pedido, ou 512 se o servidor ignorar a opção.
+        self.tam_buffer = max(blksize or BLKSIZE_PADRAO, BLKSIZE_PADRAO) + 4
+        self.anel = AnelRecepcao(self.tam_buffer)
+        self.fila = FilaEnvio(nao_bloqueante(client.sock))
         self._enviar_rrq()
 
     # Método para enviar o pacote RRQ (Read Request)
@@ -43,12 +77,22 @@ class FEMRecepcao(poller.Callback):
     # O pacote RRQ é usado para solicitar a leitura de um arquivo do servidor.
     # O pacote contém o nome do arquivo e o modo de transferência ("octet").
     # O pacote é enviado via socket UDP para o servidor TFTP.
+    # As opções solicitadas (blksize e windowsize) são incluídas no pacote.
     # Após o envio, uma mensagem é impressa no console indicando que o RRQ foi enviado.
     def _enviar_rrq(self):
-        pkt = RRQPacket(self.filename)
+        pkt = RRQPacket(self.filename, options=self._opcoes())
         self.client.sock.sendto(pkt.to_bytes(), (self.client.server_ip, self.client.server_port))
         print(f"FEM: RRQ enviado para {self.client.server_ip}:{self.client.server_port}")
 
+    # Retorna as opções (RFC 2347) a serem solicitadas ao servidor.
+    def _opcoes(self):
+        options = {}
+        if self.blksize_pedido:
+            options['blksize'] = self.blksize_pedido
+        if self.windowsize_pedido:
+            options['windowsize'] = self.windowsize_pedido
+        return options
+
     # Método chamado quando a máquina de estados é ativada.
     # Ele registra o callback para receber dados do socket e inicia o processo de recepção.
     def handle(self):
@@ -59,31 +103,38 @@ class FEMRecepcao(poller.Callback):
         if self.fd is None:
             return
 
-        # Tenta receber dados do socket.
-        # Se receber dados, cria um pacote TFTPPacket a partir dos bytes recebidos, 
+        # Lê todos os datagramas disponíveis no socket.
+        # Para cada um, cria um pacote TFTPPacket a partir dos bytes recebidos, 
         # armazena o pacote e o endereço remoto e chama o método mef() para processar o pacote recebido.
-        
+        # Os ACKs gerados ficam na fila de envio e são enviados de uma vez no final.
         try:
-            data, addr = self.fd.recvfrom(516)
-            try:
-                packet = TFTPPacket.from_bytes(data)
-            # Se ocorrer um erro de parsing, imprime uma mensagem de erro e entra no estado de erro.
-            except ValueError as e:
-                print(f"FEM: Erro de parsing: {e}")
-                self._erro()
-                return
+            for data, addr in self.anel.drena(self.fd):
+                try:
+                    packet = TFTPPacket.from_bytes(data)
+                # Se ocorrer um erro de parsing, imprime uma mensagem de erro e entra no estado de erro.
+                # Os ACKs já gerados nesta drenagem são enviados antes.
+                except ValueError as e:
+                    print(f"FEM: Erro de parsing: {e}")
+                    self.fila.descarrega()
+                    self._erro()
+                    return
 
-            self.recebido = (packet, addr)
-            self.mef()
+                self.recebido = (packet, addr)
+                self.mef()
+                if self.terminado:
+                    break
+            self.fila.descarrega()
 
         # Se ocorrer qualquer outra exceção, imprime uma mensagem de erro e entra no estado de erro.
         except Exception as e:
             print(f"FEM: Erro no handle(): {e}")
             self._erro()
 
-        # Se a transferência estiver concluída, desativa a máquina de estados e o timeout
+        # Se a transferência estiver concluída, grava o restante do buffer no arquivo,
+        # desativa a máquina de estados e o timeout
         if self.terminado:
             print("FEM: Transferência concluída.")
+            self._fechar_arquivo()
             self.disable()
             self.disable_timeout()
 
@@ -104,8 +155,24 @@ class FEMRecepcao(poller.Callback):
     # com o número de bloco correto. Se o pacote recebido não for do tipo DataPacket
     # ou se o número do bloco não corresponder ao esperado, imprime uma mensagem de erro
     # e não faz nada. 
+    # Se o servidor responder com um OACK, adota o tamanho de bloco e a janela negociados
+    # e confirma as opções com um ACK do bloco 0 (RFC 2347).
     def handle_init(self):
         packet, addr = self.recebido
+        if isinstance(packet, OACKPacket):
+            efetivas = negocia_opcoes(self._opcoes(), packet.options)
+            if efetivas is None:
+                print(f"FEM[INIT]: OACK inválido: {packet.options}")
+                self._erro()
+                return
+            self.remote_tid = addr
+            self.blksize = efetivas['blksize']
+            self.windowsize = efetivas['windowsize']
+            print(f"FEM[INIT]: OACK recebido, blksize={self.blksize}, windowsize={self.windowsize}")
+            # O buffer de recepção do socket deve comportar uma janela inteira de blocos.
+            ajusta_recepcao(self.fd, 2 * self.windowsize * (self.blksize + 4))
+            self._enviar_ack(0)
+            return
         if isinstance(packet, DataPacket):
             if packet.block_number != self.block_number:
                 print(f"FEM[INIT]: Bloco inesperado: esperado {self.block_number}, recebido {packet.block_number}")
@@ -114,11 +181,11 @@ class FEMRecepcao(poller.Callback):
             # envia um ACK para o servidor e verifica se é o último bloco de dados.
             self.remote_tid = addr
             self._gravar_bloco(packet.data)
-            self._enviar_ack(packet.block_number)
+            self._confirmar_bloco(packet.block_number, len(packet.data) < self.blksize)
             # Se for o último bloco, muda o estado para FIM e marca a transferência como terminada.
             # Se não, incrementa o número do bloco e muda o estado para RX
             # para continuar recebendo dados.
-            if len(packet.data) < 512:
+            if len(packet.data) < self.blksize:
                 print("FEM[INIT]: Último bloco. Indo para FIM.")
                 self.state = State.FIM
                 self.terminado = True
@@ -139,16 +206,22 @@ class FEMRecepcao(poller.Callback):
             self._erro()
             return
         if isinstance(packet, DataPacket):
-            if packet.block_number != self.block_number:
+            if packet.block_number != self.block_number & 0xFFFF:
                 print(f"FEM[RX]: Bloco inesperado: esperado {self.block_number}, recebido {packet.block_number}")
+                # Com janela, uma lacuna é sinalizada confirmando o último bloco recebido em ordem,
+                # para que o servidor retransmita a partir dele (RFC 7440). Um só ACK por lacuna.
+                if self.windowsize > 1 and not self.lacuna_avisada:
+                    self._enviar_ack(self.block_number - 1)
+                    self.na_janela = 0
+                    self.lacuna_avisada = True
                 return
             # Se o pacote for válido, grava os dados no arquivo,
             # envia um ACK para o servidor e verifica se é o último bloco de dados.
             # Se for o último bloco, muda o estado para FIM e marca a transferência como terminada.
             # Se não for o último bloco, incrementa o número do bloco e continua recebendo dados.
             self._gravar_bloco(packet.data)
-            self._enviar_ack(packet.block_number)
-            if len(packet.data) < 512:
+            self._confirmar_bloco(packet.block_number, len(packet.data) < self.blksize)
+            if len(packet.data) < self.blksize:
                 print("FEM[RX]: Último bloco. Indo para FIM.")
                 self.state = State.FIM
                 self.terminado = True
@@ -163,22 +236,40 @@ class FEMRecepcao(poller.Callback):
     def handle_erro(self):
         print("FEM[ERRO]: Transferência abortada por erro.")
 
+    # Método para confirmar um bloco recebido em ordem.
+    # Em stop-and-wait todo bloco é confirmado. Com janela (RFC 7440), o ACK é enviado
+    # somente quando a janela se completa ou quando o bloco é o último da transferência.
+    def _confirmar_bloco(self, bloco, ultimo):
+        self.lacuna_avisada = False
+        self.acks_timeout = 0
+        self.na_janela += 1
+        if ultimo or self.na_janela >= self.windowsize:
+            self._enviar_ack(bloco)
+            self.na_janela = 0
+
     # Método para enviar um ACK (Acknowledgment) para o servidor TFTP.
     # O ACK confirma o recebimento de um bloco de dados.
     # Ele cria um pacote ACK com o número do bloco recebido e o envia para o endereço remoto.
+    # O número do bloco é reduzido a 16 bits, pois pode ultrapassar 65535 em arquivos grandes.
     def _enviar_ack(self, bloco):
-        pkt = AckPacket(bloco)
-        self.client.sock.sendto(pkt.to_bytes(), self.remote_tid)
+        pkt = AckPacket(bloco & 0xFFFF)
+        self.fila.enfileira(pkt.to_bytes(), self.remote_tid)
         print(f"FEM: ACK {bloco} enviado para {self.remote_tid}")
 
     # Método para gravar um bloco de dados no arquivo.
-    # Se for o primeiro bloco, abre o arquivo em modo de escrita (wb),
-    # caso contrário, abre em modo de anexação (ab).
-    # Os dados são gravados no arquivo, e o arquivo é fechado após a gravação
+    # No primeiro bloco, abre o arquivo em modo de escrita (wb) com um buffer de
+    # buffer_escrita bytes, e o mantém aberto durante toda a sessão.
+    # Os dados são acumulados no buffer e gravados no disco em escritas grandes.
     def _gravar_bloco(self, dados):
-        modo = 'ab' if self.block_number > 1 else 'wb'
-        with open(self.filename, modo) as f:
-            f.write(dados)
+        if self.arquivo is None:
+            self.arquivo = open(self.filename, 'wb', buffering=self.buffer_escrita)
+        self.arquivo.write(dados)
+
+    # Método para fechar o arquivo recebido, gravando no disco o que restar no buffer.
+    def _fechar_arquivo(self):
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
 
     # Método para entrar no estado de erro.
     # Ele imprime uma mensagem de erro, muda o estado para ERRO,
@@ -188,6 +279,7 @@ class FEMRecepcao(poller.Callback):
         print("FEM: Entrando no estado de erro.")
         self.state = State.ERRO
         self.terminado = True
+        self._fechar_arquivo()
         self.disable()
         self.disable_timeout()
 
@@ -196,6 +288,18 @@ class FEMRecepcao(poller.Callback):
     # para entrar no estado de erro.
     # O timeout é usado para evitar que a recepção fique em loop quando há um mau comportamente.
     # Se um timeout ocorrer, a máquina de estados entra no estado de erro.
+    # Com janela, antes de desistir o último bloco recebido em ordem é confirmado novamente
+    # (até 3 vezes), pois a perda do final de uma janela deixaria o servidor esperando o ACK.
+    # Da mesma forma, depois de um OACK (remote_tid já definido em INIT) o ACK 0 é reenviado,
+    # pois ele ou a primeira janela podem ter se perdido (RFC 2347 e RFC 7440).
     def handle_timeout(self):
         print("FEM: Timeout detectado.")
+        reconfirma = (self.windowsize > 1 and self.state == State.RX) or \
+            (self.state == State.INIT and self.remote_tid is not None)
+        if reconfirma and self.acks_timeout < 3:
+            self.acks_timeout += 1
+            self.na_janela = 0
+            self._enviar_ack(self.block_number - 1)
+            self.fila.descarrega()
+            return
         self._erro()
@@ -1,8 +1,21 @@
 from enum import Enum, auto
-from tftp.TFTPPacket import WRQPacket, DataPacket, AckPacket, ErrorPacket, TFTPPacket
+from tftp.TFTPPacket import WRQPacket, DataPacket, AckPacket, ErrorPacket, OACKPacket, TFTPPacket
+from tftp.TFTPPacket import BLKSIZE_PADRAO, BLKSIZE_MIN, BLKSIZE_MAX
+from tftp.TFTPPacket import WINDOWSIZE_PADRAO, WINDOWSIZE_MIN, WINDOWSIZE_MAX, negocia_opcoes
+from tftp.TFTPBuffer import AnelRecepcao, FilaEnvio, nao_bloqueante
 from pypoller import poller
 import os
 
+# Número de ACKs duplicados (que repetem a confirmação do bloco anterior à janela) que indica
+# a perda de um bloco e provoca a retransmissão antecipada, sem esperar o timeout.
+# Um único ACK duplicado é esperado quando o receptor recebe um bloco retransmitido em dobro,
+# e responder a ele com um novo envio é o que causa o bug do Aprendiz de Feiticeiro; como
+# cada retransmissão redundante gera no máximo um ACK duplicado, o limiar 2 não a realimenta.
+LIMIAR_ACKS_DUPLICADOS = 2
+
+# Timeouts consecutivos, sem nenhuma confirmação nova, antes de abortar a transmissão.
+TENTATIVAS = 5
+
 # Define os estados da máquina de estados finita (FSM) para a transmissão de arquivos TFTP.
 # Os estados são: INIT (inicialização), TX (transmissão de dados),
 # ULTIMA (último bloco de dados), FIM (finalização) e ERRO (erro de transmissão).
@@ -18,10 +31,30 @@ class EstadoTx(Enum):
 # para lidar com eventos de transmissão e timeouts.
 # Ela gerencia o envio de pacotes WRQ, DATA e ACK, controla o estado da transmissão
 # e lida com erros.
+# Se blksize for informado, o WRQ solicita esse tamanho de bloco (RFC 2348);
+# o tamanho efetivo é o confirmado pelo servidor no OACK, ou 512 se ele ignorar a opção.
+# Se windowsize for informado, o WRQ também solicita uma janela (RFC 7440): até windowsize
+# blocos são enviados antes de aguardar um ACK, que confirma cumulativamente a janela.
+# Se o servidor recusar a opção, a transmissão segue em stop-and-wait (janela de 1 bloco).
+# O arquivo é aberto uma única vez, no primeiro bloco, e fechado em FIM ou ERRO.
+# A cada evento, todos os datagramas disponíveis no socket são lidos para um anel de buffers
+# reutilizáveis, e os blocos DATA gerados são enviados em rajada ao final do tratamento.
+# ACKs duplicados nunca provocam um envio por si só (bug do Aprendiz de Feiticeiro, RFC 1123):
+# só LIMIAR_ACKS_DUPLICADOS deles provocam uma retransmissão antecipada, e um ACK atrasado que
+# pede blocos já retransmitidos não os retransmite de novo. Os envios evitados são contados
+# em suprimidos e as retransmissões antecipadas em retransmissoes_rapidas.
+# Após tentativas timeouts seguidos sem confirmação nova (WRQ ou DATA perdidos, ou servidor
+# fora do ar), a transmissão é abortada no estado ERRO.
 class FEMTransmissao(poller.Callback):
-    def __init__(self, client, filename=None, timeout=5):
+    def __init__(self, client, filename=None, timeout=5, blksize=None, windowsize=None, tentativas=TENTATIVAS):
         if not filename:
             raise ValueError("O nome do arquivo deve ser fornecido.")
+        if not os.path.isfile(filename):
+            raise FileNotFoundError(f"Arquivo não encontrado: {filename}")
+        if blksize is not None and not BLKSIZE_MIN <= blksize <= BLKSIZE_MAX:
+            raise ValueError(f"blksize deve estar entre {BLKSIZE_MIN} e {BLKSIZE_MAX}.")
+        if windowsize is not None and not WINDOWSIZE_MIN <= windowsize <= WINDOWSIZE_MAX:
+            raise ValueError(f"windowsize deve estar entre {WINDOWSIZE_MIN} e {WINDOWSIZE_MAX}.")
 
         # Verifica se o cliente é uma instância de TFTPClient e seta as demais variáveis
         # para a máquina de estados trabalhar corretamente ao ser construída.
@@ -29,10 +62,25 @@ class FEMTransmissao(poller.Callback):
         self.client = client
         self.filename = filename
         self.state = EstadoTx.INIT
-        self.block_number = 0
+        self.block_number = 0  # último bloco enviado
+        self.base = 1  # bloco mais antigo ainda não confirmado
+        self.reenviado_ate = 0  # último bloco enviado na retransmissão mais recente
+        self.acks_duplicados = 0  # ACKs duplicados desde o último avanço da janela
+        self.suprimidos = 0  # envios de DATA evitados por ACKs duplicados ou atrasados
+        self.retransmissoes_rapidas = 0  # retransmissões provocadas por ACKs duplicados
+        self.tentativas = tentativas
+        self.timeouts = 0  # timeouts consecutivos desde a última confirmação nova
         self.terminado = False
         self.last_packet_sent = None
         self.ultima_msg = False
+        self.arquivo = None
+        self.pos_arquivo = 0  # posição atual de leitura, para evitar seek em blocos sequenciais
+        self.blksize_pedido = blksize
+        self.blksize = BLKSIZE_PADRAO
+        self.windowsize_pedido = windowsize
+        self.windowsize = WINDOWSIZE_PADRAO
+        self.anel = AnelRecepcao(516)
+        self.fila = FilaEnvio(nao_bloqueante(client.sock))
 
         self._enviar_wrq()
 
@@ -43,12 +91,22 @@ class FEMTransmissao(poller.Callback):
     # O pacote contém o nome do arquivo e o modo de transferência ("octet").
     # O opcode para WRQ é 2.
     # O pacote é enviado via socket UDP para o servidor TFTP.
+    # As opções solicitadas (blksize e windowsize) são incluídas no pacote.
     # Após o envio, uma mensagem é impressa no console indicando que o WRQ foi enviado.
     def _enviar_wrq(self):
-        pkt = WRQPacket(self.filename)
+        pkt = WRQPacket(self.filename, options=self._opcoes())
         self.client.sock.sendto(pkt.to_bytes(), (self.client.server_ip, self.client.server_port))
         print(f"FEM: WRQ enviado para {self.client.server_ip}:{self.client.server_port}")
 
+    # Retorna as opções (RFC 2347) a serem solicitadas ao servidor.
+    def _opcoes(self):
+        options = {}
+        if self.blksize_pedido:
+            options['blksize'] = self.blksize_pedido
+        if self.windowsize_pedido:
+            options['windowsize'] = self.windowsize_pedido
+        return options
+
     # Método chamado quando a máquina de estados é ativada.
     # Ele registra o callback para receber dados do socket e inicia o processo de transmissão.
     # Se a transmissão já estiver terminada, desativa a máquina de estados e o timeout.
@@ -63,28 +121,38 @@ class FEMTransmissao(poller.Callback):
             return
 
         try:
-            data, addr = self.fd.recvfrom(516)
-            # print(f"FEM: Pacote bruto recebido de {addr}: {data[:10]}... len={len(data)}")
-            try:
-                packet = TFTPPacket.from_bytes(data)
-                # print(f"FEM: Pacote interpretado: {type(packet).__name__}")
-
-            except ValueError as e:
-                print(f"FEM: Erro de parsing: {e}")
-                self.state = EstadoTx.ERRO
-                self.terminado = True
-                return
+            for data, addr in self.anel.drena(self.fd):
+                # print(f"FEM: Pacote bruto recebido de {addr}: {bytes(data[:10])}... len={len(data)}")
+                try:
+                    packet = TFTPPacket.from_bytes(data)
+                    # print(f"FEM: Pacote interpretado: {type(packet).__name__}")
 
-            self.recebido = (packet, addr)
-            self.mef()
+                except ValueError as e:
+                    print(f"FEM: Erro de parsing: {e}")
+                    self.state = EstadoTx.ERRO
+                    self.terminado = True
+                    break
+
+                self.recebido = (packet, addr)
+                self.mef()
+                if self.terminado:
+                    break
+            self.fila.descarrega()
 
         except Exception as e:
             print(f"FEM: Erro no handle(): {e}")
             self.state = EstadoTx.ERRO
             self.terminado = True
 
+        # mef() não chega a ser chamado nos estados FIM e ERRO: o resultado, com os
+        # contadores de envios suprimidos, é informado aqui, ao terminar.
         if self.terminado:
             print("FEM: Transmissão encerrada.")
+            if self.state == EstadoTx.FIM:
+                self.handle_fim()
+            else:
+                self.handle_erro()
+            self._fechar_arquivo()
             self.disable()
             self.disable_timeout()
 
@@ -106,12 +174,27 @@ class FEMTransmissao(poller.Callback):
     # O método handle_init() lida com o estado de inicialização, esperando receber o
     # primeiro ACK do servidor após enviar o WRQ. Se receber um ACK com o número de bloco 0,
     # inicia a transmissão do primeiro bloco de dados. Se receber um pacote de erro, entra no estado de erro.
+    # Se receber um OACK, adota o tamanho de bloco e a janela negociados e também inicia
+    # a transmissão, pois o OACK faz o papel do ACK do bloco 0 (RFC 2347).
     def handle_init(self):
         packet, addr = self.recebido
         if isinstance(packet, AckPacket) and packet.block_number == 0:
             self.remote_tid = addr
-            self.block_number = 1
-            self._enviar_data()
+            self.timeouts = 0
+            self._enviar_janela()
+        elif isinstance(packet, OACKPacket):
+            efetivas = negocia_opcoes(self._opcoes(), packet.options)
+            if efetivas is None:
+                print(f"FEM[INIT]: OACK inválido: {packet.options}")
+                self.state = EstadoTx.ERRO
+                self.terminado = True
+                return
+            self.blksize = efetivas['blksize']
+            self.windowsize = efetivas['windowsize']
+            print(f"FEM[INIT]: OACK recebido, blksize={self.blksize}, windowsize={self.windowsize}")
+            self.remote_tid = addr
+            self.timeouts = 0
+            self._enviar_janela()
         elif isinstance(packet, ErrorPacket):
             print(f"FEM[INIT]: Erro recebido: {packet.error_msg}")
             self.state = EstadoTx.ERRO
@@ -121,19 +204,45 @@ class FEMTransmissao(poller.Callback):
 
     # O método handle_tx() lida com o estado de transmissão, esperando receber ACKs 
     # dos blocos de dados enviados.
-    # Se receber um ACK com o número de bloco correto, envia o próximo bloco de dados.
+    # Um ACK confirma cumulativamente todos os blocos da janela até o número informado.
+    # Se receber um ACK de um bloco enviado, avança a janela e envia os próximos blocos.
+    # Se o ACK confirmar só parte da janela, o receptor detectou uma lacuna: a transmissão
+    # recomeça a partir do bloco seguinte ao confirmado (RFC 7440), a não ser que esses blocos
+    # já tenham sido retransmitidos; nesse caso o ACK é só um aviso atrasado da mesma perda.
+    # Um ACK duplicado do bloco anterior à janela não é respondido; a cada LIMIAR_ACKS_DUPLICADOS
+    # deles, a janela é retransmitida sem esperar o timeout, que o poller recarrega a cada pacote
+    # recebido e, portanto, não vence enquanto o receptor repetir o ACK.
     # Se receber um ACK para o último bloco, muda o estado para ULTIMA e chama o método mef() 
     # para processar o estado final.
     # Se receber um pacote de erro, entra no estado de erro e seta a transmissão como terminada.
     def handle_tx(self):
         packet, _ = self.recebido
-        if isinstance(packet, AckPacket) and packet.block_number == self.block_number:
-            if self.ultima_msg:
+        confirmado = self._bloco_confirmado(packet) if isinstance(packet, AckPacket) else None
+        if confirmado is not None:
+            self.base = confirmado + 1
+            self.acks_duplicados = 0
+            self.timeouts = 0
+            if self.ultima_msg and confirmado == self.block_number:
                 self.state = EstadoTx.ULTIMA
                 self.mef()
+            elif confirmado < self.block_number and confirmado < self.reenviado_ate:
+                print(f"FEM[TX]: Lacuna após o bloco {confirmado} já retransmitida.")
+                self.suprimidos += min(self.block_number, self.reenviado_ate) - confirmado
+                self._enviar_janela()
+            elif confirmado < self.block_number:
+                print(f"FEM[TX]: Lacuna após o bloco {confirmado}, retransmitindo a janela.")
+                self._retransmitir_janela()
+            else:
+                self._enviar_janela()
+        elif isinstance(packet, AckPacket) and packet.block_number == (self.base - 1) & 0xFFFF:
+            self.acks_duplicados += 1
+            if self.acks_duplicados >= LIMIAR_ACKS_DUPLICADOS:
+                print(f"FEM[TX]: {self.acks_duplicados} ACKs duplicados do bloco {self.base - 1}, retransmitindo.")
+                self.acks_duplicados = 0
+                self.retransmissoes_rapidas += 1
+                self._retransmitir_janela()
             else:
-                self.block_number += 1
-                self._enviar_data()
+                self.suprimidos += 1
         elif isinstance(packet, ErrorPacket):
             print(f"FEM[TX]: Erro recebido: {packet.error_msg}")
             self.state = EstadoTx.ERRO
@@ -145,7 +254,7 @@ class FEMTransmissao(poller.Callback):
     # e seta a transmissão como terminada.
     def handle_ultima(self):
         packet, _ = self.recebido
-        if isinstance(packet, AckPacket) and packet.block_number == self.block_number:
+        if isinstance(packet, AckPacket) and packet.block_number == self.block_number & 0xFFFF:
             self.state = EstadoTx.FIM
             self.terminado = True
             print(f"FEM[ULTIMA]: Recebido {type(packet).__name__} bloco {packet.block_number}")
@@ -153,33 +262,92 @@ class FEMTransmissao(poller.Callback):
     # Se a transferência for concluída, imprime uma mensagem de sucesso.
     def handle_fim(self):
         print("FEM[FIM]: Transmissão finalizada com sucesso.")
+        print(f"FEM[FIM]: {self.suprimidos} envios redundantes suprimidos, "
+              f"{self.retransmissoes_rapidas} retransmissões antecipadas.")
 
     # Se ocorrer qualquer anormalidade, o estado de erro imprime uma mensagem de erro.
     def handle_erro(self):
         print("FEM[ERRO]: Transmissão abortada.")
 
-    # Método para enviar um ACK (Acknowledgment) para o servidor TFTP.
-    # O ACK confirma o recebimento de um bloco de dados.
-    # Ele cria um pacote ACK com o número do bloco recebido e o envia para o endereço remoto.
+    # Converte o número de bloco (16 bits) de um ACK no número do bloco enviado que ele confirma.
+    # Retorna None se o ACK não confirmar nenhum bloco pendente (ex: ACK duplicado ou antigo).
+    def _bloco_confirmado(self, packet):
+        avanco = (packet.block_number - (self.base - 1)) & 0xFFFF
+        if 1 <= avanco <= self.block_number - self.base + 1:
+            return self.base - 1 + avanco
+        return None
+
+    # Envia os blocos seguintes até preencher a janela (windowsize blocos não confirmados),
+    # parando após o último bloco do arquivo. Em stop-and-wait, envia um único bloco.
+    def _enviar_janela(self):
+        while not self.ultima_msg and self.block_number < self.base + self.windowsize - 1:
+            self.block_number += 1
+            self._enviar_data()
+            if self.state == EstadoTx.ERRO:
+                return
+
+    # Reenvia a janela a partir do bloco base (em stop-and-wait, só o bloco base) e registra
+    # até onde foi a retransmissão, para que ACKs atrasados não a repitam.
+    def _retransmitir_janela(self):
+        self.block_number = self.base - 1
+        self.ultima_msg = False
+        self._enviar_janela()
+        self.reenviado_ate = self.block_number
+
+    # Método para enviar um bloco de dados (DATA) para o servidor TFTP.
+    # Lê do arquivo o bloco block_number e o envia para o endereço remoto.
+    # O arquivo permanece aberto entre os blocos: a leitura é sequencial, e só há
+    # seek quando um bloco anterior precisa ser retransmitido.
+    # O número do bloco é reduzido a 16 bits, pois pode ultrapassar 65535 em arquivos grandes.
     def _enviar_data(self):
         try:
-            with open(self.filename, 'rb') as f:
-                f.seek((self.block_number - 1) * 512)
-                data = f.read(512)
-                pkt = DataPacket(self.block_number, data)
-                self.last_packet_sent = pkt
-                self.client.sock.sendto(pkt.to_bytes(), self.remote_tid)
-                print(f"FEM: Enviado DATA {self.block_number} ({len(data)} bytes)")
-                self.ultima_msg = len(data) < 512
-                self.state = EstadoTx.TX
+            if self.arquivo is None:
+                self.arquivo = open(self.filename, 'rb')
+                self.pos_arquivo = 0
+            pos = (self.block_number - 1) * self.blksize
+            if pos != self.pos_arquivo:
+                self.arquivo.seek(pos)
+            data = self.arquivo.read(self.blksize)
+            self.pos_arquivo = pos + len(data)
+            pkt = DataPacket(self.block_number & 0xFFFF, data)
+            self.last_packet_sent = pkt
+            self.fila.enfileira(pkt.to_bytes(), self.remote_tid)
+            print(f"FEM: Enviado DATA {self.block_number} ({len(data)} bytes)")
+            self.ultima_msg = len(data) < self.blksize
+            self.state = EstadoTx.TX
         except Exception as e:
             print(f"FEM: Erro ao ler arquivo: {e}")
             self.state = EstadoTx.ERRO
             self.terminado = True
 
+    # Método para fechar o arquivo transmitido.
+    def _fechar_arquivo(self):
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
+
     # Método para lidar com timeouts.
     # Ele imprime uma mensagem de timeout detectado e reenviará o último pacote enviado.
+    # Com janela, todos os blocos ainda não confirmados são reenviados.
+    # Antes da resposta do servidor, o WRQ é reenviado.
+    # Após tentativas timeouts seguidos, a transmissão é abortada.
     def handle_timeout(self):
+        self.timeouts += 1
+        if self.timeouts > self.tentativas:
+            print(f"FEM: {self.tentativas} retransmissões sem resposta. Transmissão abortada.")
+            self.state = EstadoTx.ERRO
+            self.terminado = True
+            self._fechar_arquivo()
+            self.disable()
+            self.disable_timeout()
+            return
         print("FEM: Timeout detectado. Reenviando último pacote.")
-        if self.last_packet_sent:
-            self.client.sock.sendto(self.last_packet_sent.to_bytes(), self.remote_tid)
\ No newline at end of file
+        if self.state == EstadoTx.INIT:
+            self._enviar_wrq()
+        elif self.last_packet_sent:
+            if self.windowsize > 1:
+                self._retransmitir_janela()
+            else:
+                self.fila.enfileira(self.last_packet_sent.to_bytes(), self.remote_tid)
+                self.reenviado_ate = self.block_number
+            self.fila.descarrega()
\ No newline at end of file
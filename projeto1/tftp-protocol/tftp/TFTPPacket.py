@@ -1,7 +1,57 @@
 import struct
 
+# Formatos pré-compilados do cabeçalho dos pacotes, usados com unpack_from e pack_into
+# para ler e escrever direto no buffer, sem fatiar os bytes recebidos.
+_OPCODE = struct.Struct("!H")           # opcode
+_CABECALHO = struct.Struct("!HH")       # opcode + número do bloco (ou código de erro)
+
+# Tamanho de bloco padrão e limites da opção blksize (RFC 2348).
+BLKSIZE_PADRAO = 512
+BLKSIZE_MIN = 8
+BLKSIZE_MAX = 65464
+
+# Tamanho de janela padrão (stop-and-wait) e limites da opção windowsize (RFC 7440).
+WINDOWSIZE_PADRAO = 1
+WINDOWSIZE_MIN = 1
+WINDOWSIZE_MAX = 65535
+
+# Converte um dicionário de opções (RFC 2347) em bytes, no formato:
+# nome da opção (string) + null terminator + valor (string) + null terminator, para cada opção.
+def _opcoes_to_bytes(options):
+    return b''.join(str(k).encode() + b'\0' + str(v).encode() + b'\0' for k, v in options.items())
+
+# Interpreta uma lista de campos já separados pelo null terminator como pares (opção, valor).
+# Os nomes das opções não diferenciam maiúsculas de minúsculas, então são convertidos para minúsculas.
+def _opcoes_from_parts(parts):
+    options = {}
+    for i in range(0, len(parts) - 1, 2):
+        if parts[i]:
+            options[parts[i].decode().lower()] = parts[i + 1].decode()
+    return options
+
+# Valida as opções confirmadas pelo servidor num OACK em relação às solicitadas pelo cliente.
+# O servidor só pode confirmar opções que foram pedidas, com valor menor ou igual ao pedido.
+# Retorna um dicionário com os valores efetivos de blksize e windowsize
+# (opções omitidas no OACK assumem o valor padrão), ou None se o OACK for inválido.
+def negocia_opcoes(pedidas, options):
+    efetivas = {'blksize': BLKSIZE_PADRAO, 'windowsize': WINDOWSIZE_PADRAO}
+    minimos = {'blksize': BLKSIZE_MIN, 'windowsize': WINDOWSIZE_MIN}
+    for nome, valor in options.items():
+        # isdigit() também aceita dígitos Unicode (ex: '²'), que int() recusa
+        if nome not in pedidas or not (valor.isascii() and valor.isdigit()):
+            return None
+        valor = int(valor)
+        if not minimos[nome] <= valor <= int(pedidas[nome]):
+            return None
+        efetivas[nome] = valor
+    return efetivas
+
+# Os pacotes usam __slots__ para que cada instância ocupe menos memória e seja criada mais rápido,
+# já que um objeto é criado para cada datagrama enviado ou recebido.
 class TFTPPacket:
     'Classe base para pacotes TFTP'
+    __slots__ = ('opcode',)
+
     def __init__(self, opcode):
         self.opcode = opcode
 
@@ -15,57 +65,67 @@ class TFTPPacket:
     # Recebe uma sequência de bytes e tenta interpretar como um pacote TFTP.
     # Dependendo do opcode, chama o construtor apropriado da subclasse.
     # Se o opcode não for reconhecido, lança uma exceção ValueError.
+    # Aceita bytes, bytearray ou memoryview; no pacote DATA, os dados referenciam
+    # o próprio buffer recebido, sem cópia.
     @staticmethod
     def from_bytes(data):
         if len(data) < 2:
             raise ValueError("Pacote muito curto.")
 
         # Extrai o opcode dos primeiros 2 bytes do pacote.
-        opcode = struct.unpack("!H", data[:2])[0]
+        opcode = _OPCODE.unpack_from(data)[0]
 
         # Verifica o opcode e chama o construtor apropriado.
         # Cada subclasse deve implementar o método from_bytes para interpretar seus dados.
         # 1 é um RRQ (Read Request), 2 é um WRQ (Write Request),
-        # 3 é um DATA, 4 é um ACK (Acknowledgment), 5 é um ERROR.
-        if opcode == 1:
-            return RRQPacket.from_bytes(data)
-        elif opcode == 2:
-            return WRQPacket.from_bytes(data)
-        elif opcode == 3:
+        # 3 é um DATA, 4 é um ACK (Acknowledgment), 5 é um ERROR,
+        # 6 é um OACK (Option Acknowledgment, RFC 2347).
+        # DATA e ACK são os mais frequentes, por isso são testados primeiro.
+        if opcode == 3:
             return DataPacket.from_bytes(data)
         elif opcode == 4:
             return AckPacket.from_bytes(data)
+        elif opcode == 1:
+            return RRQPacket.from_bytes(data)
+        elif opcode == 2:
+            return WRQPacket.from_bytes(data)
         elif opcode == 5:
             return ErrorPacket.from_bytes(data)
+        elif opcode == 6:
+            return OACKPacket.from_bytes(data)
         else:
             raise ValueError(f"Opcode desconhecido: {opcode}")
 
 # Define os pacotes TFTP específicos, cada um com seu próprio opcode e estrutura de dados para RRQ
 class RRQPacket(TFTPPacket):
-    def __init__(self, filename, mode="octet"):
+    __slots__ = ('filename', 'mode', 'options')
+
+    def __init__(self, filename, mode="octet", options=None):
         super().__init__(1)
         self.filename = filename
         self.mode = mode
+        self.options = options or {}
     # Converte o pacote RRQ em bytes.
     # O formato é: opcode (2 bytes) + nome do arquivo (string) +
-    # null terminator (1 byte) + modo (string) + null terminator (1 byte).
+    # null terminator (1 byte) + modo (string) + null terminator (1 byte),
+    # seguidos das opções (RFC 2347), se houver.
     # Retorna uma sequência de bytes que representa o pacote RRQ.
     # O opcode é sempre 1 para RRQ.
     def to_bytes(self):
-        return struct.pack("!H", self.opcode) + self.filename.encode() + b'\0' + self.mode.encode() + b'\0'
+        return _OPCODE.pack(self.opcode) + self.filename.encode() + b'\0' + self.mode.encode() + b'\0' + _opcoes_to_bytes(self.options)
 
     # Método estático para criar um pacote RRQ a partir de bytes.
     # Recebe uma sequência de bytes e tenta interpretar como um pacote RRQ.
     # Divide os dados em partes usando o null terminator (b'\0').
-    # O primeiro elemento é o nome do arquivo, o segundo é o modo.
+    # O primeiro elemento é o nome do arquivo, o segundo é o modo e os demais são as opções.
     @staticmethod
     def from_bytes(data):
-        parts = data[2:].split(b'\0')
+        parts = bytes(data[2:]).split(b'\0')
         if len(parts) < 2:
             raise ValueError("Pacote RRQ malformado.")
         filename = parts[0].decode()
         mode = parts[1].decode()
-        return RRQPacket(filename, mode)
+        return RRQPacket(filename, mode, _opcoes_from_parts(parts[2:]))
 
 # Define o pacote WRQ (Write Request) com seu próprio opcode e estrutura de dados.
 # O WRQ é usado para solicitar a escrita de um arquivo no servidor TFTP.
@@ -74,40 +134,47 @@ class RRQPacket(TFTPPacket):
 # O pacote WRQ é semelhante ao RRQ, mas é usado para solicitações de escrita.
 # Ele também contém o nome do arquivo e o modo de transferência.
 class WRQPacket(TFTPPacket):
-    def __init__(self, filename, mode="octet"):
+    __slots__ = ('filename', 'mode', 'options')
+
+    def __init__(self, filename, mode="octet", options=None):
         super().__init__(2)
         self.filename = filename
         self.mode = mode
+        self.options = options or {}
 
     # Converte o pacote WRQ em bytes.
     # O formato é: opcode (2 bytes) + nome do arquivo (string) +
-    # null terminator (1 byte) + modo (string) + null terminator (1 byte).
+    # null terminator (1 byte) + modo (string) + null terminator (1 byte),
+    # seguidos das opções (RFC 2347), se houver.
     # Retorna uma sequência de bytes que representa o pacote WRQ.
     # O opcode é sempre 2 para WRQ.
     def to_bytes(self):
-        return struct.pack("!H", self.opcode) + self.filename.encode() + b'\0' + self.mode.encode() + b'\0'
+        return _OPCODE.pack(self.opcode) + self.filename.encode() + b'\0' + self.mode.encode() + b'\0' + _opcoes_to_bytes(self.options)
 
     # Método estático para criar um pacote WRQ a partir de bytes.
     # Recebe uma sequência de bytes e tenta interpretar como um pacote WRQ.
     # Divide os dados em partes usando o null terminator (b'\0').
-    # O primeiro elemento é o nome do arquivo, o segundo é o modo.
+    # O primeiro elemento é o nome do arquivo, o segundo é o modo e os demais são as opções.
     @staticmethod
     def from_bytes(data):
-        parts = data[2:].split(b'\0')
+        parts = bytes(data[2:]).split(b'\0')
         if len(parts) < 2:
             raise ValueError("Pacote WRQ malformado.")
         filename = parts[0].decode()
         mode = parts[1].decode()
-        return WRQPacket(filename, mode)
+        return WRQPacket(filename, mode, _opcoes_from_parts(parts[2:]))
 
 # Define o pacote DATA, que é usado para enviar dados de um arquivo.
 # O pacote DATA contém um número de bloco e os dados do arquivo.
 # O opcode para DATA é 3.
 # O número de bloco é um inteiro que indica a ordem dos dados.
 # Os dados são uma sequência de bytes que representam o conteúdo do arquivo.
+# Os dados podem ser bytes, bytearray ou memoryview.
 class DataPacket(TFTPPacket):
+    __slots__ = ('block_number', 'data')
+
     def __init__(self, block_number, data):
-        super().__init__(3)
+        self.opcode = 3
         self.block_number = block_number
         self.data = data
 
@@ -116,19 +183,29 @@ class DataPacket(TFTPPacket):
     # Retorna uma sequência de bytes que representa o pacote DATA.
     # O opcode é sempre 3 para DATA.
     def to_bytes(self):
-        return struct.pack("!HH", self.opcode, self.block_number) + self.data
+        return _CABECALHO.pack(3, self.block_number) + self.data
+
+    # Escreve o pacote DATA em um buffer já alocado, a partir de offset.
+    # Permite reutilizar o mesmo buffer de envio para vários pacotes.
+    # Retorna o número de bytes escritos.
+    def pack_into(self, buf, offset=0):
+        n = len(self.data)
+        _CABECALHO.pack_into(buf, offset, 3, self.block_number)
+        buf[offset + 4:offset + 4 + n] = self.data
+        return 4 + n
 
     # Método estático para criar um pacote DATA a partir de bytes.
     # Recebe uma sequência de bytes e tenta interpretar como um pacote DATA.
     # O número do bloco é extraído dos bytes 2 a 4.
-    # Os dados são o restante da sequência de bytes.
+    # Os dados são o restante da sequência de bytes, como um memoryview sobre o
+    # buffer recebido: não há cópia, e o buffer não deve ser reutilizado enquanto
+    # os dados estiverem em uso.
     @staticmethod
     def from_bytes(data):
         if len(data) < 4:
             raise ValueError("Pacote DATA malformado.")
-        block_number = struct.unpack("!H", data[2:4])[0]
-        payload = data[4:]
-        return DataPacket(block_number, payload)
+        block_number = _CABECALHO.unpack_from(data)[1]
+        return DataPacket(block_number, memoryview(data)[4:])
 
 # Define o pacote ACK (Acknowledgment), que é usado para confirmar o recebimento de um pacote DATA.
 # O pacote ACK contém o número do bloco que foi recebido.
@@ -138,15 +215,23 @@ class DataPacket(TFTPPacket):
 # Ele confirma que o bloco de dados foi recebido corretamente.
 # O opcode é sempre 4 para ACK.
 class AckPacket(TFTPPacket):
+    __slots__ = ('block_number',)
+
     def __init__(self, block_number):
-        super().__init__(4)
+        self.opcode = 4
         self.block_number = block_number
 
     # Converte o pacote ACK em bytes.
     # O formato é: opcode (2 bytes) + número do bloco (2 bytes).
     # Retorna uma sequência de bytes que representa o pacote ACK.
     def to_bytes(self):
-        return struct.pack("!HH", self.opcode, self.block_number)
+        return _CABECALHO.pack(4, self.block_number)
+
+    # Escreve o pacote ACK em um buffer já alocado, a partir de offset.
+    # Retorna o número de bytes escritos.
+    def pack_into(self, buf, offset=0):
+        _CABECALHO.pack_into(buf, offset, 4, self.block_number)
+        return 4
 
     # Método estático para criar um pacote ACK a partir de bytes.
     # Recebe uma sequência de bytes e tenta interpretar como um pacote ACK.
@@ -155,7 +240,7 @@ class AckPacket(TFTPPacket):
     def from_bytes(data):
         if len(data) < 4:
             raise ValueError("Pacote ACK malformado.")
-        block_number = struct.unpack("!H", data[2:4])[0]
+        block_number = _CABECALHO.unpack_from(data)[1]
         return AckPacket(block_number)
 # Define o pacote de erro (Error Packet), que é usado para relatar erros durante a transferência.
 # O pacote de erro contém um código de erro e uma mensagem descritiva.
@@ -164,6 +249,8 @@ class AckPacket(TFTPPacket):
 # A mensagem de erro é uma string que descreve o erro ocorrido.
 # O pacote de erro é enviado pelo servidor quando ocorre um erro durante a transferência de dados.
 class ErrorPacket(TFTPPacket):
+    __slots__ = ('error_code', 'error_msg')
+
     def __init__(self, error_code, error_msg):
         super().__init__(5)
         self.error_code = error_code
@@ -174,7 +261,7 @@ class ErrorPacket(TFTPPacket):
     # Retorna uma sequência de bytes que representa o pacote de erro.
     # O opcode é sempre 5 para ERROR.
     def to_bytes(self):
-        return struct.pack("!HH", self.opcode, self.error_code) + self.error_msg.encode() + b'\0'
+        return _CABECALHO.pack(self.opcode, self.error_code) + self.error_msg.encode() + b'\0'
 
     # Método estático para criar um pacote de erro a partir de bytes.
     # Recebe uma sequência de bytes e tenta interpretar como um pacote de erro.
@@ -184,11 +271,36 @@ class ErrorPacket(TFTPPacket):
     def from_bytes(data):
         if len(data) < 5:
             raise ValueError("Pacote ERROR malformado.")
-        error_code = struct.unpack("!H", data[2:4])[0]
-        msg = data[4:].split(b'\0')[0].decode()
+        error_code = _CABECALHO.unpack_from(data)[1]
+        msg = bytes(data[4:]).split(b'\0')[0].decode()
         return ErrorPacket(error_code, msg)
 
     # Método para representar o pacote de erro como uma string.
     # Retorna uma string formatada com o código de erro e a mensagem de erro.
     def __str__(self):
         return f"ErrorPacket(code={self.error_code}, message='{self.error_msg}')"
+
+# Define o pacote OACK (Option Acknowledgment), definido na RFC 2347.
+# O OACK é enviado pelo servidor em resposta a um RRQ ou WRQ que contém opções.
+# Ele lista as opções aceitas pelo servidor e os valores escolhidos (ex: blksize, RFC 2348).
+# O opcode para OACK é 6.
+class OACKPacket(TFTPPacket):
+    __slots__ = ('options',)
+
+    def __init__(self, options):
+        super().__init__(6)
+        self.options = options
+
+    # Converte o pacote OACK em bytes.
+    # O formato é: opcode (2 bytes) + pares opção/valor, cada um terminado por null terminator.
+    def to_bytes(self):
+        return _OPCODE.pack(self.opcode) + _opcoes_to_bytes(self.options)
+
+    # Método estático para criar um pacote OACK a partir de bytes.
+    # As opções são o restante da sequência de bytes, separadas pelo null terminator.
+    @staticmethod
+    def from_bytes(data):
+        return OACKPacket(_opcoes_from_parts(bytes(data[2:]).split(b'\0')))
+
+    def __str__(self):
+        return f"OACKPacket(options={self.options})"
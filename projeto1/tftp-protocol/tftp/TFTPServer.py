@@ -0,0 +1,399 @@
+import os
+import socket
+from tftp.TFTPPacket import RRQPacket, WRQPacket, DataPacket, AckPacket, ErrorPacket, OACKPacket, TFTPPacket
+from tftp.TFTPPacket import BLKSIZE_PADRAO, BLKSIZE_MIN, BLKSIZE_MAX
+from tftp.TFTPPacket import WINDOWSIZE_PADRAO, WINDOWSIZE_MIN, WINDOWSIZE_MAX
+from tftp.TFTPBuffer import AnelRecepcao, FilaEnvio, nao_bloqueante, ajusta_recepcao
+from tftp.TFTPFsmRx import BUFFER_ESCRITA
+from pypoller import poller
+
+# Códigos de erro do TFTP (RFC 1350) usados pelo servidor.
+ERRO_NAO_DEFINIDO = 0
+ERRO_ARQUIVO_NAO_ENCONTRADO = 1
+ERRO_ACESSO = 2
+ERRO_OPERACAO_ILEGAL = 4
+ERRO_TID_DESCONHECIDO = 5
+
+# Número padrão de retransmissões por timeout antes de uma sessão ser abortada.
+TENTATIVAS = 5
+
+# Classe TFTPServer implementa um servidor TFTP (RFC 1350) com suporte às opções
+# blksize (RFC 2348) e windowsize (RFC 7440), atendendo todas as sessões num único Poller.
+# O socket de escuta recebe os pedidos RRQ e WRQ; cada sessão aceita ganha um socket
+# próprio, numa porta efêmera (um TID por sessão), e uma FSM com seu próprio timeout:
+# FEMLeitura para RRQ (o servidor transmite) e FEMEscrita para WRQ (o servidor recebe).
+# Os arquivos são servidos a partir do diretório raiz; caminhos que saiam dele são recusados.
+# blksize_max e windowsize_max limitam os valores aceitos na negociação das opções, e
+# max_sessoes limita o número de sessões simultâneas (None: sem limite). Para milhares
+# de sessões, o limite de descritores abertos do processo (ulimit -n) deve comportá-las.
+# Um poller já existente pode ser informado em sched, para compartilhar o laço de eventos.
+class TFTPServer:
+    def __init__(self, root, ip='0.0.0.0', port=69, timeout=5, tentativas=TENTATIVAS,
+                 blksize_max=BLKSIZE_MAX, windowsize_max=WINDOWSIZE_MAX, max_sessoes=None,
+                 sched=None, verbose=False):
+        if not os.path.isdir(root):
+            raise ValueError(f"Diretório raiz inexistente: {root}")
+        if not BLKSIZE_MIN <= blksize_max <= BLKSIZE_MAX:
+            raise ValueError(f"blksize_max deve estar entre {BLKSIZE_MIN} e {BLKSIZE_MAX}.")
+        if not WINDOWSIZE_MIN <= windowsize_max <= WINDOWSIZE_MAX:
+            raise ValueError(f"windowsize_max deve estar entre {WINDOWSIZE_MIN} e {WINDOWSIZE_MAX}.")
+        self.root = os.path.realpath(root)
+        self.ip = ip
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self.blksize_max = blksize_max
+        self.windowsize_max = windowsize_max
+        self.max_sessoes = max_sessoes
+        self.verbose = verbose
+        self.sched = sched if sched is not None else poller.Poller()
+        self.sessoes = set()
+        self.concluidas = 0
+        self.falhas = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((ip, port))
+        nao_bloqueante(self.sock)
+        self.port = self.sock.getsockname()[1]
+        # Anel de recepção compartilhado por todas as sessões: cada FSM processa os pacotes
+        # lidos antes de devolver o controle ao poller, então os buffers podem ser reutilizados
+        # pela próxima sessão sem que cada uma precise de um anel próprio.
+        self.anel = AnelRecepcao(blksize_max + 4)
+        self.escuta = _Escuta(self)
+        self.sched.adiciona(self.escuta)
+
+    # Atende pedidos indefinidamente, tratando todas as sessões no poller.
+    def serve(self):
+        print(f"Servidor: atendendo em {self.ip}:{self.port}, raiz {self.root}")
+        self.sched.despache(lote=True)
+
+    # Encerra todas as sessões em andamento e fecha o socket de escuta.
+    def close(self):
+        for sessao in list(self.sessoes):
+            sessao._encerra(False)
+        self.sched.remove(self.escuta)
+        self.sock.close()
+
+    # Trata um pedido recebido no socket de escuta.
+    # Valida o tipo do pedido, o modo e o caminho do arquivo, abre o arquivo e cria a sessão.
+    # Se o pedido não puder ser atendido, responde com um pacote de erro.
+    def _pedido(self, packet, addr):
+        if not isinstance(packet, (RRQPacket, WRQPacket)):
+            self._responde_erro(addr, ERRO_OPERACAO_ILEGAL, "Operação ilegal.")
+            return
+        if packet.mode.lower() != "octet":
+            self._responde_erro(addr, ERRO_NAO_DEFINIDO, f"Modo não suportado: {packet.mode}")
+            return
+        if self.max_sessoes is not None and len(self.sessoes) >= self.max_sessoes:
+            self._responde_erro(addr, ERRO_NAO_DEFINIDO, "Servidor ocupado.")
+            return
+        # As opções são validadas antes de abrir o arquivo e o socket da sessão
+        opcoes = self._aceita_opcoes(packet.options)
+        caminho = self._caminho(packet.filename)
+        if caminho is None:
+            self._responde_erro(addr, ERRO_ACESSO, "Acesso negado.")
+            return
+        try:
+            if isinstance(packet, RRQPacket):
+                arquivo = open(caminho, 'rb')
+            else:
+                arquivo = open(caminho, 'wb', buffering=BUFFER_ESCRITA)
+        except FileNotFoundError:
+            self._responde_erro(addr, ERRO_ARQUIVO_NAO_ENCONTRADO, "Arquivo não encontrado.")
+            return
+        except OSError:
+            self._responde_erro(addr, ERRO_ACESSO, "Acesso negado.")
+            return
+
+        # Cria o socket da sessão numa porta efêmera: o TID do servidor para esta transferência.
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((self.ip, 0))
+        except OSError as e:
+            arquivo.close()
+            self._responde_erro(addr, ERRO_NAO_DEFINIDO, f"Servidor ocupado: {e.strerror}")
+            return
+        if isinstance(packet, RRQPacket):
+            sessao = FEMLeitura(self, sock, addr, packet.filename, arquivo, opcoes)
+        else:
+            sessao = FEMEscrita(self, sock, addr, packet.filename, arquivo, opcoes)
+        self.sessoes.add(sessao)
+        self.sched.adiciona(sessao)
+        if self.verbose:
+            print(f"Servidor: {type(packet).__name__[:3]} {packet.filename} de {addr}, opções {opcoes}")
+        try:
+            sessao.inicia()
+        except Exception as e:
+            sessao._falha(e)
+
+    # Converte o nome de arquivo pedido num caminho dentro do diretório raiz.
+    # Retorna None se o caminho resultante estiver fora da raiz.
+    def _caminho(self, filename):
+        caminho = os.path.realpath(os.path.join(self.root, filename.lstrip('/')))
+        if os.path.commonpath((self.root, caminho)) != self.root or caminho == self.root:
+            return None
+        return caminho
+
+    # Escolhe as opções (RFC 2347) aceitas dentre as pedidas pelo cliente.
+    # Valores acima do máximo do servidor são reduzidos a ele; opções desconhecidas ou
+    # com valor inválido são ignoradas, como permite a RFC.
+    def _aceita_opcoes(self, options):
+        aceitas = {}
+        limites = {'blksize': (BLKSIZE_MIN, self.blksize_max),
+                   'windowsize': (WINDOWSIZE_MIN, self.windowsize_max)}
+        for nome, valor in options.items():
+            if nome in limites and valor.isascii() and valor.isdigit() and int(valor) >= limites[nome][0]:
+                aceitas[nome] = min(int(valor), limites[nome][1])
+        return aceitas
+
+    # Envia um pacote de erro pelo socket de escuta.
+    def _responde_erro(self, addr, codigo, msg):
+        if self.verbose:
+            print(f"Servidor: erro {codigo} para {addr}: {msg}")
+        try:
+            self.sock.sendto(ErrorPacket(codigo, msg).to_bytes(), addr)
+        except OSError:
+            pass
+
+    # Chamado por uma sessão ao terminar: remove-a do poller e contabiliza o resultado.
+    def _fim_sessao(self, sessao, sucesso):
+        self.sessoes.discard(sessao)
+        self.sched.remove(sessao)
+        if sucesso:
+            self.concluidas += 1
+        else:
+            self.falhas += 1
+        if self.verbose:
+            print(f"Servidor: sessão {sessao.filename} com {sessao.remote_tid} {'concluída' if sucesso else 'abortada'}")
+
+# Callback do socket de escuta: lê todos os pedidos disponíveis e os repassa ao servidor.
+class _Escuta(poller.Callback):
+    def __init__(self, servidor):
+        super().__init__(servidor.sock, 0)
+        self.servidor = servidor
+        self.disable_timeout()
+
+    def handle(self):
+        for data, addr in self.servidor.anel.drena(self.fd):
+            try:
+                packet = TFTPPacket.from_bytes(data)
+            except ValueError:
+                self.servidor._responde_erro(addr, ERRO_OPERACAO_ILEGAL, "Pacote malformado.")
+                continue
+            # Um erro inesperado num pedido é respondido só a quem o fez, sem derrubar o servidor
+            try:
+                self.servidor._pedido(packet, addr)
+            except Exception as e:
+                self.servidor._responde_erro(addr, ERRO_NAO_DEFINIDO, f"Erro interno: {e}")
+
+# Classe base das sessões do servidor. Cada sessão tem seu socket (TID), seu arquivo,
+# sua fila de envio e seu timeout; os datagramas são lidos com o anel do servidor.
+# Pacotes vindos de outro endereço recebem um erro de TID desconhecido e são descartados.
+# A cada timeout o último envio é repetido, até tentativas vezes; depois a sessão é abortada.
+class _Sessao(poller.Callback):
+    def __init__(self, servidor, sock, addr, filename, arquivo, opcoes):
+        super().__init__(nao_bloqueante(sock), servidor.timeout)
+        self.servidor = servidor
+        self.remote_tid = addr
+        self.filename = filename
+        self.arquivo = arquivo
+        self.opcoes = opcoes
+        self.blksize = opcoes.get('blksize', BLKSIZE_PADRAO)
+        self.windowsize = opcoes.get('windowsize', WINDOWSIZE_PADRAO)
+        self.fila = FilaEnvio(sock)
+        self.tentativas = 0
+        self.terminado = False
+        self.sucesso = False
+
+    # Lê todos os datagramas disponíveis no socket da sessão e os processa com mef().
+    # As respostas geradas são enviadas juntas ao final.
+    def handle(self):
+        if self.terminado:
+            return
+        try:
+            for data, addr in self.servidor.anel.drena(self.fd):
+                if addr != self.remote_tid:
+                    self.fila.enfileira(ErrorPacket(ERRO_TID_DESCONHECIDO, "TID desconhecido.").to_bytes(), addr)
+                    continue
+                try:
+                    packet = TFTPPacket.from_bytes(data)
+                except ValueError:
+                    self._encerra(False)
+                    return
+                if isinstance(packet, ErrorPacket):
+                    self._encerra(False)
+                    return
+                self.tentativas = 0
+                self.mef(packet)
+                if self.terminado:
+                    return
+            self.fila.descarrega()
+        except Exception as e:
+            self._falha(e)
+
+    # Trata o timeout da sessão: repete o último envio ou aborta a sessão.
+    def handle_timeout(self):
+        if self.terminado:
+            return
+        self.tentativas += 1
+        if self.tentativas > self.servidor.tentativas:
+            self._encerra(False)
+            return
+        try:
+            self._retransmite()
+            self.fila.descarrega()
+        except Exception as e:
+            self._falha(e)
+
+    # Aborta só esta sessão após um erro inesperado (de E/S do arquivo ou do socket, ou
+    # outro qualquer), para que ele não se propague ao poller e derrube as demais.
+    def _falha(self, e):
+        if self.servidor.verbose:
+            print(f"Servidor: erro na sessão {self.filename} com {self.remote_tid}: {e}")
+        self._encerra(False)
+
+    # Envia o OACK com as opções aceitas, se houver alguma.
+    def _enviar_oack(self):
+        self.fila.enfileira(OACKPacket(self.opcoes).to_bytes(), self.remote_tid)
+
+    # Encerra a sessão: envia o que restar na fila, fecha o arquivo e o socket
+    # e avisa o servidor. Pode ser chamado mais de uma vez.
+    def _encerra(self, sucesso):
+        if self.terminado:
+            return
+        self.terminado = True
+        self.sucesso = sucesso
+        try:
+            self.fila.descarrega()
+        except OSError:
+            pass
+        try:
+            self.arquivo.close()
+        except OSError:
+            self.sucesso = sucesso = False
+        self.servidor._fim_sessao(self, sucesso)
+        self.fd.close()
+
+    def mef(self, packet):
+        raise NotImplementedError()
+
+    def _retransmite(self):
+        raise NotImplementedError()
+
+# Sessão de leitura (RRQ): o servidor transmite o arquivo ao cliente.
+# Envia até windowsize blocos por vez e avança a janela a cada ACK, que confirma
+# cumulativamente os blocos até o número informado. Um ACK que confirme só parte da
+# janela indica uma lacuna, e a transmissão recomeça a partir do bloco seguinte (RFC 7440).
+# Se houver opções aceitas, a transmissão começa após o ACK do bloco 0 em resposta ao OACK.
+class FEMLeitura(_Sessao):
+    def __init__(self, servidor, sock, addr, filename, arquivo, opcoes):
+        super().__init__(servidor, sock, addr, filename, arquivo, opcoes)
+        self.block_number = 0  # último bloco enviado
+        self.base = 1  # bloco mais antigo ainda não confirmado
+        self.ultima_msg = False
+        self.pos_arquivo = 0
+
+    def inicia(self):
+        if self.opcoes:
+            self._enviar_oack()
+        else:
+            self._enviar_janela()
+        self.fila.descarrega()
+
+    def mef(self, packet):
+        if not isinstance(packet, AckPacket):
+            return
+        # ACK do bloco 0 confirma o OACK: inicia a transmissão
+        if self.block_number == 0:
+            if packet.block_number == 0:
+                self._enviar_janela()
+            return
+        avanco = (packet.block_number - (self.base - 1)) & 0xFFFF
+        if not 1 <= avanco <= self.block_number - self.base + 1:
+            return
+        confirmado = self.base - 1 + avanco
+        self.base = confirmado + 1
+        if self.ultima_msg and confirmado == self.block_number:
+            self._encerra(True)
+            return
+        if confirmado < self.block_number:
+            self.block_number = confirmado
+            self.ultima_msg = False
+        self._enviar_janela()
+
+    # Envia os blocos seguintes até preencher a janela, parando após o último bloco do arquivo.
+    def _enviar_janela(self):
+        while not self.ultima_msg and self.block_number < self.base + self.windowsize - 1:
+            self.block_number += 1
+            pos = (self.block_number - 1) * self.blksize
+            if pos != self.pos_arquivo:
+                self.arquivo.seek(pos)
+            data = self.arquivo.read(self.blksize)
+            self.pos_arquivo = pos + len(data)
+            self.fila.enfileira(DataPacket(self.block_number & 0xFFFF, data).to_bytes(), self.remote_tid)
+            self.ultima_msg = len(data) < self.blksize
+
+    # Em timeout, reenvia o OACK ou todos os blocos ainda não confirmados.
+    def _retransmite(self):
+        if self.block_number == 0:
+            self._enviar_oack()
+        else:
+            self.block_number = self.base - 1
+            self.ultima_msg = False
+            self._enviar_janela()
+
+# Sessão de escrita (WRQ): o servidor recebe o arquivo do cliente.
+# Confirma com ACK ao final de cada janela de windowsize blocos, no último bloco, ou
+# ao detectar uma lacuna (um ACK por lacuna, do último bloco recebido em ordem).
+# Após o último bloco, a sessão permanece ativa por mais um timeout para repetir o
+# ACK final caso o cliente, por não tê-lo recebido, retransmita o último bloco.
+# O buffer de recepção do socket é ampliado para comportar uma janela inteira.
+class FEMEscrita(_Sessao):
+    def __init__(self, servidor, sock, addr, filename, arquivo, opcoes):
+        super().__init__(servidor, sock, addr, filename, arquivo, opcoes)
+        ajusta_recepcao(sock, 2 * self.windowsize * (self.blksize + 4))
+        self.block_number = 1  # próximo bloco esperado
+        self.na_janela = 0
+        self.lacuna_avisada = False
+        self.recebido = False  # se o último bloco já foi recebido
+
+    def inicia(self):
+        if self.opcoes:
+            self._enviar_oack()
+        else:
+            self._enviar_ack(0)
+        self.fila.descarrega()
+
+    def mef(self, packet):
+        if not isinstance(packet, DataPacket):
+            return
+        if self.recebido or packet.block_number != self.block_number & 0xFFFF:
+            # Bloco repetido ou fora de ordem: confirma o último bloco recebido em ordem
+            if not self.lacuna_avisada:
+                self._enviar_ack(self.block_number - 1)
+                self.na_janela = 0
+                self.lacuna_avisada = self.windowsize > 1 and not self.recebido
+            return
+        self.arquivo.write(packet.data)
+        self.lacuna_avisada = False
+        self.na_janela += 1
+        ultimo = len(packet.data) < self.blksize
+        if ultimo or self.na_janela >= self.windowsize:
+            self._enviar_ack(self.block_number)
+            self.na_janela = 0
+        self.block_number += 1
+        if ultimo:
+            self.recebido = True
+            self.arquivo.close()
+
+    def _enviar_ack(self, bloco):
+        self.fila.enfileira(AckPacket(bloco & 0xFFFF).to_bytes(), self.remote_tid)
+
+    # Em timeout, reenvia o OACK ou o ACK do último bloco recebido em ordem.
+    # Se o último bloco já foi recebido, o período de espera terminou e a sessão é concluída.
+    def _retransmite(self):
+        if self.recebido:
+            self._encerra(True)
+        elif self.block_number == 1 and self.opcoes:
+            self._enviar_oack()
+        else:
+            self.na_janela = 0
+            self._enviar_ack(self.block_number - 1)
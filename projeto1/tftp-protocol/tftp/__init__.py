@@ -1,5 +1,7 @@
 # faz a importação dos módulos necessários para rodar o programa TFTP.
 from tftp.TFTPClient import *
 from tftp.TFTPPacket import *
+from tftp.TFTPBuffer import *
 from tftp.TFTPFsmTx import *
-from tftp.TFTPFsmRx import *
\ No newline at end of file
+from tftp.TFTPFsmRx import *
+from tftp.TFTPServer import *
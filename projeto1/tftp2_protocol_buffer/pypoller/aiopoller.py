@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+import asyncio
+from pypoller.poller import NS, RELOGIO
+
+class AsyncPoller:
+  '''Classe AsyncPoller: executa callbacks (poller.Callback) num event loop
+  do asyncio, sem qualquer modificação nos callbacks. Descritores são
+  monitorados com loop.add_reader e timeouts são agendados com
+  loop.call_later. Assim, várias máquinas de estados podem ser executadas
+  concorrentemente com outras corrotinas no mesmo processo.
+  A interface é a mesma do Poller: callbacks são registrados com adiciona
+  e tratados por despache, que aqui é uma corrotina.'''
+
+  def __init__(self, loop=None):
+    '''loop: event loop a ser usado. Se omitido, usa o loop em execução
+    no momento em que o primeiro callback for registrado'''
+    self.loop = loop
+    self.relogio = RELOGIO
+    self.cbs_to = []
+    self.cbs = set()
+    self._leitores = {} # callback -> fileobj monitorado com add_reader
+    self._handles = {} # callback -> asyncio.TimerHandle do seu timeout
+    self._fim = None
+
+  def _get_loop(self):
+    if self.loop == None: self.loop = asyncio.get_running_loop()
+    return self.loop
+
+  def adiciona(self, cb):
+    'Registra um callback'
+    if cb.isTimer:
+      if cb in self.cbs_to: return
+      self.cbs_to.append(cb)
+    else:
+      self.cbs.add(cb)
+    if cb._relogio is not self.relogio:
+      restante = cb._deadline - cb._relogio.agora()
+      cb._relogio = self.relogio
+      cb._deadline = self.relogio.agora() + restante
+    cb._poller = self
+    if not cb.isTimer: self._atualiza(cb)
+    self._agenda(cb)
+
+  def remove(self, cb):
+    'Cancela o registro de um callback'
+    if cb.isTimer:
+      if cb in self.cbs_to: self.cbs_to.remove(cb)
+    else:
+      self.cbs.discard(cb)
+    if cb in self._leitores: self._get_loop().remove_reader(self._leitores.pop(cb))
+    handle = self._handles.pop(cb, None)
+    if handle != None: handle.cancel()
+    cb._poller = None
+    self._verifica_fim()
+
+  def _atualiza(self, cb):
+    'Ativa ou desativa o monitoramento do descritor de cb no event loop'
+    loop = self._get_loop()
+    if cb.isEnabled and not cb in self._leitores:
+      loop.add_reader(cb.fd, self._handle, cb)
+      self._leitores[cb] = cb.fd
+    elif not cb.isEnabled and cb in self._leitores:
+      loop.remove_reader(self._leitores.pop(cb))
+    self._verifica_fim()
+
+  def _agenda(self, cb):
+    'Cancela o timeout agendado para cb e, se estiver ativo, agenda seu novo deadline'
+    handle = self._handles.pop(cb, None)
+    if handle != None: handle.cancel()
+    if cb.timeout_enabled:
+      atraso = max(0, cb._deadline - self.relogio.agora()) / NS
+      self._handles[cb] = self._get_loop().call_later(atraso, self._handle_timeout, cb)
+    self._verifica_fim()
+
+  def _handle(self, cb):
+    try:
+      cb.handle()
+      cb.reload_timeout()
+    except Exception as e:
+      self._aborta(e)
+
+  def _handle_timeout(self, cb):
+    self._handles.pop(cb, None)
+    try:
+      cb.handle_timeout()
+      cb.reload_timeout()
+    except Exception as e:
+      self._aborta(e)
+    self._verifica_fim()
+
+  def _aborta(self, e):
+    'Repassa para despache uma exceção lançada por um callback'
+    if self._fim != None and not self._fim.done(): self._fim.set_exception(e)
+    else: raise e
+
+  def _verifica_fim(self):
+    'Encerra despache quando nenhum evento puder mais ser gerado pelos callbacks'
+    if self._leitores or self._handles: return
+    if self._fim != None and not self._fim.done(): self._fim.set_result(None)
+
+  async def despache(self):
+    '''Trata eventos dos callbacks registrados até que nenhum evento possa
+    ser gerado, isto é, até que todos os callbacks estejam desativados
+    (monitoramento do descritor e timeout)'''
+    self._fim = self._get_loop().create_future()
+    self._verifica_fim()
+    try:
+      await self._fim
+    finally:
+      self._fim = None
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+import multiprocessing
+import os
+import select
+import zlib
+from pypoller.poller import Callback, Poller
+
+class _Controle(Callback):
+  '''Callback do processo trabalhador que recebe, pelo pipe, os comandos
+  do processo principal: ('sessao', ident, fabrica, args) cria uma nova
+  sessão neste shard, e ('fim',) pede o encerramento do trabalhador
+  assim que as sessões em andamento terminarem. Uma fábrica que levanta
+  exceção conta como sessão falha e não derruba o trabalhador'''
+
+  def __init__(self, conn, poller):
+    super().__init__(conn, 0)
+    self.disable_timeout()
+    self.conn = conn
+    self.poller = poller
+    self.sessoes = {} # ident -> lista de callbacks da sessão
+    self.concluidas = 0
+    self.falhas = 0
+    self.encerrando = False
+
+  def handle(self):
+    try:
+      cmd = self.conn.recv()
+    except EOFError:
+      cmd = ('fim',)
+    if cmd[0] == 'sessao':
+      _, ident, fabrica, args = cmd
+      try:
+        cbs = fabrica(self.poller, *args)
+        if isinstance(cbs, Callback): cbs = [cbs]
+        cbs = list(cbs)
+      except Exception as e:
+        # a sessão falha sozinha: as demais sessões do shard continuam.
+        # Conta também como concluída, para que a carga do shard não fique presa
+        print(f'shards[{os.getpid()}]: falha ao criar a sessão {ident}: {e!r}')
+        self.falhas += 1
+        self.concluidas += 1
+        return
+      self.sessoes[ident] = cbs
+    elif cmd[0] == 'fim':
+      self.encerrando = True
+      self.disable()
+
+class _Relatorio(Callback):
+  '''Timer do processo trabalhador: remove do Poller as sessões
+  concluídas e envia periodicamente as estatísticas do shard'''
+
+  def __init__(self, controle, intervalo):
+    super().__init__(None, intervalo)
+    self.ctl = controle
+
+  def handle_timeout(self):
+    ctl = self.ctl
+    for ident, cbs in list(ctl.sessoes.items()):
+      # uma sessão termina quando todos os seus callbacks estão desativados
+      if not any((cb.isEnabled and not cb.isTimer) or cb.timeout_enabled for cb in cbs):
+        for cb in cbs: ctl.poller.remove(cb)
+        del ctl.sessoes[ident]
+        ctl.concluidas += 1
+    final = ctl.encerrando and not ctl.sessoes
+    # o processo principal só lê o pipe em atualiza() e aguarda(): se o pipe
+    # estiver cheio, descarta o relatório em vez de bloquear este laço de eventos
+    # (o próximo relatório traz os contadores acumulados). O relatório final é
+    # sempre enviado, pois aguarda() o está lendo
+    if final or select.select([], [ctl.conn], [], 0)[1]:
+      st = ctl.poller.stats
+      ctl.conn.send(('stats', {'pid': os.getpid(), 'ativas': len(ctl.sessoes),
+                               'concluidas': ctl.concluidas, 'falhas': ctl.falhas, 'eventos': st.eventos,
+                               'timers': st.timers, 'iteracoes': st.iteracoes,
+                               'latencia': st.latencia, 'duracao': st.duracao}))
+    if final:
+      self.disable_timeout()
+
+def _trabalhador(conn, intervalo):
+  'Laço de eventos de um shard: um Poller próprio num processo próprio'
+  sched = Poller()
+  ctl = _Controle(conn, sched)
+  sched.adiciona(ctl)
+  sched.adiciona(_Relatorio(ctl, intervalo))
+  sched.despache(lote=True)
+  conn.close()
+
+class PollerShards:
+  '''Classe PollerShards: distribui sessões (transferências TFTP, enlaces
+  seriais, ...) entre N processos trabalhadores, cada um com seu próprio
+  Poller, de forma que o processamento dos protocolos use vários núcleos.
+
+  Uma sessão é descrita por uma fábrica: uma função de nível de módulo
+  (para que possa ser enviada a outro processo) chamada no trabalhador
+  como fabrica(poller, *args). Ela deve criar os callbacks da sessão,
+  registrá-los no poller recebido e retorná-los (um Callback ou uma lista).
+  A sessão é considerada concluída quando todos os seus callbacks
+  estiverem desativados (descritor e timeout).
+
+  n: quantidade de trabalhadores (default: os.cpu_count())
+  politica: 'hash' escolhe o shard pelo hash da chave da sessão, e
+  'carga' escolhe o shard com menos sessões ativas
+  intervalo: período, em segundos, dos relatórios de estatísticas'''
+
+  def __init__(self, n=None, politica='hash', intervalo=0.5):
+    if politica not in ('hash', 'carga'): raise ValueError(f'politica desconhecida: {politica}')
+    self.n = n or os.cpu_count() or 1
+    self.politica = politica
+    self.intervalo = intervalo
+    self._conns = []
+    self._procs = []
+    self._submetidas = [0]*self.n
+    self._stats = [{} for _ in range(self.n)]
+    self._proximo = 0
+
+  def inicia(self):
+    'Cria os processos trabalhadores'
+    for _ in range(self.n):
+      pai, filho = multiprocessing.Pipe()
+      proc = multiprocessing.Process(target=_trabalhador, args=(filho, self.intervalo), daemon=True)
+      proc.start()
+      filho.close()
+      self._conns.append(pai)
+      self._procs.append(proc)
+
+  def _carga(self, i):
+    return self._submetidas[i] - self._stats[i].get('concluidas', 0)
+
+  def _escolhe(self, chave):
+    if self.politica == 'hash':
+      return zlib.crc32(str(chave).encode()) % self.n
+    self.atualiza()
+    return min(range(self.n), key=self._carga)
+
+  def submete(self, fabrica, *args, chave=None):
+    '''Cria uma sessão em um dos shards. chave identifica a sessão para a
+    política 'hash' (ex: o nome do arquivo ou a porta serial).
+    Retorna o índice do shard escolhido'''
+    ident = self._proximo
+    self._proximo += 1
+    i = self._escolhe(ident if chave == None else chave)
+    self._conns[i].send(('sessao', ident, fabrica, args))
+    self._submetidas[i] += 1
+    return i
+
+  def atualiza(self):
+    'Lê, sem bloquear, os relatórios enviados pelos trabalhadores'
+    for i, conn in enumerate(self._conns):
+      try:
+        while conn.poll():
+          tipo, dados = conn.recv()
+          if tipo == 'stats': self._stats[i] = dados
+      except (EOFError, OSError):
+        pass
+
+  def estatisticas(self):
+    '''Retorna uma lista com as estatísticas mais recentes de cada shard:
+    pid, sessões submetidas, ativas, concluídas e falhas, e os contadores do seu Poller'''
+    self.atualiza()
+    return [dict(self._stats[i], shard=i, submetidas=self._submetidas[i]) for i in range(self.n)]
+
+  def aguarda(self):
+    '''Pede o encerramento dos trabalhadores, espera que concluam as
+    sessões em andamento e retorna as estatísticas finais de cada shard'''
+    for conn in self._conns: conn.send(('fim',))
+    for i, conn in enumerate(self._conns):
+      try:
+        while True:
+          tipo, dados = conn.recv()
+          if tipo == 'stats': self._stats[i] = dados
+      except EOFError:
+        pass
+    for proc in self._procs: proc.join()
+    stats = [dict(self._stats[i], shard=i, submetidas=self._submetidas[i]) for i in range(self.n)]
+    for conn in self._conns: conn.close()
+    self._conns = []
+    self._procs = []
+    return stats
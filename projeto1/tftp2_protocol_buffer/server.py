@@ -0,0 +1,25 @@
+import sys
+from tftplus.TFTPlus_Server import TFTPlus_Server
+
+# Lê a linha de comando com o diretório raiz e a porta, e inicia o servidor TFTP2.
+# O servidor atende pedidos até ser interrompido (Ctrl+C).
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Uso: python3 server.py pasta [porta]")
+        sys.exit(1)
+
+    root = sys.argv[1]
+    porta = int(sys.argv[2]) if len(sys.argv) == 3 else 69
+
+    try:
+        servidor = TFTPlus_Server(root, port=porta, verbose=True)
+    except (ValueError, OSError) as e:
+        print("Erro ao iniciar o servidor:", e)
+        sys.exit(1)
+
+    try:
+        servidor.serve()
+    except KeyboardInterrupt:
+        print(f"\nServidor: {servidor.concluidas} transferências concluídas, {servidor.falhas} abortadas.")
+    finally:
+        servidor.close()
@@ -4,8 +4,14 @@
     # e a classe poller.Callback para gerenciar eventos de recepção de dados.
 from enum import Enum, auto
 from tftplus.TFTPlus_ProtoPacket import TFTP2_ProtoPacket
+from tftplus.TFTPlus_Buffer import AnelRecepcao, FilaEnvio, nao_bloqueante
+from tftplus.TFTPlus_Rto import EstimadorRTO, RTO_MIN, RTO_MAX, TENTATIVAS
 from pypoller import poller
 
+# Tamanho padrão do buffer de escrita (write-behind) do arquivo recebido.
+# Os blocos recebidos são acumulados em memória e gravados no disco em escritas grandes.
+BUFFER_ESCRITA = 64 * 1024
+
 # Enum que define os estados possíveis da FSM de transmissão
 class EstadoRx(Enum):
     INIT = auto()
@@ -19,8 +25,13 @@ class EstadoRx(Enum):
 # Inicia com o estado INIT e espera receber pacotes DATA do servidor
 # Transita entre os estados RX, FIM e ERRO conforme os pacotes recebidos
 # Utiliza a classe TFTP2_ProtoPacket para manipular os pacotes TFTP2
+# O arquivo é aberto uma única vez, no primeiro bloco, e fechado em FIM ou ERRO
+# Os datagramas são lidos para um anel de buffers reutilizáveis e os ACKs enviados em rajada
+# O timeout de retransmissão é adaptativo (ver TFTPlus_Rto): começa em rto_inicial (ou timeout)
+    # e é recalculado a cada DATA; em um timeout, o RRQ ou o último ACK é reenviado
 class TFTPlus_FsmRx(poller.Callback):
-    def __init__(self, client, filename=None, timeout=5):
+    def __init__(self, client, filename=None, timeout=5, buffer_escrita=BUFFER_ESCRITA, rto_inicial=None,
+                 rto_min=RTO_MIN, rto_max=RTO_MAX, tentativas=TENTATIVAS):
         if not filename:
             raise ValueError("O nome do arquivo deve ser fornecido.")
 
@@ -30,7 +41,18 @@ class TFTPlus_FsmRx(poller.Callback):
         self.state = EstadoRx.INIT  # Estado inicial da FSM
         self.block_number = 1   # Número do bloco atual (começa em 1)
         self.terminado = False  # Flag para indicar se a recepção foi concluída
+        self.arquivo = None # Arquivo aberto durante a recepção
+        self.buffer_escrita = buffer_escrita    # Bytes acumulados antes de cada escrita no disco
+        self.anel = AnelRecepcao(1024)  # Buffers reutilizáveis para a recepção dos datagramas
+        self.fila = FilaEnvio(nao_bloqueante(client.sock))  # Fila de envio dos ACKs
         self.remote_tid = (self.client.server_ip, self.client.server_port)  # TID remoto (IP e porta do servidor)
+        self.ultimo_enviado = None  # Último pacote enviado, serializado (RRQ ou ACK), para reenvio em timeout
+        self.rto = EstimadorRTO(timeout if rto_inicial is None else rto_inicial, rto_min, rto_max)  # Estimador do timeout de retransmissão
+        self.base_timeout = self.rto.rto    # O timeout da FSM acompanha o RTO
+        self.tentativas = tentativas    # Retransmissões consecutivas antes de abortar
+        self.timeouts = 0   # Timeouts consecutivos desde a última resposta válida
+        self.enviado_em = None  # Instante (ns) do envio do pacote que aguarda resposta
+        self.retransmitido = False  # Se esse pacote foi retransmitido (regra de Karn)
 
     # O método start envia o pacote RRQ (Read Request) para o servidor
         # solicitando o arquivo especificado pelo nome
@@ -39,25 +61,34 @@ class TFTPlus_FsmRx(poller.Callback):
     def start(self):
         msg = TFTP2_ProtoPacket.criar_rrq(self.filename)
         data = TFTP2_ProtoPacket.to_bytes(msg)
+        self.ultimo_enviado = data
         self.client.sock.sendto(data, self.remote_tid)
+        self._marca_envio()
         self.enable_timeout()
         print(f"FEM: RRQ enviado para {self.remote_tid}")
 
     # Método chamado pelo poller quando há dados disponíveis no socket
     # Recebe os dados, converte para mensagem protobuf e chama a máquina de estados (mef)
-    # Se a recepção foi concluída, desabilita o poller e o timeout
+    # Se a recepção foi concluída, fecha o arquivo e desabilita o poller e o timeout
     # Se ocorrer um erro, transita para o estado ERRO
     def handle(self):
         if self.terminado:
+            self._fechar_arquivo()
             self.disable()
             self.disable_timeout()
             print("FEM: Recepção concluída.")
             return
         try:
-            data, addr = self.fd.recvfrom(1024)  # type: ignore
-            msg = TFTP2_ProtoPacket.from_bytes(data)
-            self.recebido = (msg, addr)
-            self.mef()
+            # Lê todos os datagramas disponíveis e processa um a um;
+            # os pacotes gerados são enviados juntos ao final
+            for data, addr in self.anel.drena(self.fd):
+                msg = TFTP2_ProtoPacket.from_bytes(data)
+                self.recebido = (msg, addr)
+                self.mef()
+                if self.terminado:
+                    self._fechar_arquivo()
+                    break
+            self.fila.descarrega()
         except Exception as e:
             print(f"FEM: Erro no handle(): {e}")
             self._erro()
@@ -87,6 +118,7 @@ class TFTPlus_FsmRx(poller.Callback):
         msg, addr = self.recebido
         if TFTP2_ProtoPacket.tipo(msg) == "DATA" and msg.data.block_n == self.block_number:
             self.remote_tid = addr
+            self._mede_rtt()
             self._gravar_bloco(msg.data.message)
             self._enviar_ack(msg.data.block_n)
             if len(msg.data.message) < 512:
@@ -98,7 +130,7 @@ class TFTPlus_FsmRx(poller.Callback):
                 self.block_number += 1
                 self.state = EstadoRx.RX
         elif TFTP2_ProtoPacket.tipo(msg) == "ERROR":
-            print(f"FEM[INIT]: Erro recebido: {msg.error.errormsg}")
+            print(f"FEM[INIT]: Erro recebido: {msg.error.errorcode}")
             self._erro()
         else:
             print("FEM[INIT]: Pacote inesperado.")
@@ -107,6 +139,7 @@ class TFTPlus_FsmRx(poller.Callback):
     # Recebe pacotes DATA do servidor, verifica se o bloco recebido é o esperado.
     # Se for, grava o bloco no arquivo, envia um ACK e incrementa o número do bloco.
     # Se o ACK for para o último bloco, transita para o estado FIM.
+    # Se o bloco anterior chegar de novo (o ACK dele se perdeu), reenvia o ACK.
     # Se um pacote de erro for recebido, transita para o estado ERRO.
     def handle_rx(self):
         msg, addr = self.recebido
@@ -115,6 +148,7 @@ class TFTPlus_FsmRx(poller.Callback):
             self._erro()
             return
         if TFTP2_ProtoPacket.tipo(msg) == "DATA" and msg.data.block_n == self.block_number:
+            self._mede_rtt()
             self._gravar_bloco(msg.data.message)
             self._enviar_ack(msg.data.block_n)
             if len(msg.data.message) < 512:
@@ -123,14 +157,19 @@ class TFTPlus_FsmRx(poller.Callback):
                 self.terminado = True
             else:
                 self.block_number += 1
+        elif TFTP2_ProtoPacket.tipo(msg) == "DATA" and msg.data.block_n == self.block_number - 1:
+            print(f"FEM[RX]: DATA {msg.data.block_n} repetido; reenviando ACK.")
+            self.fila.enfileira(self.ultimo_enviado, self.remote_tid)
+            self._marca_envio(True)
         elif TFTP2_ProtoPacket.tipo(msg) == "ERROR":
-            print(f"FEM[RX]: Erro recebido: {msg.error.errormsg}")
+            print(f"FEM[RX]: Erro recebido: {msg.error.errorcode}")
             self._erro()
 
     # Método que lida com o estado FIM da FSM.
     # Desabilita a FSM e o timeout, indicando que a transmissão foi concluída.
     # Imprime mensagem de conclusão.
     def handle_fim(self):
+        self._fechar_arquivo()
         self.disable()
         self.disable_timeout()
         print("FEM[FIM]: Recepção finalizada com sucesso.")
@@ -141,16 +180,24 @@ class TFTPlus_FsmRx(poller.Callback):
     def handle_erro(self):
         print("FEM[ERRO]: Recepção abortada por erro.")
         self.terminado = True
+        self._fechar_arquivo()
         self.disable()
         self.disable_timeout()
 
     # Método que grava o bloco de dados recebido no arquivo.
-    # Se for o primeiro bloco, abre o arquivo em modo de escrita.
-    # Se for um bloco subsequente, abre em modo de anexação.
+    # Se for o primeiro bloco, abre o arquivo em modo de escrita com um buffer
+        # de buffer_escrita bytes e o mantém aberto durante toda a recepção.
+    # Os blocos seguintes são acumulados no buffer e gravados em escritas grandes.
     def _gravar_bloco(self, dados):
-        modo = 'ab' if self.block_number > 1 else 'wb'
-        with open(self.filename, modo) as f:
-            f.write(dados)
+        if self.arquivo is None:
+            self.arquivo = open(self.filename, 'wb', buffering=self.buffer_escrita)
+        self.arquivo.write(dados)
+
+    # Método que fecha o arquivo recebido, gravando no disco o que restar no buffer.
+    def _fechar_arquivo(self):
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
 
     # Método que envia o ACK para o servidor.
     # Monta o pacote ACK a partir da classe TFTP2_ProtoPacket e envia
@@ -159,7 +206,9 @@ class TFTPlus_FsmRx(poller.Callback):
     def _enviar_ack(self, bloco):
         msg = TFTP2_ProtoPacket.criar_ack(bloco)
         data = TFTP2_ProtoPacket.to_bytes(msg)
-        self.client.sock.sendto(data, self.remote_tid)
+        self.ultimo_enviado = data
+        self.fila.enfileira(data, self.remote_tid)
+        self._marca_envio()
         print(f"FEM: ACK {bloco} enviado para {self.remote_tid}")
 
     # Método que trata erros de recepção.
@@ -169,17 +218,46 @@ class TFTPlus_FsmRx(poller.Callback):
         print("FEM: Entrando no estado de erro.")
         self.state = EstadoRx.ERRO
         self.terminado = True
+        self._fechar_arquivo()
         self.disable()
         self.disable_timeout()
 
+    # Método que registra o envio de um pacote que aguarda resposta, para medir o RTT.
+    # Se o pacote é uma retransmissão, a resposta não fornece amostra (regra de Karn).
+    def _marca_envio(self, retransmissao=False):
+        self.enviado_em = self._relogio.agora()
+        self.retransmitido = retransmissao
+
+    # Método chamado quando chega a resposta esperada ao último pacote enviado.
+    # Usa o tempo decorrido como amostra de RTT, exceto se o pacote foi retransmitido,
+        # e ajusta o timeout da FSM ao novo RTO.
+    # Como houve resposta, zera a contagem de timeouts consecutivos, mesmo sem amostra.
+    def _mede_rtt(self):
+        self.timeouts = 0
+        if self.enviado_em is not None and not self.retransmitido:
+            self.rto.amostra((self._relogio.agora() - self.enviado_em) / poller.NS)
+            self.base_timeout = self.rto.rto
+        self.enviado_em = None
+
     # Método que trata o timeout da FSM.
     # Se a transmissão já foi concluída, chama o método handle_fim.
-    # Se o último pacote foi enviado, reenvia ele para o servidor e reativa o timeout.
+    # Caso contrário, dobra o RTO (backoff exponencial) e reenvia o último pacote;
+        # se não houver resposta após tentativas retransmissões, transita para o estado ERRO.
+    # A desistência conta os timeouts da própria FSM, e não os backoffs do estimador:
+        # estes só são zerados por uma amostra, que a regra de Karn pode impedir.
     def handle_timeout(self):
         if self.terminado:
             self.handle_fim()
             return
-        
-        else:
-            print("FEM: Timeout detectado. Nenhum pacote recebido.")
-            self._erro()
\ No newline at end of file
+
+        self.timeouts += 1
+        self.rto.backoff()
+        self.base_timeout = self.rto.rto
+        if self.timeouts > self.tentativas:
+            print(f"FEM: Sem resposta após {self.tentativas} retransmissões. Abortando.")
+            self._erro()
+        elif self.ultimo_enviado:
+            print(f"FEM: Timeout detectado. Reenviando último pacote (RTO {self.rto.rto:.3f} s).")
+            self.client.sock.sendto(self.ultimo_enviado, self.remote_tid)
+            self._marca_envio(True)
+            self.enable_timeout()
@@ -4,6 +4,8 @@
     # e a classe poller.Callback para gerenciar eventos de transmissão de dados.
 from enum import Enum, auto
 from tftplus.TFTPlus_ProtoPacket import TFTP2_ProtoPacket
+from tftplus.TFTPlus_Buffer import AnelRecepcao, FilaEnvio, nao_bloqueante
+from tftplus.TFTPlus_Rto import EstimadorRTO, RTO_MIN, RTO_MAX, TENTATIVAS
 from pypoller import poller
 
 # Enum que define os estados possíveis da FSM de transmissão
@@ -16,8 +18,13 @@ class EstadoTx(Enum):
 
 # Classe principal da máquina de estados de transmissão (FSM TX)
 # Herda de poller.Callback para poder ser usada no poller (event loop)
+# O arquivo é aberto uma única vez, no primeiro bloco, e fechado em FIM ou ERRO
+# Os datagramas são lidos para um anel de buffers reutilizáveis e os DATA enviados em rajada
+# O timeout de retransmissão é adaptativo (ver TFTPlus_Rto): começa em rto_inicial (ou timeout)
+    # e é recalculado a cada ACK; o RTT medido fica em self.rto
 class TFTPlus_FsmTx(poller.Callback):
-    def __init__(self, client, filename=None, timeout=5):
+    def __init__(self, client, filename=None, timeout=5, rto_inicial=None, rto_min=RTO_MIN, rto_max=RTO_MAX,
+                 tentativas=TENTATIVAS):
         if not filename:
             raise ValueError("O nome do arquivo deve ser fornecido.")
 
@@ -29,7 +36,17 @@ class TFTPlus_FsmTx(poller.Callback):
         self.terminado = False  # Flag para indicar se a transmissão foi concluída
         self.last_packet_sent = None    # Último pacote enviado (para reenvio em caso de timeout)
         self.ultima_msg = False # Flag para indicar se é a última mensagem
+        self.arquivo = None # Arquivo aberto durante a transmissão
+        self.pos_arquivo = 0    # Posição atual de leitura, para evitar seek em blocos sequenciais
         self.remote_tid = (self.client.server_ip, self.client.server_port)  # TID remoto (IP e porta do servidor)
+        self.anel = AnelRecepcao(1024)  # Buffers reutilizáveis para a recepção dos datagramas
+        self.fila = FilaEnvio(nao_bloqueante(client.sock))  # Fila de envio dos DATA
+        self.rto = EstimadorRTO(timeout if rto_inicial is None else rto_inicial, rto_min, rto_max)  # Estimador do timeout de retransmissão
+        self.base_timeout = self.rto.rto    # O timeout da FSM acompanha o RTO
+        self.tentativas = tentativas    # Retransmissões consecutivas antes de abortar
+        self.timeouts = 0   # Timeouts consecutivos desde a última resposta válida
+        self.enviado_em = None  # Instante (ns) do envio do pacote que aguarda resposta
+        self.retransmitido = False  # Se esse pacote foi retransmitido (regra de Karn)
 
     # Monta e seriliza o pacote WRQ a partir da classe TFTP2_ProtoPacket
     # Inicia a transmissão enviando WRQ (Write Request) para o servidor
@@ -39,6 +56,7 @@ class TFTPlus_FsmTx(poller.Callback):
         self.last_packet_sent = msg
         data = TFTP2_ProtoPacket.to_bytes(msg)
         self.client.sock.sendto(data, self.remote_tid)
+        self._marca_envio()
         self.enable_timeout()
         print(f"FEM: WRQ enviado para {self.remote_tid}")
 
@@ -47,15 +65,22 @@ class TFTPlus_FsmTx(poller.Callback):
     # Trata exceções e erros de recepção
     def handle(self):
         if self.terminado:
+            self._fechar_arquivo()
             self.disable()
             self.disable_timeout()
             print("FEM: Transmissão concluída.")
             return
         try:
-            data, addr = self.fd.recvfrom(1024) # type: ignore
-            msg = TFTP2_ProtoPacket.from_bytes(data)
-            self.recebido = (msg, addr)
-            self.mef()
+            # Lê todos os datagramas disponíveis e processa um a um;
+            # os pacotes gerados são enviados juntos ao final
+            for data, addr in self.anel.drena(self.fd):
+                msg = TFTP2_ProtoPacket.from_bytes(data)
+                self.recebido = (msg, addr)
+                self.mef()
+                if self.terminado:
+                    self._fechar_arquivo()
+                    break
+            self.fila.descarrega()
         except Exception as e:
             print(f"FEM: Erro no handle(): {e}")
             self._erro()
@@ -84,10 +109,11 @@ class TFTPlus_FsmTx(poller.Callback):
         if TFTP2_ProtoPacket.tipo(msg) == "ACK" and msg.ack.block_n == 0:
             print(f"[FEM INIT] Recebido primeiro ACK de {addr}, atualizando remote_tid.")
             self.remote_tid = addr
+            self._mede_rtt()
             self.block_number = 1
             self._enviar_data()
         elif TFTP2_ProtoPacket.tipo(msg) == "ERROR":
-            print(f"FEM[INIT]: Erro recebido: {msg.error.errormsg}")
+            print(f"FEM[INIT]: Erro recebido: {msg.error.errorcode}")
             self._erro()
         else:
             print("FEM[INIT]: Pacote inesperado.")
@@ -96,6 +122,8 @@ class TFTPlus_FsmTx(poller.Callback):
     # Recebe pacotes ACK do servidor, verifica se o bloco recebido é o esperado.
     # Se for, envia o próximo bloco de dados.
     # Se o ACK for para o último bloco, transita para o estado FIM.
+    # Um ACK repetido do bloco anterior indica que o último DATA se perdeu; como cada pacote
+        # recebido recarrega o timeout no poller, se o RTO já se esgotou ele é tratado como timeout.
     # Se um erro for recebido, transita para o estado ERRO.
     def handle_tx(self):
         msg, addr = self.recebido
@@ -109,6 +137,7 @@ class TFTPlus_FsmTx(poller.Callback):
 
         if TFTP2_ProtoPacket.tipo(msg) == "ACK" and msg.ack.block_n == self.block_number:
             print("FEM[TX]: ACK correto recebido")
+            self._mede_rtt()
             if self.ultima_msg:
                 print("FEM[TX]: Última mensagem detectada, indo direto para FIM.")
                 self.state = EstadoTx.FIM
@@ -116,8 +145,11 @@ class TFTPlus_FsmTx(poller.Callback):
             else:
                 self.block_number += 1
                 self._enviar_data()
+        elif TFTP2_ProtoPacket.tipo(msg) == "ACK" and msg.ack.block_n == self.block_number - 1 and self._rto_esgotado():
+            print("FEM[TX]: ACK repetido após o RTO.")
+            self.handle_timeout()
         elif TFTP2_ProtoPacket.tipo(msg) == "ERROR":
-            print(f"FEM[TX]: Erro recebido: {msg.error.errormsg}")
+            print(f"FEM[TX]: Erro recebido: {msg.error.errorcode}")
             self._erro()
         else:
             print("FEM[TX]: Pacote inesperado recebido. Ignorando.")
@@ -148,6 +180,7 @@ class TFTPlus_FsmTx(poller.Callback):
 
         else:
             print("FEM[ULTIMA]: ACK final correto recebido. Indo para FIM.")
+            self._mede_rtt()
             self.state = EstadoTx.FIM
             self.terminado = True
 
@@ -155,6 +188,7 @@ class TFTPlus_FsmTx(poller.Callback):
     # Desabilita a FSM e o timeout, indicando que a transmissão foi concluída.
     # Imprime mensagem de conclusão.
     def handle_fim(self):
+        self._fechar_arquivo()
         self.disable()
         self.disable_timeout()
         print("FEM[FIM]: Transmissão finalizada.")
@@ -165,6 +199,7 @@ class TFTPlus_FsmTx(poller.Callback):
     def handle_erro(self):
         print("FEM[ERRO]: Transmissão abortada por erro.")
         self.terminado = True
+        self._fechar_arquivo()
         self.disable()
         self.disable_timeout()
 
@@ -173,19 +208,27 @@ class TFTPlus_FsmTx(poller.Callback):
         # atualiza o estado para TX e incrementa o número do bloco.
     # Se o tamanho do bloco for menor que 512 bytes, define a flag ultima_msg
         # para True, indicando que é o último bloco a ser enviado.
+    # O arquivo permanece aberto entre os blocos e a leitura é sequencial;
+        # só há seek se a posição do bloco não for a posição atual do arquivo.
     # Se ocorrer algum erro ao ler o arquivo, transita para o estado ERRO.
     def _enviar_data(self):
         try:
-            with open(self.filename, 'rb') as f:
-                f.seek((self.block_number - 1) * 512)
-                data_bytes = f.read(512)
-                msg = TFTP2_ProtoPacket.criar_data(self.block_number, data_bytes)
-                self.last_packet_sent = msg
-                data = TFTP2_ProtoPacket.to_bytes(msg)
-                self.client.sock.sendto(data, self.remote_tid)
-                print(f"FEM: Enviado DATA {self.block_number} ({len(data_bytes)} bytes)")
-                self.ultima_msg = len(data_bytes) < 512
-                self.state = EstadoTx.TX
+            if self.arquivo is None:
+                self.arquivo = open(self.filename, 'rb')
+                self.pos_arquivo = 0
+            pos = (self.block_number - 1) * 512
+            if pos != self.pos_arquivo:
+                self.arquivo.seek(pos)
+            data_bytes = self.arquivo.read(512)
+            self.pos_arquivo = pos + len(data_bytes)
+            msg = TFTP2_ProtoPacket.criar_data(self.block_number, data_bytes)
+            self.last_packet_sent = msg
+            data = TFTP2_ProtoPacket.to_bytes(msg)
+            self.fila.enfileira(data, self.remote_tid)
+            self._marca_envio()
+            print(f"FEM: Enviado DATA {self.block_number} ({len(data_bytes)} bytes)")
+            self.ultima_msg = len(data_bytes) < 512
+            self.state = EstadoTx.TX
         except Exception as e:
             print(f"FEM: Erro ao ler arquivo: {e}")
             self._erro()
@@ -197,19 +240,56 @@ class TFTPlus_FsmTx(poller.Callback):
         print("FEM: Entrando no estado de erro.")
         self.state = EstadoTx.ERRO
         self.terminado = True
+        self._fechar_arquivo()
         self.disable()
         self.disable_timeout()
 
+    # Método que fecha o arquivo transmitido.
+    def _fechar_arquivo(self):
+        if self.arquivo is not None:
+            self.arquivo.close()
+            self.arquivo = None
+
+    # Método que registra o envio de um pacote que aguarda resposta, para medir o RTT.
+    # Se o pacote é uma retransmissão, a resposta não fornece amostra (regra de Karn).
+    def _marca_envio(self, retransmissao=False):
+        self.enviado_em = self._relogio.agora()
+        self.retransmitido = retransmissao
+
+    # Método chamado quando chega a resposta esperada ao último pacote enviado.
+    # Usa o tempo decorrido como amostra de RTT, exceto se o pacote foi retransmitido,
+        # e ajusta o timeout da FSM ao novo RTO.
+    # Como houve resposta, zera a contagem de timeouts consecutivos, mesmo sem amostra.
+    def _mede_rtt(self):
+        self.timeouts = 0
+        if self.enviado_em is not None and not self.retransmitido:
+            self.rto.amostra((self._relogio.agora() - self.enviado_em) / poller.NS)
+            self.base_timeout = self.rto.rto
+        self.enviado_em = None
+
+    # Método que indica se o último pacote enviado aguarda resposta há mais que o RTO.
+    def _rto_esgotado(self):
+        return self.enviado_em is not None and self._relogio.agora() - self.enviado_em >= self.rto.rto * poller.NS
+
     # Método que trata o timeout da FSM.
     # Se a transmissão já foi concluída, chama o método handle_fim.
-    # Se o último pacote foi enviado, reenvia ele para o servidor e reativa o timeout.
+    # Caso contrário, dobra o RTO (backoff exponencial) e reenvia o último pacote;
+        # se não houver resposta após tentativas retransmissões, transita para o estado ERRO.
+    # A desistência conta os timeouts da própria FSM, e não os backoffs do estimador:
+        # estes só são zerados por uma amostra, que a regra de Karn pode impedir.
     def handle_timeout(self):
         if self.terminado:
             self.handle_fim()
             return
-        
+
+        self.timeouts += 1
+        self.rto.backoff()
+        self.base_timeout = self.rto.rto
+        if self.timeouts > self.tentativas:
+            print(f"FEM: Sem resposta após {self.tentativas} retransmissões. Abortando.")
+            self._erro()
         elif self.last_packet_sent:
-            print("FEM: Timeout detectado. Reenviando último pacote.")
-            data = TFTP2_ProtoPacket.to_bytes(self.last_packet_sent)
-            self.client.sock.sendto(data, self.remote_tid)
-            self.enable_timeout()
\ No newline at end of file
+            print(f"FEM: Timeout detectado. Reenviando último pacote (RTO {self.rto.rto:.3f} s).")
+            self.client.sock.sendto(TFTP2_ProtoPacket.to_bytes(self.last_packet_sent), self.remote_tid)
+            self._marca_envio(True)
+            self.enable_timeout()
@@ -0,0 +1,55 @@
+# Valores padrão do timeout de retransmissão (RTO), em segundos.
+RTO_MIN = 0.2   # Menor RTO permitido
+RTO_MAX = 60.0  # Maior RTO permitido, inclusive com backoff
+RTO_GRANULARIDADE = 0.001   # Menor margem somada ao SRTT (granularidade do relógio)
+TENTATIVAS = 5  # Retransmissões consecutivas sem resposta antes de abortar a sessão
+
+# Ganhos do estimador de Jacobson/Karels (RFC 6298).
+ALFA = 1 / 8    # Peso de uma nova amostra no SRTT
+BETA = 1 / 4    # Peso de uma nova amostra no RTTVAR
+K = 4   # Multiplicador do RTTVAR no cálculo do RTO
+
+# Classe EstimadorRTO calcula o timeout de retransmissão de uma sessão a partir das medidas
+    # de RTT (tempo entre o envio de um pacote e a chegada da resposta que ele provoca).
+# Usa o algoritmo de Jacobson/Karels: SRTT é a média móvel do RTT, RTTVAR a sua variação,
+    # e RTO = SRTT + max(G, K * RTTVAR), limitado a [rto_min, rto_max].
+# Pela regra de Karn, a FSM não deve fornecer amostras de pacotes retransmitidos, pois não
+    # se sabe a qual transmissão a resposta corresponde.
+# A cada timeout consecutivo, backoff() dobra o RTO; a próxima amostra válida o recalcula.
+class EstimadorRTO:
+    def __init__(self, rto_inicial=1.0, rto_min=RTO_MIN, rto_max=RTO_MAX):
+        if not 0 < rto_min <= rto_max:
+            raise ValueError("Deve valer 0 < rto_min <= rto_max.")
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self.rto = min(max(rto_inicial, rto_min), rto_max)  # Timeout de retransmissão atual
+        self.srtt = None    # RTT suavizado (None até a primeira amostra)
+        self.rttvar = None  # Variação do RTT
+        self.rtt = None # Última amostra de RTT
+        self.amostras = 0   # Número de amostras de RTT usadas
+        self.backoffs = 0   # Timeouts consecutivos desde a última amostra
+
+    # Acrescenta uma amostra de RTT, em segundos, e recalcula o RTO.
+    def amostra(self, rtt):
+        self.rtt = rtt
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALFA) * self.srtt + ALFA * rtt
+        self.amostras += 1
+        self.backoffs = 0
+        self._limita(self.srtt + max(RTO_GRANULARIDADE, K * self.rttvar))
+
+    # Dobra o RTO após um timeout (backoff exponencial).
+    def backoff(self):
+        self.backoffs += 1
+        self._limita(self.rto * 2)
+
+    def _limita(self, rto):
+        self.rto = min(max(rto, self.rto_min), self.rto_max)
+
+    def __repr__(self):
+        srtt = f"{self.srtt:.4f}" if self.srtt is not None else None
+        return f"EstimadorRTO(rto={self.rto:.4f}, srtt={srtt}, amostras={self.amostras}, backoffs={self.backoffs})"
@@ -0,0 +1,479 @@
+# Realiza a importação de módulos necessários para o servidor TFTP2.
+# Importa a classe TFTP2_ProtoPacket para manipulação de pacotes TFTP2, os códigos de erro
+    # definidos em tftp2.proto e a classe poller.Callback para tratar os eventos de cada sessão.
+import os
+import socket
+import stat
+import time
+from collections import OrderedDict
+from tftplus.TFTPlus_ProtoPacket import TFTP2_ProtoPacket
+from tftplus.TFTPlus_Buffer import AnelRecepcao, FilaEnvio, nao_bloqueante
+from tftplus.TFTPlus_FsmRx import BUFFER_ESCRITA
+from tftplus.tftp2_pb2 import FileNotFound, AccessViolation, IllegalOperation, UnknownTid, FileExists, Undefined # type: ignore
+from pypoller import poller
+
+TAM_BLOCO = 512 # Tamanho dos blocos de dados do TFTP2
+TENTATIVAS = 5  # Retransmissões por timeout antes de uma sessão ser abortada
+TAM_DATAGRAMA = 65507   # Maior datagrama UDP: limite da resposta de um LIST
+MAX_INDICE = 1024   # Número máximo de diretórios mantidos no índice de listagens
+
+# Uma listagem só é reaproveitada se foi lida pelo menos este tempo (em ns) depois da
+# última modificação do diretório. Como o mtime tem resolução limitada, uma mudança feita
+# logo após a leitura poderia manter o mesmo mtime e deixar a listagem desatualizada.
+GRANULARIDADE_MTIME = 1_000_000_000
+
+# Classe TFTPlus_Indice mantém as respostas de LIST já serializadas, por diretório.
+# Cada entrada guarda o mtime do diretório no momento da leitura: um LIST faz apenas
+    # um stat do diretório e, se o mtime não mudou, devolve a resposta pronta, sem percorrer
+    # o diretório nem fazer um stat por arquivo.
+# Criar, remover ou renomear entradas muda o mtime do diretório e invalida a listagem.
+# A alteração do conteúdo de um arquivo não muda o mtime do diretório: por isso o servidor
+    # invalida explicitamente o diretório de cada arquivo que recebe (invalida()).
+# As entradas menos usadas são descartadas quando o índice passa de max_entradas diretórios.
+class TFTPlus_Indice:
+    def __init__(self, max_entradas=MAX_INDICE):
+        self.entradas = OrderedDict()   # caminho -> (mtime_ns, instante da leitura, resposta)
+        self.max_entradas = max_entradas
+        self.acertos = 0    # LISTs atendidos pelo índice
+        self.leituras = 0   # LISTs que precisaram percorrer o diretório
+
+    # Retorna a resposta LIST_RESP serializada do diretório caminho.
+    # Lança FileNotFoundError ou NotADirectoryError se caminho não for um diretório.
+    def listagem(self, caminho):
+        st = os.stat(caminho)
+        if not stat.S_ISDIR(st.st_mode):
+            raise NotADirectoryError(caminho)
+        entrada = self.entradas.get(caminho)
+        if entrada is not None and entrada[0] == st.st_mtime_ns and entrada[1] - st.st_mtime_ns >= GRANULARIDADE_MTIME:
+            self.entradas.move_to_end(caminho)
+            self.acertos += 1
+            return entrada[2]
+
+        self.leituras += 1
+        lido = time.time_ns()
+        msg = TFTP2_ProtoPacket.criar_list_resp(self._le(caminho))
+        resposta = TFTP2_ProtoPacket.to_bytes(msg)
+        self.entradas[caminho] = (st.st_mtime_ns, lido, resposta)
+        self.entradas.move_to_end(caminho)
+        if len(self.entradas) > self.max_entradas:
+            self.entradas.popitem(last=False)
+        return resposta
+
+    # Descarta a listagem guardada do diretório caminho.
+    def invalida(self, caminho):
+        self.entradas.pop(caminho, None)
+
+    # Lê as entradas do diretório, em ordem alfabética: (nome, tamanho) para arquivos
+        # e (nome, None) para diretórios. O tamanho é limitado ao maior int32 do tftp2.proto.
+    @staticmethod
+    def _le(caminho):
+        entradas = []
+        with os.scandir(caminho) as it:
+            for e in it:
+                try:
+                    if e.is_dir():
+                        entradas.append((e.name, None))
+                    else:
+                        entradas.append((e.name, min(e.stat().st_size, 2**31 - 1)))
+                except OSError:
+                    continue
+        entradas.sort()
+        return entradas
+
+# Classe TFTPlus_Server implementa um servidor TFTP2 que atende, num único Poller, muitos
+    # clientes ao mesmo tempo.
+# RRQ e WRQ abrem uma sessão com socket próprio numa porta efêmera (um TID por sessão) e
+    # timeout próprio: TFTPlus_SessaoLeitura (o servidor transmite) ou TFTPlus_SessaoEscrita
+    # (o servidor recebe), em stop-and-wait com blocos de 512 bytes.
+# LIST, MKDIR e MOVE são respondidos diretamente pelo socket de escuta:
+    # LIST com um LIST_RESP (vindo do índice de listagens), MKDIR e MOVE com ACK do bloco 0.
+    # MOVE sem nome_novo remove o arquivo ou o diretório vazio nome_orig.
+# Os caminhos são relativos ao diretório raiz; caminhos que saiam dele são recusados.
+class TFTPlus_Server:
+    def __init__(self, root, ip='0.0.0.0', port=69, timeout=5, tentativas=TENTATIVAS,
+                 max_sessoes=None, sched=None, verbose=False):
+        if not os.path.isdir(root):
+            raise ValueError(f"Diretório raiz inexistente: {root}")
+        self.root = os.path.realpath(root) # Diretório raiz dos arquivos servidos
+        self.ip = ip
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self.max_sessoes = max_sessoes  # Limite de sessões simultâneas (None: sem limite)
+        self.verbose = verbose
+        self.sched = sched if sched is not None else poller.Poller()
+        self.sessoes = set()    # Sessões RRQ/WRQ em andamento
+        self.concluidas = 0
+        self.falhas = 0
+        self.indice = TFTPlus_Indice()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((ip, port))
+        nao_bloqueante(self.sock)
+        self.port = self.sock.getsockname()[1]
+        # Anel de recepção compartilhado por todas as sessões: cada sessão processa os
+            # pacotes lidos antes de devolver o controle ao poller
+        self.anel = AnelRecepcao(2048)
+        self.escuta = _Escuta(self)
+        self.sched.adiciona(self.escuta)
+
+    # Atende pedidos indefinidamente.
+    def serve(self):
+        print(f"Servidor: atendendo em {self.ip}:{self.port}, raiz {self.root}")
+        self.sched.despache(lote=True)
+
+    # Encerra as sessões em andamento e fecha o socket de escuta.
+    def close(self):
+        for sessao in list(self.sessoes):
+            sessao._encerra(False)
+        self.sched.remove(self.escuta)
+        self.sock.close()
+
+    # Trata um pedido recebido no socket de escuta, conforme o seu tipo.
+    def _pedido(self, msg, addr):
+        tipo = TFTP2_ProtoPacket.tipo(msg)
+        if tipo == 'RRQ' or tipo == 'WRQ':
+            self._sessao(tipo, msg.rrq if tipo == 'RRQ' else msg.wrq, addr)
+        elif tipo == 'LIST':
+            self._list(msg.list.path, addr)
+        elif tipo == 'MKDIR':
+            self._mkdir(msg.mkdir.path, addr)
+        elif tipo == 'MOVE':
+            self._move(msg.move.nome_orig, msg.move.nome_novo if msg.move.HasField('nome_novo') else None, addr)
+        else:
+            self._responde_erro(addr, IllegalOperation)
+
+    # Abre o arquivo pedido e cria a sessão de leitura (RRQ) ou de escrita (WRQ).
+    def _sessao(self, tipo, req, addr):
+        if req.mode == 3:   # mail não é suportado
+            self._responde_erro(addr, IllegalOperation)
+            return
+        if self.max_sessoes is not None and len(self.sessoes) >= self.max_sessoes:
+            self._responde_erro(addr, Undefined)
+            return
+        caminho = self._caminho(req.fname)
+        if caminho is None:
+            self._responde_erro(addr, AccessViolation)
+            return
+        try:
+            if tipo == 'RRQ':
+                arquivo = open(caminho, 'rb')
+            else:
+                arquivo = open(caminho, 'wb', buffering=BUFFER_ESCRITA)
+        except FileNotFoundError:
+            self._responde_erro(addr, FileNotFound)
+            return
+        except OSError:
+            self._responde_erro(addr, AccessViolation)
+            return
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind((self.ip, 0))
+        except OSError:
+            arquivo.close()
+            self._responde_erro(addr, Undefined)
+            return
+
+        if tipo == 'RRQ':
+            sessao = TFTPlus_SessaoLeitura(self, sock, addr, caminho, arquivo)
+        else:
+            sessao = TFTPlus_SessaoEscrita(self, sock, addr, caminho, arquivo)
+        self.sessoes.add(sessao)
+        self.sched.adiciona(sessao)
+        if self.verbose:
+            print(f"Servidor: {tipo} {req.fname} de {addr}")
+        try:
+            sessao.inicia()
+        except Exception as e:
+            sessao._falha(e)
+
+    # Responde um LIST com a listagem do diretório, obtida do índice.
+    def _list(self, path, addr):
+        caminho = self._caminho(path, raiz=True)
+        if caminho is None:
+            self._responde_erro(addr, AccessViolation)
+            return
+        try:
+            resposta = self.indice.listagem(caminho)
+        except (FileNotFoundError, NotADirectoryError):
+            self._responde_erro(addr, FileNotFound)
+            return
+        except OSError:
+            self._responde_erro(addr, AccessViolation)
+            return
+        if len(resposta) > TAM_DATAGRAMA:
+            self._responde_erro(addr, Undefined)
+            return
+        self._responde(addr, resposta)
+
+    # Cria o diretório pedido e responde com ACK 0, ou com o erro correspondente.
+    def _mkdir(self, path, addr):
+        caminho = self._caminho(path)
+        if caminho is None:
+            self._responde_erro(addr, AccessViolation)
+            return
+        try:
+            os.mkdir(caminho)
+        except FileExistsError:
+            self._responde_erro(addr, FileExists)
+            return
+        except FileNotFoundError:
+            self._responde_erro(addr, FileNotFound)
+            return
+        except OSError:
+            self._responde_erro(addr, AccessViolation)
+            return
+        self.indice.invalida(os.path.dirname(caminho))
+        self._responde(addr, TFTP2_ProtoPacket.to_bytes(TFTP2_ProtoPacket.criar_ack(0)))
+
+    # Renomeia nome_orig para nome_novo, ou remove nome_orig se nome_novo não for informado.
+    # Responde com ACK 0, ou com o erro correspondente.
+    def _move(self, nome_orig, nome_novo, addr):
+        orig = self._caminho(nome_orig, link=True)
+        novo = self._caminho(nome_novo, link=True) if nome_novo is not None else None
+        if orig is None or (nome_novo is not None and novo is None):
+            self._responde_erro(addr, AccessViolation)
+            return
+        try:
+            if novo is None:
+                if os.path.isdir(orig) and not os.path.islink(orig):
+                    os.rmdir(orig)
+                else:
+                    os.remove(orig)
+            else:
+                if os.path.lexists(novo):
+                    self._responde_erro(addr, FileExists)
+                    return
+                os.rename(orig, novo)
+                self.indice.invalida(os.path.dirname(novo))
+        except FileNotFoundError:
+            self._responde_erro(addr, FileNotFound)
+            return
+        except OSError:
+            self._responde_erro(addr, AccessViolation)
+            return
+        self.indice.invalida(os.path.dirname(orig))
+        self._responde(addr, TFTP2_ProtoPacket.to_bytes(TFTP2_ProtoPacket.criar_ack(0)))
+
+    # Converte um caminho pedido num caminho dentro do diretório raiz.
+    # Retorna None se o caminho ficar fora da raiz, ou se for a própria raiz e raiz=False.
+    # Com link=True, o último componente não é resolvido: um link simbólico designa o
+        # próprio link, e não o seu destino (usado pelo MOVE, que renomeia ou remove o link).
+    def _caminho(self, path, raiz=False, link=False):
+        if '\0' in path:   # o sistema operacional não aceita NUL em caminhos
+            return None
+        caminho = os.path.abspath(os.path.join(self.root, path.lstrip('/')))
+        if link and caminho != self.root:
+            caminho = os.path.join(os.path.realpath(os.path.dirname(caminho)), os.path.basename(caminho))
+        else:
+            caminho = os.path.realpath(caminho)
+        if os.path.commonpath((self.root, caminho)) != self.root:
+            return None
+        if caminho == self.root and not raiz:
+            return None
+        return caminho
+
+    # Envia uma resposta pelo socket de escuta.
+    def _responde(self, addr, dados):
+        try:
+            self.sock.sendto(dados, addr)
+        except OSError:
+            pass
+
+    # Envia um pacote de erro pelo socket de escuta.
+    def _responde_erro(self, addr, codigo):
+        if self.verbose:
+            print(f"Servidor: erro {codigo} para {addr}")
+        self._responde(addr, TFTP2_ProtoPacket.to_bytes(TFTP2_ProtoPacket.criar_error(codigo)))
+
+    # Chamado por uma sessão ao terminar: remove-a do poller e contabiliza o resultado.
+    def _fim_sessao(self, sessao, sucesso):
+        self.sessoes.discard(sessao)
+        self.sched.remove(sessao)
+        if sucesso:
+            self.concluidas += 1
+        else:
+            self.falhas += 1
+        if self.verbose:
+            print(f"Servidor: sessão {sessao.caminho} com {sessao.remote_tid} {'concluída' if sucesso else 'abortada'}")
+
+# Callback do socket de escuta: lê todos os pedidos disponíveis e os repassa ao servidor.
+class _Escuta(poller.Callback):
+    def __init__(self, servidor):
+        super().__init__(servidor.sock, 0)
+        self.servidor = servidor
+        self.disable_timeout()
+
+    def handle(self):
+        for data, addr in self.servidor.anel.drena(self.fd):
+            try:
+                msg = TFTP2_ProtoPacket.from_bytes(data)
+            except Exception:
+                self.servidor._responde_erro(addr, IllegalOperation)
+                continue
+            # Um erro inesperado num pedido é respondido só a quem o fez, sem derrubar o servidor
+            try:
+                self.servidor._pedido(msg, addr)
+            except Exception as e:
+                if self.servidor.verbose:
+                    print(f"Servidor: erro no pedido de {addr}: {e}")
+                self.servidor._responde_erro(addr, Undefined)
+
+# Classe base das sessões do servidor TFTP2: cada uma tem seu socket (TID), seu arquivo,
+    # sua fila de envio e seu timeout.
+# Pacotes vindos de outro endereço recebem um erro UnknownTid e são descartados.
+# A cada timeout o último envio é repetido, até tentativas vezes; depois a sessão é abortada.
+class _Sessao(poller.Callback):
+    def __init__(self, servidor, sock, addr, caminho, arquivo):
+        super().__init__(nao_bloqueante(sock), servidor.timeout)
+        self.servidor = servidor
+        self.remote_tid = addr
+        self.caminho = caminho
+        self.arquivo = arquivo
+        self.fila = FilaEnvio(sock)
+        self.block_number = 1
+        self.tentativas = 0
+        self.terminado = False
+
+    # Lê todos os datagramas disponíveis no socket da sessão e os processa com mef().
+    def handle(self):
+        if self.terminado:
+            return
+        try:
+            for data, addr in self.servidor.anel.drena(self.fd):
+                if addr != self.remote_tid:
+                    self.fila.enfileira(TFTP2_ProtoPacket.to_bytes(TFTP2_ProtoPacket.criar_error(UnknownTid)), addr)
+                    continue
+                try:
+                    msg = TFTP2_ProtoPacket.from_bytes(data)
+                except Exception:
+                    self._encerra(False)
+                    return
+                tipo = TFTP2_ProtoPacket.tipo(msg)
+                if tipo == 'ERROR':
+                    self._encerra(False)
+                    return
+                self.tentativas = 0
+                self.mef(tipo, msg)
+                if self.terminado:
+                    return
+            self.fila.descarrega()
+        except Exception as e:
+            self._falha(e)
+
+    # Trata o timeout da sessão: repete o último envio ou aborta a sessão.
+    def handle_timeout(self):
+        if self.terminado:
+            return
+        self.tentativas += 1
+        if self.tentativas > self.servidor.tentativas:
+            self._encerra(False)
+            return
+        try:
+            self._retransmite()
+            self.fila.descarrega()
+        except Exception as e:
+            self._falha(e)
+
+    # Aborta só esta sessão após um erro inesperado (de E/S do arquivo ou do socket, ou
+        # outro qualquer), para que ele não se propague ao poller e derrube as demais.
+    def _falha(self, e):
+        if self.servidor.verbose:
+            print(f"Servidor: erro na sessão {self.caminho} com {self.remote_tid}: {e}")
+        self._encerra(False)
+
+    # Encerra a sessão: envia o que restar na fila, fecha o arquivo e o socket e avisa o servidor.
+    def _encerra(self, sucesso):
+        if self.terminado:
+            return
+        self.terminado = True
+        try:
+            self.fila.descarrega()
+        except OSError:
+            pass
+        try:
+            self.arquivo.close()
+        except OSError:
+            sucesso = False
+        self.servidor._fim_sessao(self, sucesso)
+        self.fd.close()
+
+    def mef(self, tipo, msg):
+        raise NotImplementedError()
+
+    def _retransmite(self):
+        raise NotImplementedError()
+
+# Sessão de leitura (RRQ): envia um bloco por vez e avança a cada ACK do bloco atual.
+# A sessão termina com o ACK do último bloco (menor que 512 bytes).
+class TFTPlus_SessaoLeitura(_Sessao):
+    def __init__(self, servidor, sock, addr, caminho, arquivo):
+        super().__init__(servidor, sock, addr, caminho, arquivo)
+        self.ultimo = None  # Último pacote DATA enviado, serializado
+        self.ultima_msg = False
+
+    def inicia(self):
+        self._enviar_data()
+        self.fila.descarrega()
+
+    def mef(self, tipo, msg):
+        if tipo != 'ACK' or msg.ack.block_n != self.block_number:
+            return
+        if self.ultima_msg:
+            self._encerra(True)
+            return
+        self.block_number += 1
+        self._enviar_data()
+
+    # Lê o próximo bloco do arquivo (a leitura é sequencial) e o coloca na fila de envio.
+    def _enviar_data(self):
+        data_bytes = self.arquivo.read(TAM_BLOCO)
+        self.ultimo = TFTP2_ProtoPacket.to_bytes(TFTP2_ProtoPacket.criar_data(self.block_number, data_bytes))
+        self.fila.enfileira(self.ultimo, self.remote_tid)
+        self.ultima_msg = len(data_bytes) < TAM_BLOCO
+
+    def _retransmite(self):
+        self.fila.enfileira(self.ultimo, self.remote_tid)
+
+# Sessão de escrita (WRQ): confirma cada bloco recebido em ordem com um ACK.
+# Um bloco repetido (o ACK anterior se perdeu) é confirmado de novo.
+# Após o último bloco, a sessão permanece ativa por mais um timeout para repetir o ACK
+    # final caso o cliente não o receba; o índice de listagens do diretório é invalidado,
+    # pois o tamanho do arquivo mudou.
+class TFTPlus_SessaoEscrita(_Sessao):
+    def __init__(self, servidor, sock, addr, caminho, arquivo):
+        super().__init__(servidor, sock, addr, caminho, arquivo)
+        self.recebido = False   # Se o último bloco já foi recebido
+
+    def inicia(self):
+        self._enviar_ack(0)
+        self.fila.descarrega()
+
+    def mef(self, tipo, msg):
+        if tipo != 'DATA':
+            return
+        if self.recebido or msg.data.block_n != self.block_number:
+            if msg.data.block_n == self.block_number - 1:
+                self._enviar_ack(msg.data.block_n)
+            return
+        self.arquivo.write(msg.data.message)
+        self._enviar_ack(self.block_number)
+        self.block_number += 1
+        if len(msg.data.message) < TAM_BLOCO:
+            self.recebido = True
+            self.arquivo.close()
+            self.servidor.indice.invalida(os.path.dirname(self.caminho))
+
+    def _enviar_ack(self, bloco):
+        self.fila.enfileira(TFTP2_ProtoPacket.to_bytes(TFTP2_ProtoPacket.criar_ack(bloco)), self.remote_tid)
+
+    # Ao encerrar, mesmo por erro, o diretório é invalidado: o arquivo pode ter ficado incompleto.
+    def _encerra(self, sucesso):
+        super()._encerra(sucesso)
+        self.servidor.indice.invalida(os.path.dirname(self.caminho))
+
+    # Em timeout, repete o ACK do último bloco recebido; terminado o período de espera
+        # após o último bloco, a sessão é concluída.
+    def _retransmite(self):
+        if self.recebido:
+            self._encerra(True)
+        else:
+            self._enviar_ack(self.block_number - 1)
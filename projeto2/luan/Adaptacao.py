@@ -28,8 +28,16 @@ class Adaptacao(Subcamada):
 
         print('> ', end='', flush=True)
 
+    def notifica_enlace(self, ativo):
+        # Chamado pelo ARQ quando o enlace cai (retransmissões esgotadas) ou volta
+        if ativo:
+            print("\n[ENLACE] Enlace restabelecido")
+        else:
+            print("\n[ENLACE] Enlace caído: sem resposta do outro lado. As mensagens ficam na fila.")
+        print('> ', end='', flush=True)
+
     def recebe(self, dados: bytes):
         # Chamado pela pilha de enlace quando chegar um quadro decodificado
-        texto = dados.decode('ascii', errors='ignore').rstrip()
+        texto = bytes(dados).decode('ascii', errors='ignore').rstrip()
         print(f"\nRX: {texto}")
         print('> ', end='', flush=True)
\ No newline at end of file
@@ -6,6 +6,11 @@ class DeteccaoErros(Subcamada):
     Subcamada de detecção de erros usando CRC16 (RFC 1662).
     - Ao enviar: adiciona CRC ao quadro.
     - Ao receber: verifica CRC antes de passar para camada superior.
+      Quadros descartados são avisados com upper.quadro_corrompido(), se a
+      camada superior o tiver, para que o ARQ peça a retransmissão sem
+      esperar o timeout.
+    O cálculo é feito pelo Enquadramento, na mesma passada do stuffing
+    e do destuffing; esta subcamada decide o que fazer com o resultado.
     """
 
     def __init__(self):
@@ -14,30 +19,41 @@ class DeteccaoErros(Subcamada):
     def envia(self, dados: bytes):
         """
         Chamado pela camada superior.
-        Calcula e adiciona CRC ao final antes de enviar.
+        Pede ao Enquadramento que calcule e adicione o CRC ao final.
         """
-        crc = CRC16(dados)
-        quadro_com_crc = crc.gen_crc()
-        print(f"[DeteccaoErros] Enviando quadro com CRC: {quadro_com_crc}")
+        print(f"[DeteccaoErros] Enviando quadro: {dados}")
 
         if self.lower is not None:
-            self.lower.envia(bytes(quadro_com_crc))
+            self.lower.envia(dados, fcs=True)
         else:
             print("[DeteccaoErros] Nenhuma camada inferior conectada! Quadro não enviado.")
 
-    def recebe(self, dados: bytes):
+    def envia_quadros(self, quadros):
+        """
+        Envia vários quadros numa só escrita, cada um com seu CRC.
+        """
+        if self.lower is not None:
+            self.lower.envia_quadros(quadros, fcs=True)
+        else:
+            print("[DeteccaoErros] Nenhuma camada inferior conectada! Quadros não enviados.")
+
+    def recebe(self, dados: bytes, fcs_ok=None):
         """
         Chamado pela camada inferior.
         Verifica CRC; se estiver correto, entrega dados sem o CRC.
+        fcs_ok: resultado da verificação já feita pelo Enquadramento;
+        se None, o CRC é verificado aqui.
         """
         if len(dados) < 2:
             print("[DeteccaoErros] Quadro muito curto para conter CRC, descartado.")
+            self._avisa_corrompido()
             return
 
-        crc = CRC16(dados)
-        if crc.check_crc():
+        if fcs_ok is None:
+            fcs_ok = CRC16(dados).check_crc()
+        if fcs_ok:
             payload = dados[:-2]
-            print(f"[DeteccaoErros] CRC ok, entregando payload: {payload}")
+            print(f"[DeteccaoErros] CRC ok, entregando payload: {bytes(payload)}")
 
             if self.upper is not None:
                 self.upper.recebe(payload)
@@ -45,3 +61,13 @@ class DeteccaoErros(Subcamada):
                 print("[DeteccaoErros] Nenhuma camada superior conectada!")
         else:
             print("[DeteccaoErros] Erro de CRC! Quadro descartado.")
+            self._avisa_corrompido()
+
+    def _avisa_corrompido(self):
+        """
+        Avisa a camada superior do quadro descartado, se ela tratar o aviso:
+        uma camada que só recebe dados (ex: Serial_rx.Receptor) não o trata.
+        """
+        aviso = getattr(self.upper, 'quadro_corrompido', None)
+        if aviso is not None:
+            aviso()
@@ -1,25 +1,36 @@
 from Subcamada import Subcamada
-from FsmEnq import FsmEnq, FLAG
+from FsmEnq import FsmEnq, FLAG, ESCAPE, XOR_MASK
+from crc16.crc import FCS16
+import os
 import time
 
+# Máximo de bytes lidos de uma vez no modo em lote, quando o dispositivo
+# não informa quantos bytes há disponíveis (in_waiting)
+TAM_LEITURA = 4096
+
 class Enquadramento(Subcamada):
     """
     Enquadramento: subcamada responsável por:
     - Fazer stuffing/destuffing
     - Delimitar quadros com FLAG
     - Controlar timeout durante recepção de quadros
+    - Calcular o FCS (CRC-16) na mesma passada do stuffing, ao enviar,
+      e à medida que os bytes chegam, ao receber
     Herda de Subcamada → que herda de Callback (pypoller)
     """
 
-    def __init__(self, porta_serial, tout=0.5):
+    def __init__(self, porta_serial, tout=0.5, lote=True):
         """
         porta_serial: instância de serial.Serial (ou SerialFake)
         tout: timeout em segundos
+        lote: se True, cada chamada de handle lê todos os bytes disponíveis
+        e os entrega de uma vez à FSM; se False, lê um byte por vez
         """
         super().__init__(porta_serial, tout)
         self.disable_timeout()  # desativa timeout por padrão
         self.dev = porta_serial
         self.tout = tout
+        self.lote = lote
         self.poller = None  # será configurado no main com conecta_poller()
 
         # Cria FSM, passando:
@@ -34,18 +45,31 @@ class Enquadramento(Subcamada):
     def handle(self):
         """
         Chamado pelo poller quando há dados na serial.
-        Lê um byte e envia para FSM.
+        No modo em lote, lê tudo o que estiver disponível e envia para a FSM
+        de uma vez; senão, lê um byte e envia para FSM.
         """
-        # n = self.dev.in_waiting if hasattr(self.dev, 'in_waiting') else 1
-        # dados = self.dev.read(n)
-        # for b in dados:
-        #     self.fsm.input_byte(b)
+        if self.lote:
+            dados = self._le_disponivel()
+            if dados:
+                print(f"[ENQ] {time.time():.3f}: {len(dados)} bytes recebidos")
+                self.fsm.input_bytes(dados)
+            return
         octeto = self.dev.read(1)
         if octeto:
             byte = octeto[0]
             print(f"[ENQ] {time.time():.3f}: Byte recebido: {byte:02X}")
             self.fsm.input_byte(byte)
 
+    def _le_disponivel(self):
+        """
+        Lê os bytes disponíveis na serial sem esperar por mais: usa
+        in_waiting se o dispositivo o tiver (pyserial), ou então um os.read
+        do descritor, que retorna o que houver (o poller já indicou dados).
+        """
+        if hasattr(self.dev, 'in_waiting'):
+            return self.dev.read(max(self.dev.in_waiting, 1))
+        return os.read(self.dev.fileno(), TAM_LEITURA)
+
     def handle_timeout(self):
         """
         Chamado pelo poller quando o timeout estoura.
@@ -54,35 +78,52 @@ class Enquadramento(Subcamada):
         print("[Enquadramento] Timeout detectado pelo poller")
         self.fsm.timeout()
 
-    def envia(self, dados: bytes):
+    def envia(self, dados: bytes, fcs=False):
         """
         Recebe dados da camada superior, faz stuffing e envia para serial.
+        Se fcs=True, o FCS dos dados é calculado e anexado ao quadro
+        (também com stuffing), antes da FLAG final.
         """
-        quadro = bytearray()
-        quadro.append(FLAG)
-        quadro.append(FLAG)
-
-        for byte in dados:
-            if byte in (FLAG, 0x7D):
-                quadro.append(0x7D)
-                quadro.append(byte ^ 0x20)
-            else:
-                quadro.append(byte)
+        self.envia_quadros([dados], fcs)
 
-        quadro.append(FLAG)
+    def envia_quadros(self, quadros, fcs=False):
+        """
+        Envia vários quadros numa única escrita na serial: FLAG, quadro,
+        FLAG, quadro, ..., FLAG. Quadros consecutivos compartilham a FLAG
+        que os separa, que o receptor (FsmEnq) trata como fim de um e
+        início do outro.
+        """
+        saida = bytearray((FLAG,))
+        for dados in quadros:
+            saida += self.stuffing(dados, fcs)
+            saida.append(FLAG)
+        self.dev.write(saida)
+        print(f"[Enquadramento] {len(quadros)} quadro(s) enviado(s): {list(saida)}")
 
-        self.dev.write(bytes([FLAG]))
-        self.dev.write(quadro)
-        print(f"[Enquadramento] Quadro enviado: {list(quadro)}")
+    @staticmethod
+    def stuffing(dados, fcs=False):
+        """
+        Faz o stuffing de dados (e do FCS, se fcs=True) com bytes.replace,
+        que percorre o quadro em C: primeiro os ESCAPE, depois as FLAG, para
+        que os ESCAPE inseridos não sejam escapados de novo.
+        """
+        dados = bytes(dados)
+        if fcs:
+            crc = FCS16()
+            crc.update(dados)
+            dados += crc.gen_fcs()
+        dados = dados.replace(bytes((ESCAPE,)), bytes((ESCAPE, ESCAPE ^ XOR_MASK)))
+        return dados.replace(bytes((FLAG,)), bytes((ESCAPE, FLAG ^ XOR_MASK)))
 
-    def recebe_quadro(self, quadro: bytes):
+    def recebe_quadro(self, quadro: bytes, fcs_ok: bool):
         """
         Chamado pela FSM quando um quadro completo é recebido.
-        Passa para camada superior.
+        Passa para camada superior, junto com o resultado da verificação
+        do FCS feita pela FSM.
         """
         print(f"[Enquadramento] Quadro completo recebido: {list(quadro)}")
         if self.upper:
-            self.upper.recebe(quadro)
+            self.upper.recebe(quadro, fcs_ok)
 
     def handle_fsm_timeout(self, ligar: bool):
         """
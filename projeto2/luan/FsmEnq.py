@@ -1,4 +1,5 @@
 from enum import Enum, auto
+from crc16.crc import FCS16
 
 FLAG = 0x7E
 ESCAPE = 0x7D
@@ -9,15 +10,29 @@ class State(Enum):
     OCIOSO = auto()
     RX = auto()
     ESCAPE = auto()
+    DESCARTE = auto()  # quadro excedeu MAX_LEN: descarta bytes até a próxima FLAG
 
 class FsmEnq:
     def __init__(self, timeout_handler, on_frame_callback):
         """
         timeout_handler: função que liga (True) ou desliga (False) o timer
-        on_frame_callback: função chamada ao receber quadro completo
+        on_frame_callback: função chamada ao receber quadro completo, com o quadro
+            e o resultado da verificação do FCS (True se correto)
+        O FCS é calculado à medida que os bytes chegam, já sem o escape,
+            para que o quadro não precise ser lido de novo para verificá-lo.
+        A FLAG que encerra um quadro também abre o seguinte, então quadros
+            consecutivos podem compartilhar a FLAG que os separa.
+        O quadro é montado num bytearray de MAX_LEN bytes, alocado uma só vez,
+            e entregue como um memoryview sobre ele: o quadro só é válido durante
+            a chamada de on_frame_callback, e quem precisar guardá-lo deve copiá-lo.
+        Um quadro com mais de MAX_LEN bytes é descartado, e os bytes seguintes
+            também, até a próxima FLAG; a memória usada não depende da entrada.
         """
         self.state = State.OCIOSO
-        self.buffer = []
+        self.buffer = bytearray(MAX_LEN)
+        self.visao = memoryview(self.buffer)
+        self.pos = 0  # bytes do quadro atual no buffer
+        self.fcs = FCS16()
         self.fsm_timeout_handler = timeout_handler
         self.on_frame_callback = on_frame_callback
 
@@ -26,7 +41,24 @@ class FsmEnq:
         print("[FSM] Reset: voltando para OCIOSO")
         self.state = State.OCIOSO
         self.fsm_timeout_handler(False)  # desativa timeout
-        self.buffer.clear()
+        self.pos = 0
+        self.fcs.clear()
+
+    def proximo_quadro(self):
+        """Após a FLAG de fim de quadro: começa um novo quadro, sem timeout
+        enquanto nenhum byte dele chegar"""
+        self.state = State.RX
+        self.fsm_timeout_handler(False)  # desativa timeout
+        self.pos = 0
+        self.fcs.clear()
+
+    def descarta(self):
+        """Quadro excedeu MAX_LEN: ignora os bytes até a próxima FLAG"""
+        print("[FSM] Erro: quadro excedeu tamanho máximo, descartando até a próxima FLAG")
+        self.state = State.DESCARTE
+        self.fsm_timeout_handler(False)  # desativa timeout
+        self.pos = 0
+        self.fcs.clear()
 
     def input_byte(self, byte):
         """Recebe um byte e despacha para o handler do estado atual"""
@@ -37,11 +69,59 @@ class FsmEnq:
                 self.rx_handler(byte)
             case State.ESCAPE:
                 self.escape_handler(byte)
+            case State.DESCARTE:
+                self.descarte_handler(byte)
+
+    def input_bytes(self, dados):
+        """
+        Recebe de uma vez um bloco de bytes (bytes ou bytearray) e produz os
+        mesmos quadros que input_byte produziria byte a byte, inclusive o
+        descarte por MAX_LEN. Os trechos sem FLAG nem ESCAPE são localizados
+        com find e copiados para o buffer do quadro em bloco; só o byte após
+        cada ESCAPE passa pelo handler do estado ESCAPE.
+        O timeout é renovado uma vez por bloco, se um quadro ficar incompleto.
+        """
+        i = 0
+        n = len(dados)
+        while i < n:
+            if self.state in (State.OCIOSO, State.DESCARTE):
+                j = dados.find(FLAG, i)
+                if j < 0:
+                    break  # bytes fora de quadro são ignorados
+                self.input_byte(FLAG)
+                i = j + 1
+            elif self.state == State.ESCAPE:
+                self.escape_handler(dados[i])
+                i += 1
+            else:
+                fim = dados.find(FLAG, i)
+                if fim < 0:
+                    fim = n
+                esc = dados.find(ESCAPE, i, fim)
+                trecho = dados[i:fim if esc < 0 else esc]
+                if self.pos + len(trecho) > MAX_LEN:
+                    self.descarta()
+                    i = fim
+                    continue
+                self.buffer[self.pos:self.pos + len(trecho)] = trecho
+                self.pos += len(trecho)
+                self.fcs.update(trecho)
+                if esc >= 0:
+                    self.state = State.ESCAPE
+                    i = esc + 1
+                elif fim < n:
+                    self.rx_handler(FLAG)  # fim do quadro
+                    i = fim + 1
+                else:
+                    i = n
+        if self.state == State.ESCAPE or (self.state == State.RX and self.pos > 0):
+            self.fsm_timeout_handler(True)  # renova timeout
 
     def ocioso_handler(self, byte):
         if byte == FLAG:
             print("[FSM] FLAG recebida: iniciando recepção de quadro")
-            self.buffer.clear()
+            self.pos = 0
+            self.fcs.clear()
             self.state = State.RX
             self.fsm_timeout_handler(True)  # ativa timeout
         # outros bytes são ignorados
@@ -51,34 +131,38 @@ class FsmEnq:
     def rx_handler(self, byte):
         if byte == FLAG:
             # fim do quadro
-            print(f"[FSM] Quadro recebido: {self.buffer}")
-            if self.on_frame_callback and len(self.buffer) > 0:
-                self.on_frame_callback(bytes(self.buffer))
-            self.reset()
+            print(f"[FSM] Quadro recebido: {self.pos} bytes")
+            if self.on_frame_callback and self.pos > 0:
+                self.on_frame_callback(self.visao[:self.pos], self.fcs.check_fcs())
+            self.proximo_quadro()
         elif byte == ESCAPE:
             print("[FSM] ESCAPE recebido, próximo byte será processado")
             self.state = State.ESCAPE
             self.fsm_timeout_handler(True)  # renova timeout
-        elif len(self.buffer) < MAX_LEN:
-            self.buffer.append(byte)
+        elif self.pos < MAX_LEN:
+            self.buffer[self.pos] = byte
+            self.pos += 1
+            self.fcs.update_byte(byte)
             self.fsm_timeout_handler(True)  # renova timeout
-        # else:
-        #     print("[FSM] Erro: quadro excedeu tamanho máximo")
-        #     self.reset()
         else:
-            self.buffer.append(byte)
-            self.fsm_timeout_handler(True)
+            self.descarta()
 
     def escape_handler(self, byte):
-        if len(self.buffer) < MAX_LEN:
+        if self.pos < MAX_LEN:
             valor = byte ^ XOR_MASK
-            self.buffer.append(valor)
+            self.buffer[self.pos] = valor
+            self.pos += 1
+            self.fcs.update_byte(valor)
             print(f"[FSM] Byte escapado adicionado: {valor}")
             self.state = State.RX
             self.fsm_timeout_handler(True)  # renova timeout
         else:
-            print("[FSM] Erro: quadro excedeu tamanho máximo após ESCAPE")
-            self.reset()
+            self.descarta()
+
+    def descarte_handler(self, byte):
+        if byte == FLAG:
+            print("[FSM] FLAG recebida: fim do descarte")
+            self.proximo_quadro()
 
     def timeout(self):
         print("[FSM] Timeout: quadro descartado")
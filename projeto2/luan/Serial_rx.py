@@ -10,7 +10,7 @@ class Receptor:
     Camada superior apenas imprimir os dados recebidos.
     """
     def recebe(self, dados: bytes):
-        texto = dados.decode('ascii', errors='ignore').rstrip()
+        texto = bytes(dados).decode('ascii', errors='ignore').rstrip()
         print(f"RX: {texto}")
 
 if __name__ == '__main__':
@@ -14,6 +14,18 @@ class Subcamada(Callback):
     def recebe(self, dados):
         raise NotImplementedError('abstrato')
     
+    def notifica_enlace(self, ativo):
+        # Avisa que o enlace caiu (ativo=False) ou voltou; por padrão, repassa para cima
+        if self.upper is not None:
+            self.upper.notifica_enlace(ativo)
+
+    def quadro_corrompido(self):
+        # Avisa que um quadro foi descartado por erro; por padrão, repassa para cima,
+        # se a camada de cima tratar o aviso
+        aviso = getattr(self.upper, 'quadro_corrompido', None)
+        if aviso is not None:
+            aviso()
+
     def conecta(self, acima):
         self.upper = acima
         # self.lower = self #redundante, mas pode ser útil
\ No newline at end of file
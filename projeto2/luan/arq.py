@@ -1,42 +1,245 @@
 from Subcamada import Subcamada
+from pypoller.poller import Callback
 from collections import deque
-from fsm_arq import FsmARQ
+import time
+from fsm_arq import FsmARQ, FsmGoBackN, FsmSelectiveRepeat, State
+from rto import EstimadorRTO, TENTATIVAS, tempo_transmissao
 
 TYPE_DATA = 0x00
 TYPE_ACK  = 0x01
+TYPE_ACK_DATA = 0x02  # ACK de carona: [TYPE_ACK_DATA, n] seguido de um quadro DATA completo
+TYPE_NAK  = 0x03  # pede a retransmissão do quadro n: [TYPE_NAK, n]
+
+# Modos de operação do ARQ
+MODO_PARE_ESPERE = 'pe'
+MODO_GBN = 'gbn'
+MODO_SR = 'sr'
+
+JANELA = 4  # janela padrão dos modos Go-Back-N e Selective Repeat
+MODULO = 256  # espaço de números de sequência padrão (o campo tem 1 byte)
+SOBRECARGA = 5  # bytes que o quadro ganha abaixo do ARQ: cabeçalho (2), CRC (2) e FLAG (1)
+ATRASO_ACK = 0.02  # tempo máximo que um ACK espera por um quadro DATA de volta, em segundos
+
+class TimerARQ(Callback):
+    """
+    Temporizador de retransmissão, registrado no poller como um timer.
+    chave: número de sequência do quadro (Selective Repeat) ou 0 para o
+    temporizador único (pare-e-espere e Go-Back-N).
+    """
+    def __init__(self, arq, chave, tout):
+        super().__init__(None, tout)
+        self.arq = arq
+        self.chave = chave
+        self.tempo_tx = 0.0  # tempo de transmissão somado ao RTO, em segundos
+        self.tentativas = 0  # timeouts consecutivos deste temporizador
+        self.disable_timeout()  # só conta depois de um envio
+
+    def handle_timeout(self):
+        self.arq.handle_timeout(self.chave)
+
+class TimerAck(Callback):
+    """
+    Temporizador do ACK atrasado: se nenhum quadro DATA sair antes do
+    timeout para levar os ACKs pendentes de carona, eles são enviados sozinhos.
+    """
+    def __init__(self, arq, tout):
+        super().__init__(None, tout)
+        self.arq = arq
+        self.disable_timeout()
+
+    def handle_timeout(self):
+        self.arq._descarrega_acks()
 
 class ARQ(Subcamada):
     """
-    Subcamada ARQ pare-e-espere com fila.
+    Subcamada ARQ com fila.
+    modo: MODO_PARE_ESPERE (padrão), MODO_GBN ou MODO_SR.
+    janela: quadros enviados e ainda não confirmados admitidos (GBN e SR).
+    modulo: quantidade de números de sequência; deve valer
+    janela <= modulo - 1 no Go-Back-N e janela <= modulo / 2 no Selective Repeat.
+    tout: timeout de retransmissão inicial, em segundos; depois da primeira
+    confirmação, o RTO acompanha o RTT medido (ver rto.EstimadorRTO).
+    taxa: taxa da serial, em bits/s; o tempo de transmissão dos quadros
+    enviados é somado ao RTO. Se None, esse tempo é desprezado.
+    tentativas: timeouts consecutivos de um quadro até o enlace ser
+    considerado caído; a camada superior é avisada com notifica_enlace().
+    carona: se True, os ACKs seguem no cabeçalho de um quadro DATA no
+    sentido contrário (piggybacking), em vez de ocuparem um quadro próprio.
+    Um ACK só espera se houver dados na fila à espera da janela, que saem
+    quando ela abrir; a espera dura no máximo atraso_ack segundos (limitado
+    a metade do RTO mínimo), e o temporizador de retransmissão soma essa
+    espera ao RTO. Sem dados na fila, o ACK é enviado na hora. Exige o
+    poller (conecta_poller).
+    nak: se True, um quadro corrompido ou fora de sequência faz o receptor
+    pedir na hora, com um NAK, o quadro esperado, em vez de esperar o
+    timeout do transmissor. Um mesmo quadro só é pedido de novo depois de
+    um RTO, para que uma rajada de erros não gere uma rajada de NAKs.
     """
-    def __init__(self):
+    def __init__(self, modo=MODO_PARE_ESPERE, janela=None, modulo=None, tout=1.0,
+                 taxa=None, tentativas=TENTATIVAS, carona=False, atraso_ack=ATRASO_ACK,
+                 nak=False):
         super().__init__()
+        if modo == MODO_PARE_ESPERE:
+            janela, modulo = 1, 2
+        elif modo in (MODO_GBN, MODO_SR):
+            janela = JANELA if janela is None else janela
+            modulo = MODULO if modulo is None else modulo
+            if not 1 < modulo <= MODULO:
+                raise ValueError(f"modulo deve estar entre 2 e {MODULO}")
+            if modo == MODO_GBN and not 1 <= janela <= modulo - 1:
+                raise ValueError("Go-Back-N exige 1 <= janela <= modulo - 1")
+            if modo == MODO_SR and not 1 <= janela <= modulo // 2:
+                raise ValueError("Selective Repeat exige 1 <= janela <= modulo / 2")
+        else:
+            raise ValueError(f"modo de ARQ desconhecido: {modo}")
+        self.modo = modo
+        self.janela = janela
+        self.modulo = modulo
+        self.rto = EstimadorRTO(tout)
+        self.taxa = taxa
+        self.max_tentativas = tentativas
         self.N = 0  # número de sequência do transmissor
         self.M = 0  # número de sequência esperado no receptor
         self.q = deque()  # fila de saída
-        self.fsm = FsmARQ(self)  # FSM
+        self.poller = None  # será configurado no main com conecta_poller()
+        self.timers = {}  # chave -> TimerARQ
+        self.envios = {}  # número de sequência -> (instante do envio, tempo de transmissão), ou None se retransmitido
+        self.tx_escrita = 0.0  # tempo de transmissão da última escrita de quadros DATA
+        self.enlace_ativo = True
+        self.suspensos = []  # temporizadores parados quando o enlace caiu
+        self.carona = carona
+        # O ACK atrasado deve ficar bem abaixo do RTO do outro lado
+        self.atraso_ack = min(atraso_ack, self.rto.rto_min / 2)
+        # Espera somada ao RTO: o outro lado pode atrasar o ACK por atraso_ack
+        self.espera_ack = self.atraso_ack if carona else 0.0
+        self.acks = deque()  # ACKs à espera de um quadro DATA
+        self.timer_ack = None
+        self.nak = nak
+        self.nak_seq = None  # número de sequência do último NAK enviado
+        self.nak_instante = 0  # instante do último NAK enviado, em ns
+        self.naks_suprimidos = 0  # NAKs não enviados pelo limite de taxa
+        if modo == MODO_GBN:
+            self.fsm = FsmGoBackN(self)
+        elif modo == MODO_SR:
+            self.fsm = FsmSelectiveRepeat(self)
+        else:
+            self.fsm = FsmARQ(self)  # FSM
+
+    def conecta_poller(self, poller):
+        """Armazena referência ao poller, onde são registrados os temporizadores"""
+        self.poller = poller
 
     def envia(self, dados: bytes):
         """
         Chamado pela camada superior (aplicação) para enviar dado.
         """
         print(f"[ARQ] Aplicação pediu envio: {dados}")
+        if not self.enlace_ativo:
+            self._retoma()  # sonda o enlace com os quadros pendentes
         self.fsm.input_app_tx(dados)
 
     def recebe(self, dados: bytes):
         """
         Chamado pela subcamada inferior (Enquadramento) ao receber dados.
         """
-        print(f"[ARQ-TX] Quadro bruto recebido: {list(dados)}")
-        print(f"[ARQ] Recebeu dados da subcamada inferior: {list(dados)}")
-        self.fsm.input_rx(dados)
+        print(f"[ARQ] Recebeu dados da subcamada inferior: {bytes(dados)}")
+        if len(dados) < 2 or (dados[0] == TYPE_ACK_DATA and len(dados) < 4):
+            print("[ARQ] Quadro curto demais para o cabeçalho, descartado")
+            return
+        if dados[0] == TYPE_ACK_DATA:
+            # Trata primeiro o quadro DATA, para que o ACK dele possa seguir
+            # de carona nos quadros que a confirmação liberar
+            self.fsm.input_rx(dados[2:])
+            self.fsm.input_rx(bytes((TYPE_ACK, dados[1])))
+        else:
+            self.fsm.input_rx(dados)
+        if not self.enlace_ativo:
+            print("[ARQ] Quadro recebido: enlace ativo novamente")
+            self.enlace_ativo = True
+            if self.upper:
+                self.upper.notifica_enlace(True)
+            self._retoma()
 
-    def handle_timeout(self):
+    def quadro_corrompido(self):
+        """
+        Chamado pela subcamada inferior (DeteccaoErros) ao descartar um
+        quadro com erro de CRC.
+        """
+        if self.nak:
+            self.fsm.input_corrompido()
+
+    def handle_timeout(self, chave=0):
+        """
+        Chamado pelo temporizador chave (TimerARQ) quando o timeout estoura.
+        Dobra o RTO e pede à FSM que retransmita; após max_tentativas
+        timeouts seguidos, considera o enlace caído.
+        No Selective Repeat há um temporizador por quadro, e uma mesma perda
+        estoura os de toda a janela: só o timeout do quadro mais antigo
+        (base) dobra o RTO, uma vez por perda.
+        """
+        timer = self.timers[chave]
+        timer.tentativas += 1
+        if timer.tentativas > self.max_tentativas:
+            self._enlace_caiu()
+            return
+        if self.modo != MODO_SR or chave == self.fsm.base:
+            self.rto.backoff()
+        timer.base_timeout = self._tempo_timer(timer)  # o poller recarrega com este valor
+        print(f"[ARQ] Timeout {timer.tentativas}/{self.max_tentativas} do temporizador {chave}, RTO {self.rto.rto:.3f}s")
+        self.fsm.handle_timeout(chave)
+
+    def _enlace_caiu(self):
+        """Para as retransmissões e avisa a camada superior"""
+        print(f"[ARQ] {self.max_tentativas} retransmissões sem resposta: enlace caído")
+        for chave, timer in self.timers.items():
+            if timer.timeout_enabled:
+                timer.disable_timeout()
+                self.suspensos.append(chave)
+        if self.enlace_ativo:
+            self.enlace_ativo = False
+            if self.upper:
+                self.upper.notifica_enlace(False)
+
+    def _retoma(self):
+        """Retransmite os quadros cujos temporizadores pararam quando o enlace caiu"""
+        suspensos, self.suspensos = self.suspensos, []
+        for chave in suspensos:
+            timer = self.timers[chave]
+            timer.tentativas = 0
+            timer.reload_timeout()
+            timer.enable_timeout()
+            self.fsm.handle_timeout(chave)
+
+    def _registra_envio(self, quadros):
+        """
+        Registra o instante de envio de uma lista de pares (número de
+        sequência, dados) escritos de uma vez, e o tempo de transmissão
+        acumulado até cada quadro. Um quadro já registrado é uma
+        retransmissão e não gera amostra de RTT (regra de Karn).
         """
-        Chamado pelo poller se houver timeout.
+        agora = self._agora()
+        nbytes = 0
+        for seq, dados in quadros:
+            nbytes += len(dados) + SOBRECARGA
+            if seq in self.envios:
+                self.envios[seq] = None
+            else:
+                self.envios[seq] = (agora, tempo_transmissao(nbytes, self.taxa))
+        self.tx_escrita = tempo_transmissao(nbytes, self.taxa)
+
+    def _confirma(self, seqs):
+        """
+        Chamado pela FSM com os números de sequência confirmados por um ACK;
+        o último é o do próprio ACK, cujo RTT atualiza o RTO.
         """
-        print("[ARQ] Timeout detectado pelo poller")
-        self.fsm.handle_timeout()
+        envio = None
+        for seq in seqs:
+            envio = self.envios.pop(seq, None)
+        if envio is not None and self.poller:
+            instante, tempo_tx = envio
+            rtt = (self.poller.relogio.agora() - instante) / 1e9
+            self.rto.amostra(rtt - tempo_tx)
+            print(f"[ARQ] RTT {rtt:.3f}s: {self.rto}")
 
     def _envia_quadro(self):
         """
@@ -47,19 +250,102 @@ class ARQ(Subcamada):
             return
 
         dados = self.q[0]
-        quadro = bytearray()
-        quadro.append(TYPE_DATA)
-        quadro.append(self.N)
+        quadro = bytearray(self._cabecalho(self.N))
         quadro += dados
 
         print(f"[ARQ] Enviando quadro DATA_{self.N}: {list(quadro)}")
+        self._registra_envio([(self.N, dados)])
         if self.lower:
             self.lower.envia(bytes(quadro))
 
+    def _envia_dados(self, quadros):
+        """
+        Monta e envia, numa só escrita, os quadros DATA de uma lista de
+        pares (número de sequência, dados).
+        """
+        saida = [self._cabecalho(seq) + dados for seq, dados in quadros]
+        print(f"[ARQ] Enviando quadros DATA {[seq for seq, _ in quadros]}")
+        self._registra_envio(quadros)
+        if self.lower:
+            self.lower.envia_quadros(saida)
+
+    def _cabecalho(self, seq):
+        """Cabeçalho de DATA_seq, com um ACK pendente de carona se houver"""
+        if self.acks:
+            cabecalho = bytes((TYPE_ACK_DATA, self.acks.popleft(), TYPE_DATA, seq))
+            self._acks_enviados()
+            return cabecalho
+        return bytes((TYPE_DATA, seq))
+
+    def _acks_enviados(self):
+        """Para o temporizador do ACK atrasado se todos os ACKs já saíram"""
+        if not self.acks and self.timer_ack is not None:
+            self.timer_ack.disable_timeout()
+
+    def _dados_na_fila(self):
+        """
+        Se há dados da aplicação ainda não enviados, à espera da janela: eles
+        saem quando a janela abrir e podem levar os ACKs pendentes. No
+        pare-e-espere, q[0] é o quadro enviado que aguarda confirmação.
+        """
+        if self.modo == MODO_PARE_ESPERE and self.fsm.state == State.ESPERA:
+            return len(self.q) > 1
+        return bool(self.q)
+
+    def _tempo_timer(self, timer):
+        """Timeout do temporizador: RTO, tempo de transmissão e espera pelo ACK atrasado"""
+        return self.rto.rto + timer.tempo_tx + self.espera_ack
+
+    def _inicia_timer(self, chave):
+        """
+        (Re)inicia o temporizador de retransmissão chave, depois de uma
+        escrita de quadros novos ou de uma confirmação. O timeout é o RTO
+        mais o tempo de transmissão da última escrita.
+        """
+        if chave in self.suspensos:
+            self.suspensos.remove(chave)
+        if self.poller is None:
+            return
+        timer = self.timers.get(chave)
+        if timer is None:
+            timer = self.timers[chave] = TimerARQ(self, chave, self.rto.rto)
+            self.poller.adiciona(timer)
+        timer.tentativas = 0
+        timer.tempo_tx = self.tx_escrita
+        timer.base_timeout = self._tempo_timer(timer)
+        timer.reload_timeout()
+        timer.enable_timeout()
+
+    def _para_timer(self, chave):
+        """Para o temporizador de retransmissão chave"""
+        if chave in self.suspensos:
+            self.suspensos.remove(chave)
+        timer = self.timers.get(chave)
+        if timer is not None:
+            timer.disable_timeout()
+
     def _envia_ack(self, num_seq):
         """
-        Monta e envia ACK.
+        Monta e envia ACK. No modo carona, se houver dados na fila à espera
+        da janela, o ACK espera por um quadro DATA até o timeout do ACK
+        atrasado; senão, é enviado na hora com os que estiverem pendentes.
         """
+        if self.carona and self.poller is not None:
+            if self.modo == MODO_SR:
+                if num_seq not in self.acks:
+                    self.acks.append(num_seq)  # ACKs individuais: envia todos
+            else:
+                self.acks.clear()  # ACK cumulativo: só o mais recente importa
+                self.acks.append(num_seq)
+            if not self._dados_na_fila():
+                self._descarrega_acks()
+            elif self.timer_ack is None or not self.timer_ack.timeout_enabled:
+                if self.timer_ack is None:
+                    self.timer_ack = TimerAck(self, self.atraso_ack)
+                    self.poller.adiciona(self.timer_ack)
+                self.timer_ack.reload_timeout()
+                self.timer_ack.enable_timeout()
+            return
         quadro = bytearray()
         quadro.append(TYPE_ACK)
         quadro.append(num_seq)
@@ -67,3 +353,35 @@ class ARQ(Subcamada):
         print(f"[ARQ] Enviando ACK_{num_seq}: {list(quadro)}")
         if self.lower:
             self.lower.envia(bytes(quadro))
+
+    def _envia_nak(self, num_seq):
+        """
+        Monta e envia NAK_num_seq, a menos que o mesmo NAK tenha sido enviado
+        há menos de um RTO. Retorna True se o NAK foi enviado.
+        """
+        if not self.nak:
+            return False
+        agora = self._agora()
+        if num_seq == self.nak_seq and agora - self.nak_instante < self.rto.rto * 1e9:
+            self.naks_suprimidos += 1
+            return False
+        self.nak_seq = num_seq
+        self.nak_instante = agora
+        print(f"[ARQ] Enviando NAK_{num_seq}")
+        if self.lower:
+            self.lower.envia(bytes((TYPE_NAK, num_seq)))
+        return True
+
+    def _agora(self):
+        """Instante atual, em ns, no relógio do poller"""
+        return self.poller.relogio.agora() if self.poller else time.monotonic_ns()
+
+    def _descarrega_acks(self):
+        """Envia sozinhos, numa só escrita, os ACKs que não seguiram de carona"""
+        acks = [bytes((TYPE_ACK, num_seq)) for num_seq in self.acks]
+        self.acks.clear()
+        self._acks_enviados()
+        if acks:
+            print(f"[ARQ] Enviando ACKs sem carona: {[q[1] for q in acks]}")
+            if self.lower:
+                self.lower.envia_quadros(acks)
@@ -1,4 +1,22 @@
-from functools import reduce
+from binascii import crc_hqx
+
+# Tabela que inverte a ordem dos bits de cada byte (bit 0 <-> bit 7, ...)
+_REFLETE = bytes(int(f'{i:08b}'[::-1], 2) for i in range(256))
+
+def _reflete16(v):
+  '''Inverte a ordem dos bits de um valor de 16 bits'''
+  return (_REFLETE[v & 0xff] << 8) | _REFLETE[v >> 8]
+
+def fcs16(data, fcs=0xffff):
+  '''Calcula o FCS da RFC 1662 sobre data (bytes, bytearray ou memoryview),
+partindo do valor fcs, sem o complemento de 1 ao final. O FCS do PPP é o
+CRC-CCITT refletido: é obtido com binascii.crc_hqx (CRC-CCITT não refletido,
+implementado em C) sobre os bytes com os bits invertidos, invertendo também o
+valor inicial e o resultado. O valor é idêntico ao do cálculo byte a byte com
+CRC16.tab. Um memoryview, que não tem translate, é antes copiado para bytes.'''
+  if not isinstance(data, (bytes, bytearray)):
+    data = bytes(data)
+  return _reflete16(crc_hqx(data.translate(_REFLETE), _reflete16(fcs)))
 
 class CRC16:
   '''Classe CRC16: calcula e verifica FCS cm base no algoritmo 
@@ -47,31 +65,47 @@ de CRC descrito na RFC 1662 (PPP)'''
   def __init__(self, data=b''):
     '''data: contém os dados para calcular o FCS. Armazena esses 
 dados em um bufer interno. Deve ser um objeto str, bytes ou 
-bytearray'''
-    self.data = self.__convert__(data)
+bytearray. O FCS é atualizado a cada update, e não recalculado
+sobre todo o buffer'''
+    self.data = bytearray()
+    self.fcs = self.INIT
+    self.update(data)
 
-  def __convert__(self, data):
+  @staticmethod
+  def __convert__(data):
     '''Converte os dados para um objeto bytes'''
     if type(data) == type(''):
       return data.encode('ascii')
     elif type(data) == type(b''):
       return data
-    elif type(data) == type(bytearray()):
+    elif type(data) in (bytearray, memoryview):
       return bytes(data)
     else:
-      raise ValueError('data must be str, bytes or bytearray')
+      raise ValueError('data must be str, bytes, bytearray or memoryview')
 
   def update(self, data):
     '''Acrescenta mais dados ao buffer interno'''
-    self.data += self.__convert__(data)
+    data = self.__convert__(data)
+    self.data += data
+    self.fcs = fcs16(data, self.fcs)
 
   def clear(self):
     '''Limpa o buffer interno'''
-    self.data = b''
+    self.data = bytearray()
+    self.fcs = self.INIT
 
   def calculate(self):
     '''Calcula o valor do FCS (sem o complemento de 1 ao final)'''
-    return reduce(lambda fcs,c: (fcs>>8) ^ self.tab[(fcs^c)&0xff], self.data, self.INIT)
+    return self.fcs
+
+  @classmethod
+  def calculate_many(cls, frames):
+    '''Calcula o FCS (sem o complemento de 1 ao final) de cada quadro em
+frames, sem criar um objeto CRC16 por quadro. Cada quadro pode ser str, bytes,
+bytearray ou memoryview. Retorna uma lista com os valores, na mesma ordem'''
+    convert = cls.__convert__
+    init = cls.INIT
+    return [fcs16(convert(q), init) for q in frames]
 
   def gen_crc(self):
     '''Gera o valor de FCS (com complemento de 1). Retorna um objeto 
@@ -85,4 +119,36 @@ bytes com o os dados seguidos do valor de FCS (LSB e depois MSB)'''
   def check_crc(self):
     '''Verifica o valor de FCS contido nos dados armazenados no buffer interno'''
     fcs = self.calculate()
-    return fcs == self.GOODFCS    
+    return fcs == self.GOODFCS
+
+class FCS16:
+  '''Classe FCS16: calcula o mesmo FCS de CRC16 de forma incremental,
+guardando apenas o estado de 16 bits, e não os dados. Serve para calcular o
+FCS à medida que os bytes de um quadro são enviados ou recebidos'''
+
+  def __init__(self):
+    self.fcs = CRC16.INIT
+
+  def clear(self):
+    '''Reinicia o cálculo para um novo quadro'''
+    self.fcs = CRC16.INIT
+
+  def update_byte(self, byte):
+    '''Acrescenta um byte (int) ao cálculo'''
+    fcs = self.fcs
+    self.fcs = (fcs >> 8) ^ CRC16.tab[(fcs ^ byte) & 0xff]
+
+  def update(self, data):
+    '''Acrescenta um bloco de dados (bytes, bytearray ou memoryview) ao cálculo'''
+    self.fcs = fcs16(data, self.fcs)
+
+  def gen_fcs(self):
+    '''Retorna o FCS dos bytes acrescentados (com complemento de 1), como
+um objeto bytes com o LSB e depois o MSB, para ser anexado ao quadro'''
+    fcs = self.fcs ^ 0xffff
+    return bytes((fcs & 0xff, fcs >> 8))
+
+  def check_fcs(self):
+    '''Verifica se os bytes acrescentados, incluindo o FCS recebido ao
+final, formam um quadro com FCS correto'''
+    return self.fcs == CRC16.GOODFCS
@@ -1,7 +1,9 @@
 from enum import Enum, auto
+from collections import deque
 
 TYPE_DATA = 0x00
 TYPE_ACK  = 0x01
+TYPE_NAK  = 0x03
 
 class State(Enum):
     OCIOSO = auto()
@@ -29,6 +31,7 @@ class FsmARQ:
         match self.state:
             case State.OCIOSO:
                 self.arq._envia_quadro()
+                self.arq._inicia_timer(0)
                 self.state = State.ESPERA
                 print("[FSM] Transição OCIOSO -> ESPERA")
 
@@ -59,25 +62,39 @@ class FsmARQ:
                 self.arq.M = 1 - self.arq.M
             else:
                 print("[FSM] OCIOSO: quadro duplicado, reenvia ACK")
-                self.arq._envia_ack(self.arq.M)
+                self.arq._envia_ack(1 - self.arq.M)  # ACK do último quadro recebido
 
         elif tipo == TYPE_ACK:
             print("[FSM] OCIOSO: ignorou ACK recebido (não esperava nada)")
 
+        elif tipo == TYPE_NAK:
+            print("[FSM] OCIOSO: ignorou NAK recebido (nada a retransmitir)")
+
     def espera_handler(self, tipo, num_seq, quadro):
         if tipo == TYPE_ACK:
             print(f"[FSM] ESPERA: recebeu ACK_{num_seq}")
             if num_seq == self.arq.N:
+                self.arq._confirma([num_seq])
                 self.arq.q.popleft()
                 self.arq.N = 1 - self.arq.N
                 if len(self.arq.q) > 0:
                     self.arq._envia_quadro()
+                    self.arq._inicia_timer(0)
                 else:
                     print("[FSM] Fila vazia: ESPERA -> OCIOSO")
+                    self.arq._para_timer(0)
                     self.state = State.OCIOSO
             else:
                 print("[FSM] ESPERA: ACK duplicado ou inesperado, ignorado")
 
+        elif tipo == TYPE_NAK:
+            if num_seq == self.arq.N:
+                print(f"[FSM] ESPERA: recebeu NAK_{num_seq}, retransmite quadro")
+                self.arq._envia_quadro()
+                self.arq._inicia_timer(0)
+            else:
+                print(f"[FSM] ESPERA: NAK_{num_seq} de quadro já recebido, ignorado")
+
         elif tipo == TYPE_DATA:
             print(f"[FSM] ESPERA: recebeu DATA_{num_seq}")
             if num_seq == self.arq.M:
@@ -88,12 +105,258 @@ class FsmARQ:
                 self.arq.M = 1 - self.arq.M
             else:
                 print("[FSM] ESPERA: quadro duplicado, reenvia ACK")
-                self.arq._envia_ack(self.arq.M)
+                self.arq._envia_ack(1 - self.arq.M)  # ACK do último quadro recebido
+
+    def input_corrompido(self):
+        """
+        Evento: quadro descartado por erro de CRC. Pede o quadro esperado.
+        """
+        self.arq._envia_nak(self.arq.M)
 
-    def handle_timeout(self):
+    def handle_timeout(self, chave=0):
         """
         Evento: timeout.
         """
         print("[FSM] Timeout no estado ESPERA: retransmite quadro")
         if self.state == State.ESPERA and len(self.arq.q) > 0:
-            self.arq._envia_quadro()
\ No newline at end of file
+            self.arq._envia_quadro()
+
+class FsmGoBackN:
+    """
+    FSM do ARQ Go-Back-N.
+    O transmissor mantém até arq.janela quadros enviados e não confirmados.
+    O ACK é cumulativo: ACK_n confirma todos os quadros até n. Um único
+    temporizador cobre a janela; no timeout, todos os quadros pendentes são
+    retransmitidos. O receptor só aceita o quadro esperado e, para qualquer
+    outro, repete o ACK do último quadro recebido em ordem.
+    """
+    def __init__(self, arq):
+        """
+        arq: referência para a instância da classe ARQ principal.
+        """
+        self.arq = arq
+        self.base = 0  # número de sequência do quadro mais antigo não confirmado
+        self.pendentes = deque()  # quadros enviados e não confirmados, a partir de base
+        self.M = 0  # número de sequência esperado no receptor
+
+    def input_app_tx(self, dados: bytes):
+        """
+        Evento: aplicação envia dado. Enfileira e envia se houver espaço na janela.
+        """
+        self.arq.q.append(dados)
+        print(f"[FSM-GBN] App_tx chegou: {dados}")
+        self._preenche_janela()
+
+    def _preenche_janela(self):
+        """Envia, numa só escrita, os quadros da fila que cabem na janela"""
+        novos = []
+        while self.arq.q and len(self.pendentes) < self.arq.janela:
+            dados = self.arq.q.popleft()
+            seq = (self.base + len(self.pendentes)) % self.arq.modulo
+            self.pendentes.append(dados)
+            novos.append((seq, dados))
+        if novos:
+            self.arq._envia_dados(novos)
+            if len(self.pendentes) == len(novos):
+                self.arq._inicia_timer(0)  # janela estava vazia
+
+    def input_rx(self, quadro: bytes):
+        """
+        Evento: recebe quadro da subcamada inferior.
+        """
+        tipo = quadro[0]
+        num_seq = quadro[1]
+        if tipo == TYPE_ACK:
+            self.ack_handler(num_seq)
+        elif tipo == TYPE_DATA:
+            self.data_handler(num_seq, quadro)
+        elif tipo == TYPE_NAK:
+            self.nak_handler(num_seq)
+
+    def ack_handler(self, num_seq):
+        confirmados = (num_seq - self.base) % self.arq.modulo + 1
+        if confirmados > len(self.pendentes):
+            print(f"[FSM-GBN] ACK_{num_seq} fora da janela, ignorado")
+            return
+        print(f"[FSM-GBN] ACK_{num_seq}: {confirmados} quadro(s) confirmado(s)")
+        self._confirma(confirmados)
+        if self.pendentes:
+            self.arq._inicia_timer(0)  # reinicia para o novo quadro mais antigo
+        else:
+            self.arq._para_timer(0)
+        self._preenche_janela()
+
+    def nak_handler(self, num_seq):
+        """
+        NAK_n confirma os quadros anteriores a n e pede a retransmissão da
+        janela a partir de n, sem esperar pelo timeout.
+        """
+        confirmados = (num_seq - self.base) % self.arq.modulo
+        if confirmados >= len(self.pendentes):
+            print(f"[FSM-GBN] NAK_{num_seq} fora da janela, ignorado")
+            return
+        print(f"[FSM-GBN] NAK_{num_seq}: retransmitindo a partir de {num_seq}")
+        self._confirma(confirmados)
+        self._retransmite()
+        self.arq._inicia_timer(0)
+        self._preenche_janela()
+
+    def _confirma(self, confirmados):
+        """Retira da janela os confirmados quadros mais antigos"""
+        self.arq._confirma([(self.base + i) % self.arq.modulo for i in range(confirmados)])
+        for _ in range(confirmados):
+            self.pendentes.popleft()
+        self.base = (self.base + confirmados) % self.arq.modulo
+
+    def _retransmite(self):
+        """Retransmite, numa só escrita, todos os quadros pendentes"""
+        self.arq._envia_dados([((self.base + i) % self.arq.modulo, dados)
+                               for i, dados in enumerate(self.pendentes)])
+
+    def data_handler(self, num_seq, quadro):
+        if num_seq == self.M:
+            print(f"[FSM-GBN] DATA_{num_seq} em ordem")
+            if self.arq.upper:
+                self.arq.upper.recebe(quadro[2:])
+            self.arq._envia_ack(self.M)
+            self.M = (self.M + 1) % self.arq.modulo
+        else:
+            print(f"[FSM-GBN] DATA_{num_seq} fora de ordem (esperado {self.M}), descartado")
+            # Quadro adiante do esperado: houve perda, pede a retransmissão
+            adiante = (num_seq - self.M) % self.arq.modulo < self.arq.janela
+            if not (adiante and self.arq._envia_nak(self.M)):
+                self.arq._envia_ack((self.M - 1) % self.arq.modulo)
+
+    def input_corrompido(self):
+        """
+        Evento: quadro descartado por erro de CRC. Pede o quadro esperado.
+        """
+        self.arq._envia_nak(self.M)
+
+    def handle_timeout(self, chave=0):
+        """
+        Evento: timeout. Retransmite toda a janela.
+        """
+        if not self.pendentes:
+            self.arq._para_timer(0)
+            return
+        print(f"[FSM-GBN] Timeout: retransmitindo {len(self.pendentes)} quadro(s) a partir de {self.base}")
+        self._retransmite()
+
+
+class FsmSelectiveRepeat:
+    """
+    FSM do ARQ Selective Repeat (retransmissão seletiva).
+    O transmissor mantém até arq.janela quadros enviados e não confirmados,
+    cada um com seu temporizador; o ACK é individual (ACK_n confirma só o
+    quadro n) e, no timeout, só o quadro correspondente é retransmitido.
+    O receptor aceita quadros dentro da sua janela, guarda os que chegam fora
+    de ordem e os entrega à camada superior em ordem.
+    """
+    def __init__(self, arq):
+        """
+        arq: referência para a instância da classe ARQ principal.
+        """
+        self.arq = arq
+        self.base = 0  # número de sequência do quadro mais antigo não confirmado
+        self.proximo = 0  # número de sequência do próximo quadro a enviar
+        self.pendentes = {}  # número de sequência -> dados, dos quadros não confirmados
+        self.M = 0  # número de sequência esperado no receptor
+        self.recebidos = {}  # número de sequência -> dados, recebidos fora de ordem
+
+    def input_app_tx(self, dados: bytes):
+        """
+        Evento: aplicação envia dado. Enfileira e envia se houver espaço na janela.
+        """
+        self.arq.q.append(dados)
+        print(f"[FSM-SR] App_tx chegou: {dados}")
+        self._preenche_janela()
+
+    def _preenche_janela(self):
+        """Envia, numa só escrita, os quadros da fila que cabem na janela"""
+        novos = []
+        while self.arq.q and (self.proximo - self.base) % self.arq.modulo < self.arq.janela:
+            seq = self.proximo
+            self.pendentes[seq] = self.arq.q.popleft()
+            novos.append((seq, self.pendentes[seq]))
+            self.proximo = (seq + 1) % self.arq.modulo
+        if novos:
+            self.arq._envia_dados(novos)
+            for seq, _ in novos:
+                self.arq._inicia_timer(seq)
+
+    def input_rx(self, quadro: bytes):
+        """
+        Evento: recebe quadro da subcamada inferior.
+        """
+        tipo = quadro[0]
+        num_seq = quadro[1]
+        if tipo == TYPE_ACK:
+            self.ack_handler(num_seq)
+        elif tipo == TYPE_DATA:
+            self.data_handler(num_seq, quadro)
+        elif tipo == TYPE_NAK:
+            self.nak_handler(num_seq)
+
+    def ack_handler(self, num_seq):
+        if num_seq not in self.pendentes:
+            print(f"[FSM-SR] ACK_{num_seq} duplicado ou fora da janela, ignorado")
+            return
+        print(f"[FSM-SR] ACK_{num_seq} recebido")
+        self.arq._confirma([num_seq])
+        del self.pendentes[num_seq]
+        self.arq._para_timer(num_seq)
+        while self.base != self.proximo and self.base not in self.pendentes:
+            self.base = (self.base + 1) % self.arq.modulo
+        self._preenche_janela()
+
+    def nak_handler(self, num_seq):
+        """NAK_n pede a retransmissão só do quadro n, sem esperar pelo timeout"""
+        if num_seq not in self.pendentes:
+            print(f"[FSM-SR] NAK_{num_seq} de quadro já confirmado, ignorado")
+            return
+        print(f"[FSM-SR] NAK_{num_seq}: retransmitindo DATA_{num_seq}")
+        self.arq._envia_dados([(num_seq, self.pendentes[num_seq])])
+        self.arq._inicia_timer(num_seq)
+
+    def data_handler(self, num_seq, quadro):
+        modulo = self.arq.modulo
+        if (num_seq - self.M) % modulo < self.arq.janela:
+            self.arq._envia_ack(num_seq)
+            if num_seq == self.M:
+                print(f"[FSM-SR] DATA_{num_seq} em ordem")
+                self._entrega(quadro[2:])
+                while self.M in self.recebidos:
+                    self._entrega(self.recebidos.pop(self.M))
+            elif num_seq not in self.recebidos:
+                print(f"[FSM-SR] DATA_{num_seq} fora de ordem (esperado {self.M}), guardado")
+                # o quadro recebido é só uma visão do buffer do enquadramento: copia
+                self.recebidos[num_seq] = bytes(quadro[2:])
+                self.arq._envia_nak(self.M)  # houve perda: pede o quadro esperado
+        elif (self.M - num_seq) % modulo <= self.arq.janela:
+            print(f"[FSM-SR] DATA_{num_seq} já entregue, reenvia ACK")
+            self.arq._envia_ack(num_seq)
+        else:
+            print(f"[FSM-SR] DATA_{num_seq} fora da janela, descartado")
+
+    def input_corrompido(self):
+        """
+        Evento: quadro descartado por erro de CRC. Pede o quadro esperado.
+        """
+        self.arq._envia_nak(self.M)
+
+    def _entrega(self, payload):
+        """Entrega o quadro esperado à camada superior e avança a janela de recepção"""
+        if self.arq.upper:
+            self.arq.upper.recebe(payload)
+        self.M = (self.M + 1) % self.arq.modulo
+
+    def handle_timeout(self, chave):
+        """
+        Evento: timeout do quadro chave. Retransmite só esse quadro.
+        """
+        if chave not in self.pendentes:
+            self.arq._para_timer(chave)
+            return
+        print(f"[FSM-SR] Timeout: retransmitindo DATA_{chave}")
+        self.arq._envia_dados([(chave, self.pendentes[chave])])
@@ -5,16 +5,24 @@ from serial import Serial
 from DeteccaoErros import DeteccaoErros
 from Enquadramento import Enquadramento
 from Adaptacao import Adaptacao
-from arq import ARQ
+from arq import ARQ, MODO_PARE_ESPERE, MODO_GBN, MODO_SR
+
+TAXA = 9600  # taxa da serial, em bits/s
 
 def main():
-    if len(sys.argv) != 2:
-        print(f"Uso: python3 {sys.argv[0]} <porta_serial>")
+    # "carona" e "nak" podem aparecer em qualquer posição após a porta
+    carona = 'carona' in sys.argv[2:]
+    nak = 'nak' in sys.argv[2:]
+    args = sys.argv[1:2] + [arg for arg in sys.argv[2:] if arg not in ('carona', 'nak')]
+    if not 1 <= len(args) <= 3 or (len(args) >= 2 and args[1] not in (MODO_PARE_ESPERE, MODO_GBN, MODO_SR)):
+        print(f"Uso: python3 {sys.argv[0]} <porta_serial> [pe|gbn|sr] [janela] [carona] [nak]")
         sys.exit(1)
 
-    porta_nome = sys.argv[1]
+    porta_nome = args[0]
+    modo = args[1] if len(args) >= 2 else MODO_PARE_ESPERE
+    janela = int(args[2]) if len(args) == 3 else None
     try:
-        porta = Serial(porta_nome, baudrate=9600, timeout=0.1)
+        porta = Serial(porta_nome, baudrate=TAXA, timeout=0.1)
     except Exception as e:
         print("Erro ao abrir porta serial:", e)
         sys.exit(1)
@@ -24,7 +32,7 @@ def main():
 
     # Cria as camadas
     adapt = Adaptacao()                          # aplicação: stdin → envia e recebe
-    arq = ARQ()                                  # ARQ: pare-e-espere
+    arq = ARQ(modo, janela, taxa=TAXA, carona=carona, nak=nak)  # ARQ: pare-e-espere, Go-Back-N ou Selective Repeat
     crc   = DeteccaoErros()                      # detecção de erros
     enq   = Enquadramento(porta, tout=0.5)       # enquadramento + FSM + timeout
 
@@ -39,14 +47,15 @@ def main():
     arq.lower = crc
     crc.lower   = enq
 
-    # Conecta o poller ao enquadramento
+    # Conecta o poller ao enquadramento e ao ARQ (temporizadores de retransmissão)
     enq.conecta_poller(poller)
+    arq.conecta_poller(poller)
 
     # Registra no poller
     poller.adiciona(adapt)   # monitora stdin
     poller.adiciona(enq)     # monitora serial + timeout
 
-    print(f"[MAIN] Pilha montada. Porta serial: {porta_nome}")
+    print(f"[MAIN] Pilha montada. Porta serial: {porta_nome}, ARQ: {modo}, janela: {arq.janela}, ACK de carona: {carona}, NAK: {nak}")
     print("[MAIN] Digite mensagens para enviar. Recebidas aparecerão automaticamente.\n")
     print("> ")
 
@@ -0,0 +1,73 @@
+"""
+Estimativa do timeout de retransmissão (RTO) do ARQ.
+"""
+
+RTO_INICIAL = 1.0  # RTO antes da primeira medida de RTT, em segundos
+RTO_MIN = 0.05  # menor RTO permitido, em segundos
+RTO_MAX = 10.0  # maior RTO permitido, inclusive com backoff, em segundos
+TENTATIVAS = 5  # retransmissões consecutivas de um quadro antes de considerar o enlace caído
+
+# Ganhos do estimador de Jacobson/Karels (RFC 6298)
+ALFA = 1 / 8  # peso de uma nova amostra no SRTT
+BETA = 1 / 4  # peso de uma nova amostra no RTTVAR
+K = 4  # multiplicador do RTTVAR no cálculo do RTO
+
+BITS_POR_BYTE = 10  # bits transmitidos por byte na serial (8N1: start + 8 dados + stop)
+
+
+def tempo_transmissao(nbytes, taxa):
+    """
+    Tempo, em segundos, para transmitir nbytes numa serial com taxa bits/s.
+    Se taxa for None, a taxa é desconhecida e o tempo é desprezado.
+    """
+    if not taxa:
+        return 0.0
+    return nbytes * BITS_POR_BYTE / taxa
+
+
+class EstimadorRTO:
+    """
+    Calcula o RTO a partir das medidas de RTT (tempo entre o envio de um
+    quadro DATA e a chegada do ACK que o confirma), pelo algoritmo de
+    Jacobson/Karels: SRTT é a média móvel do RTT, RTTVAR a sua variação, e
+    RTO = SRTT + K * RTTVAR, limitado a [rto_min, rto_max].
+    As amostras não incluem o tempo de transmissão do próprio quadro, que
+    depende do seu tamanho e da taxa da serial: quem arma o temporizador soma
+    esse tempo ao RTO (ver tempo_transmissao).
+    Pela regra de Karn, não se fornecem amostras de quadros retransmitidos.
+    """
+    def __init__(self, rto_inicial=RTO_INICIAL, rto_min=RTO_MIN, rto_max=RTO_MAX):
+        if not 0 < rto_min <= rto_max:
+            raise ValueError("Deve valer 0 < rto_min <= rto_max.")
+        self.rto_min = rto_min
+        self.rto_max = rto_max
+        self.rto = min(max(rto_inicial, rto_min), rto_max)  # RTO atual
+        self.srtt = None  # RTT suavizado (None até a primeira amostra)
+        self.rttvar = None  # variação do RTT
+        self.amostras = 0  # número de amostras usadas
+        self.backoffs = 0  # timeouts consecutivos desde a última amostra
+
+    def amostra(self, rtt):
+        """Acrescenta uma amostra de RTT, em segundos, e recalcula o RTO"""
+        rtt = max(rtt, 0.0)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALFA) * self.srtt + ALFA * rtt
+        self.amostras += 1
+        self.backoffs = 0
+        self._limita(self.srtt + K * self.rttvar)
+
+    def backoff(self):
+        """Dobra o RTO após um timeout (backoff exponencial)"""
+        self.backoffs += 1
+        self._limita(self.rto * 2)
+
+    def _limita(self, rto):
+        self.rto = min(max(rto, self.rto_min), self.rto_max)
+
+    def __repr__(self):
+        srtt = f"{self.srtt:.4f}" if self.srtt is not None else None
+        return f"EstimadorRTO(rto={self.rto:.4f}, srtt={srtt}, amostras={self.amostras}, backoffs={self.backoffs})"
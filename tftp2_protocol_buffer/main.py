@@ -1,14 +1,16 @@
 import sys
 from tftplus.TFTPlus_Client import TFTPlus_Client
 
-# Lê a linha de comando para determinar a operação (enviar ou receber), o arquivo, o IP e a porta do servidor.
+# Lê a linha de comando para determinar a operação (enviar, receber, listar, criar diretório
+    # ou mover), o arquivo, o IP e a porta do servidor.
 # Cria uma instância do cliente TFTP e executa a operação solicitada.
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print("Uso: python3 main.py [send|recv] arquivo ip porta")
+    if len(sys.argv) not in (5, 6):
+        print("Uso: python3 main.py [send|recv|list|mkdir|move] arquivo ip porta [novo_nome]")
         sys.exit(1)
 
     operacao, arquivo, ip, porta = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+    novo_nome = sys.argv[5] if len(sys.argv) == 6 else None
 
     client = TFTPlus_Client(ip, porta)
 
@@ -16,7 +18,15 @@ if __name__ == "__main__":
         client.send_file(arquivo)
     elif operacao == "recv":
         client.receive_file(arquivo)
+    elif operacao == "list":
+        itens = client.list_dir(arquivo)
+        for nome, tamanho in itens or []:
+            print(f"{nome}/" if tamanho is None else f"{nome}\t{tamanho}")
+    elif operacao == "mkdir":
+        print("OK" if client.mkdir(arquivo) else "Falhou")
+    elif operacao == "move":
+        print("OK" if client.move(arquivo, novo_nome) else "Falhou")
     else:
-        print("Operação inválida. Use 'send' ou 'recv'.")
+        print("Operação inválida. Use 'send', 'recv', 'list', 'mkdir' ou 'move'.")
 
     client.close()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import socket
+from collections import deque
+
+# Quantidade padrão de buffers do anel de recepção, ou seja, o máximo de
+# datagramas lidos do socket a cada vez que o poller indica dados disponíveis.
+TAM_ANEL = 32
+
+# Classe AnelRecepcao mantém um anel de buffers pré-alocados para a recepção de datagramas.
+# A cada chamada de drena(), o socket é lido com recvfrom_into até não haver mais datagramas
+# (EAGAIN) ou até o anel se completar, sem alocar um novo objeto bytes por pacote.
+# Cada pacote é entregue como um memoryview sobre o buffer que o recebeu; esse buffer só
+# é reutilizado depois que as outras n - 1 posições do anel forem usadas, então os pacotes
+# de uma drenagem devem ser processados antes da próxima.
+# O socket deve estar em modo não bloqueante: quem avisa que há dados é o poller.
+class AnelRecepcao:
+    def __init__(self, tam_buffer, n=TAM_ANEL):
+        self.tam_buffer = tam_buffer
+        self.buffers = [bytearray(tam_buffer) for _ in range(n)]
+        self.visoes = [memoryview(b) for b in self.buffers]
+        self.pos = 0
+
+    # Lê do socket todos os datagramas disponíveis, no máximo um por buffer do anel.
+    # Retorna uma lista de pares (pacote, endereço), na ordem em que chegaram.
+    def drena(self, sock):
+        pacotes = []
+        visoes = self.visoes
+        for _ in range(len(visoes)):
+            visao = visoes[self.pos]
+            try:
+                n, addr = sock.recvfrom_into(visao, self.tam_buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            pacotes.append((visao[:n], addr))
+            self.pos = (self.pos + 1) % len(visoes)
+        return pacotes
+
+# Classe FilaEnvio acumula os datagramas a enviar (DATA e ACK) durante o tratamento de um
+# evento, e os envia em rajada com descarrega(), ao final do tratamento.
+# Se o buffer de envio do socket estiver cheio (EAGAIN), a descarga para sem esperar, pois
+# o poller é compartilhado com outras sessões: os datagramas restantes permanecem na fila
+# e são enviados na próxima descarga, no próximo evento ou timeout da FSM.
+class FilaEnvio:
+    def __init__(self, sock):
+        self.sock = sock
+        self.fila = deque()
+
+    def __len__(self):
+        return len(self.fila)
+
+    # Acrescenta um datagrama à fila de envio.
+    def enfileira(self, dados, addr):
+        self.fila.append((dados, addr))
+
+    # Envia todos os datagramas da fila, na ordem em que foram enfileirados.
+    # Retorna True se a fila foi esvaziada.
+    def descarrega(self):
+        fila = self.fila
+        sendto = self.sock.sendto
+        while fila:
+            dados, addr = fila[0]
+            try:
+                sendto(dados, addr)
+            except (BlockingIOError, InterruptedError):
+                return False
+            fila.popleft()
+        return True
+
+# Coloca o socket em modo não bloqueante, para que AnelRecepcao.drena() possa ler
+# até esvaziá-lo. O timeout do socket deixa de valer: os timeouts da transferência
+# são os das FSMs, tratados pelo poller.
+def nao_bloqueante(sock):
+    if sock.gettimeout() != 0.0:
+        sock.setblocking(False)
+    return sock
+
+# Aumenta o buffer de recepção do socket para comportar ao menos tam bytes, por exemplo
+# uma janela inteira de blocos; sem isso, rajadas de blocos grandes excedem o buffer
+# padrão e o final da janela é descartado, o que só se recupera com um timeout.
+# O sistema operacional pode limitar o valor (net.core.rmem_max no Linux).
+def ajusta_recepcao(sock, tam):
+    try:
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) < tam:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, tam)
+    except OSError:
+        pass
+    return sock
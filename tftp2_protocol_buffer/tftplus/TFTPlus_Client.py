@@ -1,6 +1,10 @@
+import select
 import socket
+import time
+from tftplus.TFTPlus_ProtoPacket import TFTP2_ProtoPacket
 from tftplus.TFTPlus_FsmRx import TFTPlus_FsmRx
 from tftplus.TFTPlus_FsmTx import TFTPlus_FsmTx
+from tftplus.TFTPlus_Rto import RTO_MIN, RTO_MAX
 from pypoller import poller
 
 class TFTPlus_Client:
@@ -9,10 +13,14 @@ class TFTPlus_Client:
     # O timeout é o tempo máximo de espera para receber uma resposta do servidor.
     # O socket UDP é criado e configurado com o timeout especificado.
     # O socket é usado para enviar e receber pacotes TFTP2.
-    def __init__(self, server_ip, server_port, timeout=5):
+    # Nas transferências, timeout é só o RTO inicial: o timeout de retransmissão se adapta
+        # ao RTT medido, limitado a [rto_min, rto_max] segundos.
+    def __init__(self, server_ip, server_port, timeout=5, rto_min=RTO_MIN, rto_max=RTO_MAX):
         self.server_ip = server_ip
         self.server_port = server_port
         self.timeout = timeout
+        self.rto_min = rto_min
+        self.rto_max = rto_max
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.settimeout(self.timeout)
 
@@ -23,13 +31,15 @@ class TFTPlus_Client:
     # Após a conclusão, o agendador encerra a transmissão e libera os recursos.
     # Recebe um nome de arquivo como parâmetro, que é o arquivo a ser enviado.
     # O arquivo deve existir no sistema de arquivos local.
+    # Retorna a FSM da sessão; fsmTx.rto tem o RTT medido (rtt, srtt, rttvar) e o RTO final.
     def send_file(self, filename):
         print("Cliente: Enviando arquivo com FSM...")
         sched = poller.Poller()
-        fsmTx = TFTPlus_FsmTx(self, filename, timeout=self.timeout)
+        fsmTx = TFTPlus_FsmTx(self, filename, timeout=self.timeout, rto_min=self.rto_min, rto_max=self.rto_max)
         sched.adiciona(fsmTx)
         fsmTx.start()
         sched.despache()
+        return fsmTx
 
     # Recebe um arquivo do servidor TFTP2 usando uma máquina de estados finita (FSM).
     # O método TFTPlus_FsmRx é usado para gerenciar a recepção do arquivo.
@@ -39,14 +49,77 @@ class TFTPlus_Client:
     # Recebe um nome de arquivo como parâmetro, que é o arquivo a ser recebido.
     # O arquivo será salvo no sistema de arquivos local com o nome especificado.
     # Se o arquivo já existir, ele será sobrescrito.
-    # O timeout é usado para definir o tempo máximo de espera para receber pacotes do servidor.
+    # O timeout é usado como RTO inicial, ajustado depois pelo RTT medido.
+    # Retorna a FSM da sessão; fsmRx.rto tem o RTT medido (rtt, srtt, rttvar) e o RTO final.
     def receive_file(self, filename):
         print("Cliente: Recebendo arquivo com FSM...")
         sched = poller.Poller()
-        fsmRx = TFTPlus_FsmRx(self, filename, timeout=self.timeout)
+        fsmRx = TFTPlus_FsmRx(self, filename, timeout=self.timeout, rto_min=self.rto_min, rto_max=self.rto_max)
         sched.adiciona(fsmRx)
         fsmRx.start()
         sched.despache()
+        return fsmRx
+
+    # Lista o diretório path do servidor TFTP2 (LIST).
+    # Retorna uma lista de pares (nome, tamanho) para arquivos e (nome, None) para diretórios,
+        # ou None se o servidor responder com erro ou não responder.
+    def list_dir(self, path="/"):
+        resposta = self._pedido(TFTP2_ProtoPacket.criar_list(path))
+        if resposta is None or TFTP2_ProtoPacket.tipo(resposta) != "LIST_RESP":
+            return None
+        return [(item.file.nome, item.file.tamanho) if item.HasField("file") else (item.dir.path, None)
+                for item in resposta.list_resp.items]
+
+    # Cria o diretório path no servidor TFTP2 (MKDIR). Retorna True se o servidor confirmar.
+    def mkdir(self, path):
+        return self._confirmado(self._pedido(TFTP2_ProtoPacket.criar_mkdir(path)))
+
+    # Renomeia nome_orig para nome_novo no servidor TFTP2 (MOVE), ou remove nome_orig
+        # se nome_novo não for informado. Retorna True se o servidor confirmar.
+    def move(self, nome_orig, nome_novo=None):
+        return self._confirmado(self._pedido(TFTP2_ProtoPacket.criar_move(nome_orig, nome_novo)))
+
+    # Envia um pedido (LIST, MKDIR ou MOVE) ao servidor e espera a resposta, repetindo o
+        # pedido a cada timeout, até 3 vezes. Retorna a mensagem recebida ou None.
+    # Só é aceita uma resposta que venha do servidor e seja do tipo esperado para o pedido
+        # (LIST_RESP para LIST, ACK 0 para MKDIR e MOVE, ou ERROR); as demais são descartadas
+        # sem reiniciar a espera. Respostas atrasadas de pedidos anteriores, que ficaram no
+        # socket, são descartadas antes do envio.
+    def _pedido(self, msg):
+        data = TFTP2_ProtoPacket.to_bytes(msg)
+        servidor = (socket.gethostbyname(self.server_ip), self.server_port)
+        esperado = "LIST_RESP" if TFTP2_ProtoPacket.tipo(msg) == "LIST" else "ACK"
+        while select.select([self.sock], [], [], 0)[0]:
+            self.sock.recvfrom(65535)
+        for _ in range(3):
+            self.sock.sendto(data, servidor)
+            limite = time.monotonic() + self.timeout
+            while True:
+                espera = limite - time.monotonic()
+                if espera <= 0 or not select.select([self.sock], [], [], espera)[0]:
+                    break
+                resposta, addr = self.sock.recvfrom(65535)
+                if addr != servidor:
+                    continue
+                try:
+                    resposta = TFTP2_ProtoPacket.from_bytes(resposta)
+                except Exception:
+                    continue
+                tipo = TFTP2_ProtoPacket.tipo(resposta)
+                if tipo == "ERROR" or (tipo == esperado and (tipo != "ACK" or resposta.ack.block_n == 0)):
+                    return resposta
+        print("Cliente: Servidor não respondeu.")
+        return None
+
+    # Verifica se a resposta a um MKDIR ou MOVE é a confirmação (ACK do bloco 0).
+    @staticmethod
+    def _confirmado(resposta):
+        if resposta is None:
+            return False
+        if TFTP2_ProtoPacket.tipo(resposta) == "ERROR":
+            print(f"Cliente: Erro recebido: {resposta.error.errorcode}")
+            return False
+        return TFTP2_ProtoPacket.tipo(resposta) == "ACK" and resposta.ack.block_n == 0
 
     # Fecha o socket UDP usado pelo cliente TFTP.
     # Libera os recursos do sistema associados ao socket.
@@ -41,11 +41,53 @@ class TFTP2_ProtoPacket:
         return msg
 
      # Cria um pacote de erro (ERROR), usado para notificar falhas durante a transferência.
+    # A mensagem Error do tftp2.proto só tem o código do erro: error_msg é mantido por
+        # compatibilidade, mas não é transmitido.
     @staticmethod
-    def criar_error(error_code, error_msg):
+    def criar_error(error_code, error_msg=None):
         msg = Mensagem()# type: ignore
         msg.error.errorcode = error_code    # Código do erro (enum definido no .proto)
-        msg.error.errormsg = error_msg  # Mensagem de texto explicando o erro
+        return msg
+
+    # Cria um pacote LIST, que pede a listagem do diretório path no servidor.
+    @staticmethod
+    def criar_list(path):
+        msg = Mensagem()# type: ignore
+        msg.list.path = path
+        return msg
+
+    # Cria a resposta de um LIST (ListResponse) a partir de uma lista de entradas.
+    # Cada entrada é um par (nome, tamanho) para arquivos, ou (nome, None) para diretórios.
+    @staticmethod
+    def criar_list_resp(entradas):
+        msg = Mensagem()# type: ignore
+        itens = msg.list_resp.items
+        for nome, tamanho in entradas:
+            item = itens.add()
+            if tamanho is None:
+                item.dir.path = nome
+            else:
+                item.file.nome = nome
+                item.file.tamanho = tamanho
+        # Garante que o campo list_resp fique definido mesmo com o diretório vazio
+        msg.list_resp.SetInParent()
+        return msg
+
+    # Cria um pacote MKDIR, que pede a criação do diretório path no servidor.
+    @staticmethod
+    def criar_mkdir(path):
+        msg = Mensagem()# type: ignore
+        msg.mkdir.path = path
+        return msg
+
+    # Cria um pacote MOVE, que renomeia nome_orig para nome_novo no servidor.
+    # Sem nome_novo, o pedido remove nome_orig.
+    @staticmethod
+    def criar_move(nome_orig, nome_novo=None):
+        msg = Mensagem()# type: ignore
+        msg.move.nome_orig = nome_orig
+        if nome_novo is not None:
+            msg.move.nome_novo = nome_novo
         return msg
 
     # Converte uma mensagem protobuf para bytes, para enviar pelo socket.
@@ -60,18 +102,21 @@ class TFTP2_ProtoPacket:
         msg.ParseFromString(data)   # Faz parsing dos bytes recebidos e popula campos da mensagem
         return msg
 
-    # Descobre qual é o tipo do pacote recebido (RRQ, WRQ, DATA, ACK ou ERROR) conforme definido no arquivo tftp2.proto.
+    # Descobre qual é o tipo do pacote recebido (RRQ, WRQ, DATA, ACK, ERROR, LIST, LIST_RESP,
+        # MKDIR ou MOVE) conforme definido no arquivo tftp2.proto.
     @staticmethod
     def tipo(msg):
-        if msg.HasField('rrq'):
-            return 'RRQ'
-        elif msg.HasField('wrq'):
-            return 'WRQ'
-        elif msg.HasField('data'):
-            return 'DATA'
-        elif msg.HasField('ack'):
-            return 'ACK'
-        elif msg.HasField('error'):
-            return 'ERROR'
-        else:
-            return 'UNKNOWN'
\ No newline at end of file
+        return _TIPOS.get(msg.WhichOneof('msg'), 'UNKNOWN')
+
+# Nome do tipo de pacote para cada campo do oneof msg da Mensagem.
+_TIPOS = {
+    'rrq': 'RRQ',
+    'wrq': 'WRQ',
+    'data': 'DATA',
+    'ack': 'ACK',
+    'error': 'ERROR',
+    'list': 'LIST',
+    'list_resp': 'LIST_RESP',
+    'mkdir': 'MKDIR',
+    'move': 'MOVE',
+}
\ No newline at end of file
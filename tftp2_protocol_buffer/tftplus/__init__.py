@@ -1,5 +1,8 @@
 # faz a importação dos módulos necessários para rodar o programa TFTP.
 from .TFTPlus_Client import *
 from .TFTPlus_ProtoPacket import *
+from .TFTPlus_Buffer import *
+from .TFTPlus_Rto import *
 from .TFTPlus_FsmRx import *
-from .TFTPlus_FsmTx import *
\ No newline at end of file
+from .TFTPlus_FsmTx import *
+from .TFTPlus_Server import *
\ No newline at end of file